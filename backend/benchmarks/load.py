@@ -0,0 +1,391 @@
+"""负载测试：大量虚拟用户同时开始练习时服务的表现
+
+在本机启动uvicorn（可指定worker数），数据源使用模拟行情（DATA_PROVIDER=synthetic），
+Redis使用 redis_stub.py 的内存替身；然后按场景并发请求，报告吞吐量、p50/p95/p99延迟、
+错误率，以及服务端（/api/health中的loop_lag）和压测端自身的事件循环延迟：
+
+    cd backend
+    python benchmarks/load.py --workers 4 --users 500 --duration 30
+    python benchmarks/load.py --scenario hot search --output load.json
+    python benchmarks/load.py --url http://127.0.0.1:8000   # 压测已启动的服务
+
+场景：
+- hot: 所有用户同时请求少数热门股票的同一个分界日期
+- cold: 每次请求随机的冷门股票，需要生成并计算完整序列
+- sweep: 同一股票不同的分界日期，序列缓存命中而响应缓存未命中
+- search: 逐字输入代码、拼音首字母或名称时的搜索请求
+- mixed: 以上场景按 MIXED_WEIGHTS 混合
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from symbols import POPULAR_STOCKS, pinyin_initials  # noqa: E402
+
+SCENARIOS = ('hot', 'cold', 'sweep', 'search', 'mixed')
+MIXED_WEIGHTS = {'hot': 0.4, 'sweep': 0.3, 'search': 0.2, 'cold': 0.1}
+
+HOT_SYMBOLS = ['600519', '000001', '300750', '601318', '000858']
+HOT_DIVIDING_DATE = '2024-06-03'
+SWEEP_SYMBOL = '600519'
+
+# 冷门股票的代码范围
+COLD_RANGES = [(1, 3999), (300001, 301999), (600000, 605999)]
+
+# 服务端事件循环延迟的采样间隔（秒）
+HEALTH_PROBE_INTERVAL = 0.5
+
+
+class HttpConnection:
+    """最小的HTTP/1.1长连接客户端，只读取状态码和响应体"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def get(self, path: str) -> Tuple[int, bytes]:
+        reused = self.writer is not None
+        try:
+            return await self._get(path)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if not reused:
+                raise
+            # 服务端关闭了空闲的长连接，重新连接一次
+            return await self._get(path)
+
+    async def _get(self, path: str) -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode('latin-1'))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("连接已关闭")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            body = b''.join(chunks)
+        else:
+            body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection') == 'close':
+            self.close()
+        return status, body
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def random_business_day(rng: random.Random, start: date, end: date) -> str:
+    day = start + timedelta(days=rng.randrange((end - start).days))
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.isoformat()
+
+
+def stock_path(symbol: str, dividing_date: str, historical_days: int = 180, future_days: int = 90) -> str:
+    return (f"/api/stock/{symbol}?dividing_date={dividing_date}"
+            f"&historical_days={historical_days}&future_days={future_days}")
+
+
+def session_requests(scenario: str, rng: random.Random) -> List[Tuple[str, str]]:
+    """一次练习会话的请求序列，元素为(请求类型, 路径)"""
+    if scenario == 'mixed':
+        scenario = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+
+    if scenario == 'hot':
+        return [('stock', stock_path(rng.choice(HOT_SYMBOLS), HOT_DIVIDING_DATE))]
+
+    if scenario == 'cold':
+        lo, hi = rng.choice(COLD_RANGES)
+        symbol = f"{rng.randint(lo, hi):06d}"
+        return [('stock', stock_path(symbol, random_business_day(rng, date(2010, 1, 1), date(2024, 12, 31))))]
+
+    if scenario == 'sweep':
+        return [('stock', stock_path(SWEEP_SYMBOL, random_business_day(rng, date(2008, 1, 1), date(2024, 12, 31))))]
+
+    if scenario == 'search':
+        symbol, name = rng.choice(POPULAR_STOCKS)
+        text = rng.choice([symbol, pinyin_initials(name), name])
+        return [('search', f"/api/stock/search?query={quote(text[:i])}") for i in range(1, len(text) + 1)]
+
+    raise ValueError(f"未知场景: {scenario}")
+
+
+class LoadRun:
+    """一个场景的压测记录"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.server_lag: List[float] = []
+        self.client_lag: List[float] = []
+
+    async def user(self, host: str, port: int, scenario: str, rng: random.Random,
+                   deadline: float, think: float, timeout: float) -> None:
+        """一个虚拟用户：在截止时间前连续进行练习会话"""
+        connection = HttpConnection(host, port)
+        try:
+            while time.monotonic() < deadline:
+                for kind, path in session_requests(scenario, rng):
+                    start = time.perf_counter()
+                    try:
+                        status, _ = await asyncio.wait_for(connection.get(path), timeout)
+                        if status != 200:
+                            self.errors[f"HTTP {status}"] += 1
+                    except Exception as e:
+                        # 超时或连接错误后丢弃该连接，下一次请求重新连接
+                        self.errors[type(e).__name__] += 1
+                        connection.close()
+                    self.latencies[kind].append(time.perf_counter() - start)
+                    if think:
+                        await asyncio.sleep(think)
+        finally:
+            connection.close()
+
+    async def probe_server(self, host: str, port: int) -> None:
+        """定期读取服务端的事件循环延迟"""
+        connection = HttpConnection(host, port)
+        try:
+            while True:
+                await asyncio.sleep(HEALTH_PROBE_INTERVAL)
+                try:
+                    _, body = await connection.get('/api/health')
+                    self.server_lag.append(json.loads(body).get('loop_lag', {}).get('recent_max_ms', 0.0))
+                except Exception:
+                    connection.close()
+        finally:
+            connection.close()
+
+    async def monitor_client(self, interval: float = 0.05) -> None:
+        """压测端自身的事件循环延迟，过大说明瓶颈在压测端"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.client_lag.append((loop.time() - start - interval) * 1000)
+
+    def report(self, elapsed: float) -> dict:
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        requests = len(all_latencies)
+        errors = sum(self.errors.values())
+        return {
+            'requests': requests,
+            'duration_s': round(elapsed, 3),
+            'throughput_rps': round(requests / elapsed, 1) if elapsed else 0.0,
+            'errors': errors,
+            'error_rate': round(errors / requests, 4) if requests else 0.0,
+            'error_types': dict(self.errors),
+            'latency_ms': latency_summary(all_latencies),
+            'by_kind': {kind: latency_summary(values) for kind, values in self.latencies.items()},
+            'server_loop_lag_ms': lag_summary(self.server_lag),
+            'client_loop_lag_ms': lag_summary(self.client_lag),
+        }
+
+
+def latency_summary(latencies: List[float]) -> dict:
+    if not latencies:
+        return {}
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'count': len(values),
+        'mean': round(float(values.mean()), 3),
+        'p50': round(float(p50), 3),
+        'p95': round(float(p95), 3),
+        'p99': round(float(p99), 3),
+        'max': round(float(values.max()), 3),
+    }
+
+
+def lag_summary(samples: List[float]) -> dict:
+    if not samples:
+        return {}
+    values = np.asarray(samples)
+    return {'p99': round(float(np.percentile(values, 99)), 3), 'max': round(float(values.max()), 3)}
+
+
+async def run_scenario(host: str, port: int, scenario: str, users: int, duration: float,
+                       ramp: float, think: float, timeout: float, seed: int) -> dict:
+    run = LoadRun()
+    background = [asyncio.create_task(run.probe_server(host, port)),
+                  asyncio.create_task(run.monitor_client())]
+
+    async def start_user(i: int, deadline: float):
+        if ramp:
+            await asyncio.sleep(ramp * i / users)
+        await run.user(host, port, scenario, random.Random(seed * 100003 + i), deadline, think, timeout)
+
+    start = time.monotonic()
+    deadline = start + ramp + duration
+    await asyncio.gather(*(start_user(i, deadline) for i in range(users)))
+    elapsed = time.monotonic() - start
+
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    return run.report(elapsed)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"端口{port}未在{timeout}秒内开始监听")
+
+
+async def wait_until_ready(host: str, port: int, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = HttpConnection(host, port)
+        try:
+            status, _ = await connection.get('/api/health')
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务未在{timeout}秒内启动")
+
+
+def start_server(workers: int, port: int, redis_port: int, data_dir: str) -> List[subprocess.Popen]:
+    """启动Redis替身和uvicorn"""
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, 'benchmarks', 'redis_stub.py'), '--port', str(redis_port)]
+    )
+    wait_for_port(redis_port)
+    env = dict(
+        os.environ,
+        DATA_PROVIDER='synthetic',
+        SERIES_STORE_DIR=os.path.join(data_dir, 'series'),
+        SYMBOL_SNAPSHOT_PATH=os.path.join(data_dir, 'symbols.json'),
+        REDIS_HOST='127.0.0.1',
+        REDIS_PORT=str(redis_port),
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+        cwd=BACKEND_DIR, env=env,
+    )
+    return [server, stub]
+
+
+def print_report(name: str, result: dict) -> None:
+    latency = result['latency_ms']
+    print(f"[{name}] {result['requests']} 请求, {result['throughput_rps']} req/s, "
+          f"错误率 {result['error_rate']:.2%}", file=sys.stderr)
+    if latency:
+        print(f"    延迟 p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms  "
+              f"max {latency['max']}ms", file=sys.stderr)
+    print(f"    服务端事件循环延迟 {result['server_loop_lag_ms']}  压测端 {result['client_loop_lag_ms']}",
+          file=sys.stderr)
+    if result['error_types']:
+        print(f"    错误 {result['error_types']}", file=sys.stderr)
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='股票练习服务负载测试')
+    parser.add_argument('--scenario', nargs='+', choices=SCENARIOS, default=list(SCENARIOS),
+                        help='依次运行的场景')
+    parser.add_argument('--users', type=int, default=500, help='并发虚拟用户数')
+    parser.add_argument('--duration', type=float, default=30.0, help='每个场景的持续秒数')
+    parser.add_argument('--ramp', type=float, default=0.0, help='用户逐步加入的秒数，0表示同时开始')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='每次请求后的等待毫秒数')
+    parser.add_argument('--timeout', type=float, default=30.0, help='单个请求的超时秒数，超时计为错误')
+    parser.add_argument('--workers', type=int, default=4, help='uvicorn worker数')
+    parser.add_argument('--url', help='压测已启动的服务，不再启动本地服务')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='结果JSON的写入路径')
+    args = parser.parse_args(argv)
+
+    processes = []
+    data_dir = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        data_dir = tempfile.mkdtemp(prefix='stockstudy-load-')
+        processes = start_server(args.workers, port, free_port(), data_dir)
+
+    try:
+        asyncio.run(wait_until_ready(host, port))
+        results = {}
+        for scenario in args.scenario:
+            results[scenario] = asyncio.run(run_scenario(
+                host, port, scenario, args.users, args.duration, args.ramp, args.think_ms / 1000, args.timeout, args.seed
+            ))
+            print_report(scenario, results[scenario])
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    report = {
+        'config': {
+            'users': args.users, 'duration_s': args.duration, 'ramp_s': args.ramp,
+            'think_ms': args.think_ms, 'timeout_s': args.timeout, 'workers': None if args.url else args.workers,
+            'url': args.url, 'seed': args.seed, 'cpu_count': os.cpu_count(),
+        },
+        'scenarios': results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
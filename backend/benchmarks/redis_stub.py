@@ -0,0 +1,96 @@
+"""压测用的本地Redis替身
+
+只实现缓存用到的命令（GET、MGET、SET、SETEX、DEL、PING），数据保存在内存中，
+其他命令一律回复OK。用于没有Redis的机器上运行负载测试：
+
+    python benchmarks/redis_stub.py --port 6390
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class RedisStub:
+    """RESP2协议的内存键值服务"""
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, float]] = {}
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at and time.monotonic() >= expires_at:
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: List[bytes]) -> bytes:
+        command = args[0].upper()
+        if command == b'GET':
+            return _bulk(self._get(args[1]))
+        if command == b'MGET':
+            values = [_bulk(self._get(key)) for key in args[1:]]
+            return b'*%d\r\n' % len(values) + b''.join(values)
+        if command == b'SETEX':
+            self.data[args[1]] = (args[3], time.monotonic() + int(args[2]))
+            return b'+OK\r\n'
+        if command == b'SET':
+            self.data[args[1]] = (args[2], 0.0)
+            return b'+OK\r\n'
+        if command == b'DEL':
+            removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+            return b':%d\r\n' % removed
+        if command == b'PING':
+            return b'+PONG\r\n'
+        return b'+OK\r\n'
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                writer.write(self.execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        # 内联命令
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+async def serve(host: str, port: int) -> None:
+    stub = RedisStub()
+    server = await asyncio.start_server(stub.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='压测用的本地Redis替身')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
@@ -0,0 +1,320 @@
+"""股票数据接口基准测试
+
+离线运行：使用模拟行情（DATA_PROVIDER=synthetic）代替AKShare，用内存字典代替Redis，
+分阶段计时 /api/stock/{symbol} 的请求路径，并通过ASGI直接调用应用测量端到端耗时。
+
+结果以JSON输出，可与保存的基准结果比较，变慢超过阈值的项记为回退：
+
+    cd backend
+    python benchmarks/run.py --output result.json --compare benchmarks/baseline.json
+    python benchmarks/run.py --save-baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# 必须在导入应用之前设置：离线数据源，以及独立的临时日线存储
+os.environ['DATA_PROVIDER'] = 'synthetic'
+os.environ.setdefault('SERIES_STORE_DIR', tempfile.mkdtemp(prefix='stockstudy-bench-'))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import cache  # noqa: E402
+import main  # noqa: E402
+import serializer  # noqa: E402
+
+SYMBOL = '600519'
+DIVIDING_DATE = '2024-06-03'
+
+# 窗口总天数，其中三分之一为分界日期之后的未来数据
+WINDOWS = {
+    '30d': 30,
+    '180d': 180,
+    '1y': 365,
+    '5y': 5 * 365,
+    '20y': 20 * 365,
+}
+
+# 每个样本的目标耗时，调用次数按此校准以降低计时误差
+SAMPLE_NS = 20_000_000
+
+# 最快样本超过基准结果该比例时记为回退（最快样本受机器负载干扰最小）
+DEFAULT_TOLERANCE = 0.25
+
+
+class MemoryRedisClient:
+    """代替redis.asyncio.Redis的内存实现，只支持缓存用到的MGET和流水线SETEX"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return _MemoryPipeline(self.data)
+
+    async def aclose(self):
+        pass
+
+
+class _MemoryPipeline:
+    def __init__(self, data):
+        self.data = data
+        self.pending = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def setex(self, key, expire, value):
+        self.pending.append((key, value))
+
+    async def execute(self):
+        self.data.update(self.pending)
+        self.pending = []
+
+
+def reference_workload():
+    """固定的NumPy和纯Python计算，用于按机器速度归一化比较结果"""
+    values = np.random.default_rng(0).standard_normal(20000)
+    np.sort(values)
+    return sum(x * x for x in values[:5000].tolist())
+
+
+def window_params(days: int):
+    future_days = days // 3
+    return days - future_days, future_days
+
+
+def summarize(samples_ns, number):
+    """每次调用的耗时统计（毫秒）"""
+    per_call = sorted(ns / number / 1e6 for ns in samples_ns)
+    return {
+        'median_ms': statistics.median(per_call),
+        'mean_ms': statistics.fmean(per_call),
+        'min_ms': per_call[0],
+        'p95_ms': per_call[min(len(per_call) - 1, int(len(per_call) * 0.95))],
+        'samples': len(per_call),
+        'number': number,
+    }
+
+
+def calibrate(func) -> int:
+    """每个样本的调用次数，使单个样本约20毫秒"""
+    number, elapsed = timeit.Timer(func).autorange()
+    return max(1, int(number * SAMPLE_NS / 1e9 / elapsed))
+
+
+def measure(func, repeat: int):
+    func()
+    number = calibrate(func)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        samples.append(time.perf_counter_ns() - start)
+    return summarize(samples, number)
+
+
+async def measure_async(func, repeat: int, setup=None):
+    """异步版本，setup在每次调用前执行且不计时"""
+    for _ in range(2):
+        # 第一次调用预热，第二次用于校准调用次数
+        if setup:
+            setup()
+        start = time.perf_counter_ns()
+        await func()
+    number = max(1, min(1000, SAMPLE_NS // max(time.perf_counter_ns() - start, 1)))
+    samples = []
+    for _ in range(repeat):
+        elapsed = 0
+        for _ in range(number):
+            if setup:
+                setup()
+            start = time.perf_counter_ns()
+            await func()
+            elapsed += time.perf_counter_ns() - start
+        samples.append(elapsed)
+    return summarize(samples, number)
+
+
+async def asgi_get(app, path: str, query: str) -> bytes:
+    """直接通过ASGI接口发送GET请求，返回响应体"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'bench')], 'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+    body = []
+    status = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            body.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    if status[0] != 200:
+        raise RuntimeError(f"{path}?{query} 返回 {status[0]}")
+    return b''.join(body)
+
+
+def clear_response_cache():
+    main.response_cache.l1 = cache.LocalCache(main.response_cache.l1.max_bytes)
+    main.response_cache.l2.client.data.clear()
+
+
+async def run_benchmarks(repeat: int, e2e_repeat: int) -> dict:
+    # Redis替换为内存实现，保留真实的压缩和两级缓存逻辑
+    main.redis_cache.client = MemoryRedisClient()
+
+    results = {}
+    reference_before = measure(reference_workload, repeat)
+    series = await main.get_symbol_series(SYMBOL)
+    raw = series[['date', 'open', 'high', 'low', 'close', 'volume']]
+    dividing = datetime.strptime(DIVIDING_DATE, "%Y-%m-%d")
+
+    for label, days in WINDOWS.items():
+        historical_days, future_days = window_params(days)
+        start_date, end_date = main.window_dates(dividing, historical_days, future_days)
+        window = await main.fetch_stock_data_from_akshare(SYMBOL, start_date, end_date)
+        frame = raw.loc[window.index]
+
+        results[f'filter/{label}'] = await measure_async(
+            lambda: main.fetch_stock_data_from_akshare(SYMBOL, start_date, end_date), repeat)
+        results[f'calculate_kdj/{label}'] = measure(lambda: main.calculate_kdj(frame), repeat)
+        results[f'calculate_volume_ma/{label}'] = measure(lambda: main.calculate_volume_ma(frame), repeat)
+        results[f'format_encode/rows/{label}'] = measure(
+            lambda: serializer.encode(serializer.format_data(window)), repeat)
+        results[f'format_encode/columnar/{label}'] = measure(
+            lambda: serializer.encode(serializer.format_columnar(window)), repeat)
+
+        payload = serializer.encode(serializer.format_data(window))
+        tiered = main.response_cache
+        key = f'bench:{label}'
+
+        async def loader():
+            return payload
+
+        await tiered.set(key, payload)
+        results[f'cache_set/{label}'] = await measure_async(lambda: tiered.set(key, payload), repeat)
+        results[f'cache_get_l1/{label}'] = await measure_async(lambda: tiered.get(key, loader), repeat)
+        results[f'cache_get_l2/{label}'] = await measure_async(
+            lambda: tiered.get(key, loader), repeat, setup=lambda: tiered.l1.pop(key))
+
+        path = f'/api/stock/{SYMBOL}'
+        query = f'dividing_date={DIVIDING_DATE}&historical_days={historical_days}&future_days={future_days}'
+        results[f'e2e_miss/{label}'] = await measure_async(
+            lambda: asgi_get(main.app, path, query), e2e_repeat, setup=clear_response_cache)
+        results[f'e2e_hit/{label}'] = await measure_async(
+            lambda: asgi_get(main.app, path, query), e2e_repeat)
+        results[f'e2e_miss/{label}']['bars'] = len(window)
+        results[f'e2e_miss/{label}']['bytes'] = len(payload)
+
+    # 运行前后各测一次参照负载，取较快的一次
+    reference_after = measure(reference_workload, repeat)
+    results['reference'] = min(reference_before, reference_after, key=lambda r: r['min_ms'])
+    return results
+
+
+def merge_rounds(rounds) -> dict:
+    """多轮结果按项保留最快的一轮，分散在不同时间的样本可减少机器负载波动的影响"""
+    merged = {}
+    for results in rounds:
+        for name, result in results.items():
+            if name not in merged or result['min_ms'] < merged[name]['min_ms']:
+                merged[name] = result
+    return merged
+
+
+def environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """与基准结果比较最快样本（按参照负载的耗时归一化），返回(报告行, 回退项列表)"""
+    scale = 1.0
+    if 'reference' in results and 'reference' in baseline:
+        scale = baseline['reference']['min_ms'] / results['reference']['min_ms']
+    lines = [f"{'benchmark':<36}{'baseline':>12}{'current':>12}{'ratio':>8}"]
+    regressions = []
+    for name, current in results.items():
+        if name == 'reference':
+            continue
+        base = baseline.get(name)
+        if base is None:
+            lines.append(f"{name:<36}{'-':>12}{current['min_ms']:>12.4f}{'new':>8}")
+            continue
+        ratio = current['min_ms'] * scale / base['min_ms'] if base['min_ms'] else float('inf')
+        flag = ' REGRESSION' if ratio > 1 + tolerance else ''
+        if flag:
+            regressions.append(name)
+        lines.append(f"{name:<36}{base['min_ms']:>12.4f}{current['min_ms']:>12.4f}{ratio:>8.2f}{flag}")
+    return lines, regressions
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=7, help='每轮各阶段的样本数')
+    parser.add_argument('--e2e-repeat', type=int, default=7, help='每轮端到端请求的样本数')
+    parser.add_argument('--rounds', type=int, default=3, help='完整运行的轮数')
+    parser.add_argument('--output', help='结果JSON的写入路径，默认输出到标准输出')
+    parser.add_argument('--compare', help='与该基准结果JSON比较')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='允许的最快样本变慢比例')
+    parser.add_argument('--save-baseline', help='将本次结果保存为基准')
+    args = parser.parse_args(argv)
+
+    results = merge_rounds(
+        asyncio.run(run_benchmarks(args.repeat, args.e2e_repeat)) for _ in range(args.rounds)
+    )
+    report = {'environment': environment(), 'results': results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+    if not args.output and not args.save_baseline:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print('\n'.join(lines), file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)}项回退超过{args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,353 @@
+"""响应缓存
+
+RedisCache: 使用redis.asyncio和显式连接池，读写不阻塞事件循环；支持流水线批量读写，
+较大的值使用zstd压缩后以字节存储。Redis不可用时短暂跳过缓存，并通过计数器暴露命中、
+未命中和错误次数。
+
+TieredCache: 进程内L1缓存在前、Redis作为L2的两级缓存。条目过期采用软过期：
+超过有效期但仍在宽限期内的条目立即返回，同时由一个后台任务重新生成。
+"""
+import asyncio
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import redis.asyncio as aioredis
+import zstandard
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 值的首字节标记存储格式，其他首字节视为旧版未压缩的JSON文本
+RAW_TAG = b'r'
+ZSTD_TAG = b'z'
+
+
+class RedisCache:
+    """带压缩和错误计数的异步Redis缓存"""
+
+    def __init__(self, host: str, port: int, db: int = 0,
+                 max_connections: int = 50, timeout: float = 0.5,
+                 compress_min_bytes: int = 1024, retry_interval: float = 5.0):
+        self.pool = aioredis.ConnectionPool(
+            host=host, port=port, db=db,
+            max_connections=max_connections,
+            socket_timeout=timeout,
+            socket_connect_timeout=timeout,
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+        # 同时进行的操作数不超过连接池上限，连接用尽时排队等待而不是报错
+        self._slots = asyncio.Semaphore(max_connections)
+        self.compress_min_bytes = compress_min_bytes
+        self.retry_interval = retry_interval
+        self._compressor = zstandard.ZstdCompressor(level=3)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._down_until = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def encode(self, payload: bytes) -> bytes:
+        if len(payload) >= self.compress_min_bytes:
+            return ZSTD_TAG + self._compressor.compress(payload)
+        return RAW_TAG + payload
+
+    def decode(self, value: bytes) -> bytes:
+        tag, body = value[:1], value[1:]
+        if tag == ZSTD_TAG:
+            return self._decompressor.decompress(body)
+        if tag == RAW_TAG:
+            return body
+        return value
+
+    def _available(self) -> bool:
+        if time.monotonic() < self._down_until:
+            self.skipped += 1
+            return False
+        return True
+
+    def _failed(self, error: Exception) -> None:
+        # Redis出错后暂停访问一段时间，避免每个请求都等待超时
+        self.errors += 1
+        self._down_until = time.monotonic() + self.retry_interval
+        logger.warning("Redis缓存访问失败: %s", error)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """MGET批量读取，不可用时全部视为未命中"""
+        if not keys or not self._available():
+            return [None] * len(keys)
+        start = time.perf_counter()
+        try:
+            async with self._slots:
+                values = await self.client.mget(keys)
+        except Exception as e:
+            self._failed(e)
+            return [None] * len(keys)
+        finally:
+            metrics.observe_stage('cache_get', time.perf_counter() - start)
+
+        results = []
+        for value in values:
+            if value is None:
+                self.misses += 1
+                results.append(None)
+            else:
+                self.hits += 1
+                results.append(self.decode(value))
+        return results
+
+    async def set(self, key: str, payload: bytes, expire: int) -> None:
+        await self.set_many({key: payload}, expire)
+
+    async def set_many(self, items: Dict[str, bytes], expire: int) -> None:
+        """流水线批量写入"""
+        if not items or not self._available():
+            return
+        start = time.perf_counter()
+        try:
+            async with self._slots, self.client.pipeline(transaction=False) as pipe:
+                for key, payload in items.items():
+                    pipe.setex(key, expire, self.encode(payload))
+                await pipe.execute()
+        except Exception as e:
+            self._failed(e)
+        finally:
+            metrics.observe_stage('cache_set', time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'available': time.monotonic() >= self._down_until,
+        }
+
+    async def close(self) -> None:
+        await self.client.aclose()
+        await self.pool.disconnect()
+
+
+class LocalCache:
+    """按字节数限制大小的进程内LRU缓存，值为(响应体, 有效期截止, 宽限期截止)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, float, float]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float, float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() >= entry[2]:
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, payload: bytes, fresh_until: float, stale_until: float) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        self.pop(key)
+        self._entries[key] = (payload, fresh_until, stale_until)
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            self.pop(next(iter(self._entries)))
+
+    def pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+# L2中的值以8字节的有效期截止时间戳开头，各进程据此判断软过期
+_FRESH_HEADER = struct.Struct('>d')
+
+
+class TieredCache:
+    """L1进程内 + L2 Redis 两级缓存，支持过期后先返回旧值再后台刷新"""
+
+    def __init__(self, l2: RedisCache, l1_max_bytes: int, ttl: int, stale_ttl: int):
+        self.l1 = LocalCache(l1_max_bytes)
+        self.l2 = l2
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        """依次查找L1、L2，都未命中时调用loader生成并写入两级缓存"""
+        entry = self.l1.get(key)
+        if entry is not None:
+            self.l1_hits += 1
+            metrics.note_cache('l1')
+            return self._serve(key, entry, loader)
+
+        entry = await self._get_l2(key)
+        if entry is not None:
+            self.l2_hits += 1
+            metrics.note_cache('l2')
+            self.l1.set(key, *entry)
+            return self._serve(key, entry, loader)
+
+        self.misses += 1
+        metrics.note_cache('miss')
+        return await self._load(key, loader)
+
+    async def get_many(self, loaders: Dict[str, Callable[[], Awaitable[bytes]]]) -> Dict[str, Optional[bytes]]:
+        """批量查找：L1未命中的键用一次MGET查L2，未命中的键返回None由调用方生成后set_many"""
+        results: Dict[str, Optional[bytes]] = {}
+        l1_misses = []
+        for key, loader in loaders.items():
+            entry = self.l1.get(key)
+            if entry is None:
+                l1_misses.append(key)
+            else:
+                self.l1_hits += 1
+                metrics.note_cache('l1')
+                results[key] = self._serve(key, entry, loader)
+
+        values = await self.l2.get_many(l1_misses)
+        for key, value in zip(l1_misses, values):
+            entry = self._parse_l2(value) if value is not None else None
+            if entry is None:
+                self.misses += 1
+                metrics.note_cache('miss')
+                results[key] = None
+            else:
+                self.l2_hits += 1
+                metrics.note_cache('l2')
+                self.l1.set(key, *entry)
+                results[key] = self._serve(key, entry, loaders[key])
+        return results
+
+    def _serve(self, key: str, entry: Tuple[bytes, float, float], loader) -> bytes:
+        payload, fresh_until, _ = entry
+        if time.time() >= fresh_until:
+            # 软过期：直接返回旧值，同一个键只启动一个后台刷新任务
+            self.stale_hits += 1
+            metrics.note_cache('stale')
+            if key not in self._refreshing:
+                self._refreshing[key] = asyncio.create_task(self._refresh(key, loader))
+        return payload
+
+    async def _load(self, key: str, loader) -> bytes:
+        """同一个键的并发未命中共享一次loader调用"""
+        future = self._loading.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load_and_store(key, loader))
+            self._loading[key] = future
+            future.add_done_callback(lambda f: self._finish_load(key, f))
+        return await asyncio.shield(future)
+
+    def _finish_load(self, key: str, future: asyncio.Future) -> None:
+        if self._loading.get(key) is future:
+            del self._loading[key]
+        if not future.cancelled():
+            future.exception()
+
+    async def _load_and_store(self, key: str, loader) -> bytes:
+        payload = await loader()
+        await self.set(key, payload)
+        return payload
+
+    async def _refresh(self, key: str, loader) -> None:
+        try:
+            # 其他进程可能已经刷新过L2
+            entry = await self._get_l2(key)
+            if entry is not None and time.time() < entry[1]:
+                self.l1.set(key, *entry)
+                return
+            self.refreshes += 1
+            await self._load_and_store(key, loader)
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.warning("后台刷新缓存失败 %s: %s", key, e)
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def _get_l2(self, key: str) -> Optional[Tuple[bytes, float, float]]:
+        value = await self.l2.get(key)
+        if value is None:
+            return None
+        return self._parse_l2(value)
+
+    def _parse_l2(self, value: bytes) -> Tuple[bytes, float, float]:
+        if value[:1] in (b'{', b'['):
+            # 旧版未带有效期头的值，视为已过期
+            return value, 0.0, time.time() + self.stale_ttl
+        (fresh_until,) = _FRESH_HEADER.unpack_from(value)
+        return value[_FRESH_HEADER.size:], fresh_until, fresh_until + self.stale_ttl
+
+    async def set(self, key: str, payload: bytes, ttl: Optional[int] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        fresh_until = time.time() + ttl
+        self.l1.set(key, payload, fresh_until, fresh_until + self.stale_ttl)
+        await self.l2.set(key, _FRESH_HEADER.pack(fresh_until) + payload, ttl + self.stale_ttl)
+
+    async def set_many(self, items: Dict[str, bytes]) -> None:
+        """批量写入两级缓存，L2使用流水线"""
+        fresh_until = time.time() + self.ttl
+        for key, payload in items.items():
+            self.l1.set(key, payload, fresh_until, fresh_until + self.stale_ttl)
+        header = _FRESH_HEADER.pack(fresh_until)
+        await self.l2.set_many({key: header + payload for key, payload in items.items()},
+                               self.ttl + self.stale_ttl)
+
+    def stats(self) -> dict:
+        return {
+            'l1_hits': self.l1_hits,
+            'l2_hits': self.l2_hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors,
+            'l1_entries': len(self.l1),
+            'l1_bytes': self.l1.size_bytes,
+            'redis': self.l2.stats(),
+        }
+
+
+def from_env() -> RedisCache:
+    """根据环境变量创建缓存客户端"""
+    return RedisCache(
+        host=os.getenv('REDIS_HOST', 'localhost'),
+        port=int(os.getenv('REDIS_PORT', '6379')),
+        max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', '50')),
+        timeout=float(os.getenv('REDIS_TIMEOUT', '0.5')),
+        compress_min_bytes=int(os.getenv('REDIS_COMPRESS_MIN_BYTES', '1024')),
+    )
+
+
+def tiered_from_env(l2: RedisCache) -> TieredCache:
+    """根据环境变量创建两级缓存"""
+    return TieredCache(
+        l2,
+        l1_max_bytes=int(os.getenv('L1_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+        ttl=int(os.getenv('CACHE_EXPIRE', '3600')),
+        stale_ttl=int(os.getenv('CACHE_STALE_TTL', '1800')),
+    )
@@ -0,0 +1,185 @@
+"""上游行情获取与本地存储同步"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import lazy_imports
+import metrics
+import series_store
+import synthetic
+
+ak = lazy_imports.module('akshare')
+pd = lazy_imports.module('pandas')
+
+logger = logging.getLogger(__name__)
+
+# 数据源：akshare（默认）或 synthetic（离线模拟行情，用于无网络环境和基准测试）
+DATA_PROVIDER = os.getenv('DATA_PROVIDER', 'akshare')
+
+# 本地数据距离上次同步超过该秒数时，才向上游请求增量
+SERIES_REFRESH_INTERVAL = int(os.getenv('SERIES_REFRESH_INTERVAL', '1800'))
+
+# 交互请求触发的同步失败后，该秒数内不再请求上游，使用本地已存储的日线
+SERIES_RETRY_INTERVAL = int(os.getenv('SERIES_RETRY_INTERVAL', '300'))
+
+# 上游下载线程池大小，AKShare调用是同步阻塞的，不能直接在事件循环中执行
+UPSTREAM_WORKERS = int(os.getenv('UPSTREAM_WORKERS', '4'))
+
+_upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix='upstream')
+
+# 正在进行中的同步任务，同一股票的并发请求共享同一个任务
+_inflight_syncs: Dict[str, asyncio.Future] = {}
+
+# AKShare列名到接口列名的映射
+AKSHARE_COLUMNS = {
+    '日期': 'date',
+    '开盘': 'open',
+    '最高': 'high',
+    '最低': 'low',
+    '收盘': 'close',
+    '成交量': 'volume'
+}
+
+
+# 上游下载在线程池中执行，更新指标时加锁
+_metrics_lock = threading.Lock()
+
+# 上游调用限速器（提供acquire方法），批量预加载时设置为跨进程共享的全局限速
+_upstream_limiter = None
+
+
+def set_upstream_limiter(limiter) -> None:
+    global _upstream_limiter
+    _upstream_limiter = limiter
+
+
+def download_daily_history(symbol: str, start_date: Optional[str] = None) -> pd.DataFrame:
+    """从当前数据源下载前复权日线，start_date为YYYYMMDD，为空时下载全部历史"""
+    if _upstream_limiter is not None:
+        _upstream_limiter.acquire()
+    start = time.perf_counter()
+    failed = False
+    try:
+        return _download_daily_history(symbol, start_date)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        with _metrics_lock:
+            metrics.UPSTREAM_CALLS.only.inc()
+            if failed:
+                metrics.UPSTREAM_FAILURES.only.inc()
+            metrics.STAGE_LATENCY['upstream'].observe(time.perf_counter() - start)
+
+
+def _download_daily_history(symbol: str, start_date: Optional[str]) -> pd.DataFrame:
+    if DATA_PROVIDER == 'synthetic':
+        return synthetic.generate_history(symbol, start_date)
+
+    params = {'symbol': symbol, 'period': 'daily', 'adjust': 'qfq'}
+    if start_date:
+        params['start_date'] = start_date
+    stock_data = ak.stock_zh_a_hist(**params)
+
+    if stock_data is None or stock_data.empty:
+        return pd.DataFrame(columns=['date'] + series_store.BAR_FIELDS)
+
+    stock_data = stock_data.rename(columns=AKSHARE_COLUMNS)
+    stock_data['date'] = pd.to_datetime(stock_data['date'])
+    return stock_data[['date'] + series_store.BAR_FIELDS].sort_values('date')
+
+
+def sync_symbol_history(symbol: str) -> None:
+    """将本地存储同步到最新交易日，只下载最后存储日期之后的日线"""
+    bars = series_store.load_bars(symbol)
+    if series_store.is_fresh(symbol, bars, SERIES_REFRESH_INTERVAL):
+        return
+
+    last_date = series_store.last_stored_date(bars)
+    if last_date is not None and series_store.read_meta(symbol).get('provider', 'akshare') != DATA_PROVIDER:
+        # 切换数据源后不能在旧数据上追加增量
+        last_date = None
+
+    if last_date is None:
+        history = download_daily_history(symbol)
+        if history.empty:
+            return
+        series_store.write_series(symbol, history)
+    else:
+        # 从最后存储日期开始请求，用重叠的一根K线校验前复权价格是否变化
+        increment = download_daily_history(symbol, start_date=last_date.strftime("%Y%m%d"))
+        if increment.empty:
+            # 上游没有返回日线（如长期停牌），只记录检查时间
+            series_store.write_meta(symbol, checked_at=time.time(), provider=DATA_PROVIDER)
+            return
+        overlap = increment[increment['date'].dt.date == last_date]
+        if not overlap.empty and abs(float(overlap['close'].iloc[0]) - float(bars['close'][-1])) > 1e-6:
+            # 除权除息后前复权价格整体变化，需要重新下载全部历史
+            series_store.write_series(symbol, download_daily_history(symbol))
+        else:
+            series_store.append_series(symbol, increment)
+
+    series_store.write_meta(symbol, checked_at=time.time(), provider=DATA_PROVIDER)
+
+
+async def run_upstream(func, *args):
+    """在上游线程池中执行同步阻塞的调用"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_upstream_executor, func, *args)
+
+
+def needs_sync(symbol: str, bars) -> bool:
+    """本地存储是否需要向上游同步：数据不是最新，且距最近一次同步失败已超过重试间隔"""
+    if series_store.is_fresh(symbol, bars, SERIES_REFRESH_INTERVAL):
+        return False
+    return time.time() - series_store.read_meta(symbol).get('failed_at', 0) >= SERIES_RETRY_INTERVAL
+
+
+def _sync_or_record_failure(symbol: str) -> None:
+    """同步本地存储，失败时记录失败时间，重试间隔内的请求不再访问上游"""
+    # 代码格式错误时不访问上游，也不写失败记录
+    series_store.check_symbol(symbol)
+    try:
+        sync_symbol_history(symbol)
+    except Exception:
+        series_store.write_meta(symbol, failed_at=time.time())
+        raise
+
+
+async def ensure_symbol_history(symbol: str) -> None:
+    """在线程池中同步本地存储，同一股票的并发未命中只触发一次上游下载
+
+    同步失败时本地已有日线则继续使用（可能不是最新的），没有日线时抛出异常。
+    """
+    if not needs_sync(symbol, series_store.load_bars(symbol)):
+        return
+
+    future = _inflight_syncs.get(symbol)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_upstream_executor, _sync_or_record_failure, symbol)
+        _inflight_syncs[symbol] = future
+        future.add_done_callback(lambda f: _finish_sync(symbol, f))
+
+    try:
+        # shield避免单个请求取消时中断其他请求共享的下载
+        await asyncio.shield(future)
+    except Exception as e:
+        bars = series_store.load_bars(symbol)
+        if bars is None or len(bars) == 0:
+            raise
+        logger.warning("同步%s失败，使用本地已存储的日线: %s", symbol, e)
+
+
+def _finish_sync(symbol: str, future: asyncio.Future) -> None:
+    if _inflight_syncs.get(symbol) is future:
+        del _inflight_syncs[symbol]
+    if not future.cancelled():
+        # 取出异常，避免所有等待者都已取消时出现未获取异常的警告
+        future.exception()
@@ -0,0 +1,197 @@
+"""HTTP条件请求和响应压缩
+
+股票数据响应带内容哈希的ETag，请求头If-None-Match匹配时返回304；Cache-Control按窗口是否
+包含最近一个未收盘的交易日设置不同的有效期，已结束的历史窗口可以由浏览器和CDN直接复用。
+超过HTTP_COMPRESS_MIN_BYTES的响应按Accept-Encoding使用brotli（已安装时）或gzip压缩。
+
+ETag和压缩结果按响应缓存键保存在进程内，同一份响应体只计算一次哈希、每种编码只压缩一次。
+"""
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    # brotli为可选依赖，未安装时只使用gzip
+    brotli = None
+
+# 已结束的历史窗口和包含今天的窗口在浏览器/CDN中的有效期（秒）
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', '86400'))
+HTTP_CACHE_LIVE_MAX_AGE = int(os.getenv('HTTP_CACHE_LIVE_MAX_AGE', '60'))
+
+# 小于该字节数的响应不压缩，压缩节省的传输量不抵额外的开销
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv('HTTP_COMPRESS_MIN_BYTES', '1024'))
+
+# 进程内保存ETag和压缩结果的内存预算
+HTTP_VARIANT_CACHE_MAX_BYTES = int(os.getenv('HTTP_VARIANT_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def content_hash(payload: bytes) -> str:
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def etag_for(digest: str, encoding: Optional[str]) -> str:
+    """各编码的表示使用不同的强ETag"""
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def compress(payload: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(payload, quality=BROTLI_QUALITY)
+    return gzip.compress(payload, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class Variants:
+    """一份响应体的内容哈希和已压缩的各编码结果"""
+    __slots__ = ('payload', 'digest', 'encoded')
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+        self.digest = content_hash(payload)
+        self.encoded: Dict[str, bytes] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.payload) + sum(len(body) for body in self.encoded.values())
+
+
+class VariantCache:
+    """按响应缓存键保存Variants的LRU，按字节数限制大小；响应体变化时重新计算"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Variants]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str, payload: bytes) -> Variants:
+        entry = self._entries.get(key)
+        if entry is not None and entry.payload is payload:
+            self._entries.move_to_end(key)
+            return entry
+        if entry is not None and entry.payload == payload:
+            # 从L2重新读取或重新生成时内容相同但对象不同，改为引用新对象，之后的L1命中只需比较对象
+            entry.payload = payload
+            self._entries.move_to_end(key)
+            return entry
+        entry = Variants(payload)
+        self._store(key, entry)
+        return entry
+
+    def encode(self, key: str, entry: Variants, encoding: str) -> bytes:
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = entry.encoded[encoding] = compress(entry.payload, encoding)
+            if self._entries.get(key) is entry:
+                self._bytes += len(body)
+                self._evict()
+        return body
+
+    def _store(self, key: str, entry: Variants) -> None:
+        self.pop(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            self.pop(next(iter(self._entries)))
+
+    def pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+variants = VariantCache(HTTP_VARIANT_CACHE_MAX_BYTES)
+
+
+def choose_encoding(accept_encoding: Optional[str], size: int) -> Optional[str]:
+    """根据Accept-Encoding和响应大小选择编码：brotli优先，其次gzip，小响应不压缩"""
+    if not accept_encoding or size < HTTP_COMPRESS_MIN_BYTES:
+        return None
+    accepted = set()
+    refused = set()
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and _quality(params[2:]) == 0:
+            refused.add(coding.strip().lower())
+        else:
+            accepted.add(coding.strip().lower())
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        # 显式q=0拒绝的编码不能再由*选中
+        if coding in accepted or ('*' in accepted and coding not in refused):
+            return coding
+    return None
+
+
+def _quality(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return 1.0
+
+
+def matches(if_none_match: Optional[str], digest: str) -> bool:
+    """If-None-Match弱比较：忽略W/前缀和编码后缀，内容相同即匹配"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"').split('-', 1)[0] == digest:
+            return True
+    return False
+
+
+def cache_control(live: bool) -> str:
+    return f"public, max-age={HTTP_CACHE_LIVE_MAX_AGE if live else HTTP_CACHE_MAX_AGE}"
+
+
+def respond(key: str, payload: bytes, media_type: str, live: bool,
+            if_none_match: Optional[str] = None, accept_encoding: Optional[str] = None,
+            headers: Optional[Dict[str, str]] = None, cacheable: bool = True) -> Response:
+    """生成带ETag、Cache-Control的响应，条件匹配时返回304，否则按需压缩
+
+    cacheable为False（如备选的模拟数据）时不带ETag，Cache-Control为no-store，浏览器和CDN都不保存。
+    """
+    entry = variants.get(key, payload)
+    encoding = choose_encoding(accept_encoding, len(payload))
+    if cacheable:
+        response_headers = {
+            'ETag': etag_for(entry.digest, encoding),
+            'Cache-Control': cache_control(live),
+        }
+    else:
+        response_headers = {'Cache-Control': 'no-store'}
+    response_headers['Vary'] = 'Accept, Accept-Encoding'
+    response_headers.update(headers or {})
+    if cacheable and matches(if_none_match, entry.digest):
+        return Response(status_code=304, headers=response_headers)
+    if encoding is None:
+        return Response(content=payload, media_type=media_type, headers=response_headers)
+    response_headers['Content-Encoding'] = encoding
+    return Response(content=variants.encode(key, entry, encoding), media_type=media_type,
+                    headers=response_headers)
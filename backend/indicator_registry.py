@@ -0,0 +1,289 @@
+"""按请求选择的技术指标
+
+每个指标在注册表中声明输入列、参数默认值和取值范围、预热长度以及输出字段，
+请求用 ``indicators=kdj,macd(12,26,9),rsi(6,12)`` 选择，只计算和输出选中的指标。
+
+指标在完整序列上计算：输入列和中间数组（收盘价的EMA、滑动平均、涨跌幅等）存放在
+Workspace中按键复用，如ma(20)和boll(20,2)共用同一条20日均线；计算结果按(指标, 参数)
+缓存在序列的派生数据中（进程内按字节数限制的LRU，见series_cache.DerivedStore），
+参数组合再多占用的内存也有上限，序列刷新后不再使用。预热长度之内的值不可靠，输出为缺失。
+
+输出字段：
+- 分组指标（kdj、macd、boll）逐K线格式为 {"macd": {"dif": .., "dea": .., "hist": ..}}，
+  按列格式为 macd_dif 等；参数不是默认值时分组名带参数，如 macd_5_10_3
+- 按周期的指标（ma、mavol、rsi）每个周期一个字段，如 ma20、rsi6
+"""
+from __future__ import annotations
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import indicators
+import lazy_imports
+
+pd = lazy_imports.module('pandas')
+
+# 单次请求最多选择的指标数，按周期的指标每个最多的周期数
+MAX_INDICATORS = 12
+MAX_PERIODS = 8
+MAX_PERIOD = 500
+
+Spec = Tuple[str, tuple]
+
+# 分组输出：[(分组名, [(字段名, 列名), ...]), ...]；逐字段输出：[列名, ...]
+Layout = Tuple[List[Tuple[str, List[Tuple[str, str]]]], List[str]]
+
+
+class Workspace:
+    """一份序列上的输入列和中间数组，按键缓存在store（dict或series_cache.DerivedStore）中"""
+
+    def __init__(self, frame: pd.DataFrame, store):
+        self.frame = frame
+        self.store = store
+
+    def memo(self, key: tuple, compute: Callable[[], np.ndarray]):
+        value = self.store.get(key)
+        if value is None:
+            value = self.store[key] = compute()
+        return value
+
+    def column(self, name: str) -> np.ndarray:
+        return self.memo(('column', name), lambda: self.frame[name].to_numpy(dtype='f8'))
+
+    def sma(self, name: str, period: int) -> np.ndarray:
+        return self.memo(('sma', name, period), lambda: indicators.rolling_mean(self.column(name), period))
+
+    def ema(self, name: str, span: int) -> np.ndarray:
+        return self.memo(('ema', name, span), lambda: indicators.ema(self.column(name), 2 / (span + 1)))
+
+    def std(self, name: str, period: int) -> np.ndarray:
+        return self.memo(('std', name, period), lambda: indicators.rolling_std(self.column(name), period))
+
+    def change(self, name: str) -> np.ndarray:
+        """与前一根的差，第一根为NaN"""
+        def compute():
+            values = self.column(name)
+            return np.concatenate(([np.nan], np.diff(values))) if len(values) else values
+        return self.memo(('change', name), compute)
+
+
+class Indicator:
+    """注册表中的一个指标
+
+    components不为空时为分组指标，参数个数固定，compute(ws, *params)按components顺序返回数组；
+    否则为按周期的指标，参数为一个或多个周期，compute(ws, period)返回该周期的数组，
+    输出列名为指标名加周期。warmup(*params) 或 warmup(period) 为开头不可靠的日线数。
+    """
+    __slots__ = ('name', 'inputs', 'defaults', 'bounds', 'components', 'compute', 'warmup')
+
+    def __init__(self, name: str, inputs: Tuple[str, ...], defaults: tuple, bounds: Tuple[tuple, ...],
+                 compute: Callable, warmup: Callable, components: Tuple[str, ...] = ()):
+        self.name = name
+        self.inputs = inputs
+        self.defaults = defaults
+        self.bounds = bounds
+        self.components = components
+        self.compute = compute
+        self.warmup = warmup
+
+    @property
+    def periodic(self) -> bool:
+        return not self.components
+
+    def key(self, params: tuple) -> str:
+        """分组名，参数为默认值时就是指标名"""
+        if params == self.defaults:
+            return self.name
+        return '_'.join([self.name] + [_format_param(p) for p in params])
+
+    def columns(self, params: tuple) -> List[str]:
+        if self.periodic:
+            return [f'{self.name}{period}' for period in params]
+        key = self.key(params)
+        return [f'{key}_{component}' for component in self.components]
+
+
+REGISTRY: Dict[str, Indicator] = {}
+
+
+def register(indicator: Indicator) -> Indicator:
+    REGISTRY[indicator.name] = indicator
+    return indicator
+
+
+def _kdj(ws: Workspace, window: int, m1: int, m2: int):
+    if (window, m1, m2) == (indicators.KDJ_WINDOW, indicators.KDJ_COM + 1, indicators.KDJ_COM + 1) \
+            and 'kdj_k' in ws.frame.columns:
+        # 默认参数的KDJ随序列增量维护（见indicators.extend_indicators），直接使用
+        return [ws.column('kdj_k'), ws.column('kdj_d'), ws.column('kdj_j')]
+    columns, _ = indicators.compute_kdj(ws.column('high'), ws.column('low'), ws.column('close'),
+                                        window=window, k_com=m1 - 1, d_com=m2 - 1)
+    return [columns['kdj_k'], columns['kdj_d'], columns['kdj_j']]
+
+
+def _mavol(ws: Workspace, period: int) -> np.ndarray:
+    name = f'mavol{period}'
+    if name in ws.frame.columns:
+        return ws.column(name)
+    return ws.sma('volume', period)
+
+
+def _macd(ws: Workspace, fast: int, slow: int, signal: int):
+    dif = ws.memo(('macd_dif', fast, slow), lambda: ws.ema('close', fast) - ws.ema('close', slow))
+    dea = ws.memo(('macd_dea', fast, slow, signal), lambda: indicators.ema(dif, 2 / (signal + 1)))
+    return [dif, dea, 2 * (dif - dea)]
+
+
+def _rsi(ws: Workspace, period: int) -> np.ndarray:
+    change = ws.change('close')
+    gain = ws.memo(('gain', 'close'), lambda: np.maximum(change, 0))
+    move = ws.memo(('move', 'close'), lambda: np.abs(change))
+    up = indicators.ema(gain, 1 / period)
+    total = indicators.ema(move, 1 / period)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi = up / total * 100
+    rsi[~np.isfinite(rsi)] = np.nan
+    return rsi
+
+
+def _boll(ws: Workspace, period: int, width: float):
+    mid = ws.sma('close', period)
+    band = width * ws.std('close', period)
+    return [mid, mid + band, mid - band]
+
+
+PERIOD = (1, MAX_PERIOD)
+
+register(Indicator('kdj', ('high', 'low', 'close'), (9, 3, 3), (PERIOD, (2, 100), (2, 100)),
+                   _kdj, lambda window, m1, m2: window - 1, components=('k', 'd', 'j')))
+register(Indicator('mavol', ('volume',), (5, 10, 100), (PERIOD,), _mavol, lambda period: period - 1))
+register(Indicator('ma', ('close',), (5, 10, 20, 60), (PERIOD,),
+                   lambda ws, period: ws.sma('close', period), lambda period: period - 1))
+register(Indicator('macd', ('close',), (12, 26, 9), (PERIOD, PERIOD, PERIOD),
+                   _macd, lambda fast, slow, signal: max(fast, slow) + signal - 2,
+                   components=('dif', 'dea', 'hist')))
+register(Indicator('rsi', ('close',), (6, 12, 24), (PERIOD,), _rsi, lambda period: period))
+register(Indicator('boll', ('close',), (20, 2.0), (PERIOD, (0, 10)), _boll,
+                   lambda period, width: period - 1, components=('mid', 'upper', 'lower')))
+
+# 未指定indicators时的选择，与之前固定输出的KDJ和成交量均线一致
+DEFAULT_SPECS: List[Spec] = [('kdj', (9, 3, 3)), ('mavol', (5, 10, 100))]
+
+_SPEC_PATTERN = re.compile(r'\s*([a-z]+)\s*(?:\(([^()]*)\))?\s*(?:,|$)')
+
+
+def parse(value: Optional[str]) -> List[Spec]:
+    """解析indicators参数，如 "kdj,macd(12,26,9)"；参数错误时抛出ValueError"""
+    if value is None or not value.strip():
+        return list(DEFAULT_SPECS)
+    specs: List[Spec] = []
+    pos = 0
+    while pos < len(value):
+        match = _SPEC_PATTERN.match(value, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"无法解析: {value[pos:]}")
+        pos = match.end()
+        name, args = match.group(1), match.group(2)
+        indicator = REGISTRY.get(name)
+        if indicator is None:
+            raise ValueError(f"未知指标{name}，可选: {', '.join(REGISTRY)}")
+        spec = (name, _parse_params(indicator, args))
+        if spec not in specs:
+            specs.append(spec)
+    if len(specs) > MAX_INDICATORS:
+        raise ValueError(f"最多选择{MAX_INDICATORS}个指标")
+    return specs
+
+
+def _parse_params(indicator: Indicator, args: Optional[str]) -> tuple:
+    if args is None or not args.strip():
+        return indicator.defaults
+    try:
+        params = tuple(_number(part) for part in args.split(','))
+    except ValueError:
+        raise ValueError(f"{indicator.name}的参数必须是数字") from None
+    if indicator.periodic:
+        if len(params) > MAX_PERIODS:
+            raise ValueError(f"{indicator.name}最多{MAX_PERIODS}个周期")
+        bounds = indicator.bounds * len(params)
+        params = tuple(dict.fromkeys(params))
+    elif len(params) != len(indicator.defaults):
+        raise ValueError(f"{indicator.name}需要{len(indicator.defaults)}个参数")
+    else:
+        bounds = indicator.bounds
+    checked = []
+    for param, default, (low, high) in zip(params, indicator.defaults * len(params), bounds):
+        if isinstance(default, int) and not isinstance(param, int):
+            raise ValueError(f"{indicator.name}的周期必须是整数")
+        if not low <= param <= high:
+            raise ValueError(f"{indicator.name}的参数超出范围{low}-{high}")
+        checked.append(type(default)(param))
+    return tuple(checked)
+
+
+def _number(text: str):
+    text = text.strip()
+    return int(text) if re.fullmatch(r'\d+', text) else float(text)
+
+
+def _format_param(param) -> str:
+    return str(param).replace('.', 'p')
+
+
+def canonical(specs: List[Spec]) -> str:
+    """选择的规范写法，用于缓存键"""
+    return ','.join(f"{name}({','.join(str(p) for p in params)})" for name, params in specs)
+
+
+def is_default(specs: List[Spec]) -> bool:
+    return specs == DEFAULT_SPECS
+
+
+def layout(specs: List[Spec]) -> Layout:
+    """选择对应的输出字段"""
+    groups = []
+    flat = []
+    for name, params in specs:
+        indicator = REGISTRY[name]
+        if indicator.periodic:
+            flat.extend(indicator.columns(params))
+        else:
+            groups.append((indicator.key(params), list(zip(indicator.components, indicator.columns(params)))))
+    return groups, flat
+
+
+DEFAULT_LAYOUT = layout(DEFAULT_SPECS)
+
+
+def compute(frame: pd.DataFrame, specs: List[Spec], store=None) -> Dict[str, np.ndarray]:
+    """在frame上计算选择的指标，返回 列名 -> 数组；store为该序列的缓存，结果和中间数组都保存在其中"""
+    ws = Workspace(frame, {} if store is None else store)
+    columns: Dict[str, np.ndarray] = {}
+    for name, params in specs:
+        indicator = REGISTRY[name]
+        columns.update(ws.memo(('indicator', name, params), lambda: _compute_one(ws, indicator, params)))
+    return columns
+
+
+def _compute_one(ws: Workspace, indicator: Indicator, params: tuple) -> Dict[str, np.ndarray]:
+    missing = [name for name in indicator.inputs if name not in ws.frame.columns]
+    if missing:
+        raise ValueError(f"{indicator.name}缺少输入列: {', '.join(missing)}")
+    if indicator.periodic:
+        arrays = [_mask_warmup(indicator.compute(ws, period), indicator.warmup(period)) for period in params]
+    else:
+        warmup = indicator.warmup(*params)
+        arrays = [_mask_warmup(values, warmup) for values in indicator.compute(ws, *params)]
+    return dict(zip(indicator.columns(params), arrays))
+
+
+def _mask_warmup(values: np.ndarray, warmup: int) -> np.ndarray:
+    """预热长度之内的值置为NaN，需要修改时复制，不改动共享的中间数组"""
+    head = values[:warmup]
+    if warmup <= 0 or np.isnan(head).all():
+        return values
+    values = values.copy()
+    values[:warmup] = np.nan
+    return values
@@ -0,0 +1,255 @@
+"""基于NumPy的技术指标计算
+
+指标在完整日线序列上计算一次；新增日线时只根据保存的状态计算尾部，
+不再对整段序列重新计算。结果与pandas的rolling/ewm(com=2)保持一致。
+练习会话用IndicatorStream从任意位置逐根推进，只保存EWM和滑动窗口的状态。
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import lazy_imports
+
+pd = lazy_imports.module('pandas')
+
+KDJ_WINDOW = 9
+KDJ_COM = 2
+MAVOL_PERIODS = (5, 10, 100)
+
+INDICATOR_COLUMNS = ['kdj_k', 'kdj_d', 'kdj_j'] + [f'mavol{period}' for period in MAVOL_PERIODS]
+
+# 尾部增量计算时需要回看的最多日线数量
+LOOKBACK = max(KDJ_WINDOW, max(MAVOL_PERIODS)) - 1
+
+# 由已算出的K、D值反推EWM状态时回看的日线数，更早日线的权重 (2/3)^100 已低于浮点精度
+EWM_HORIZON = 100
+
+
+def ewm_mean(values: np.ndarray, com: float,
+             state: Tuple[float, float] = (0.0, 0.0)) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """等价于pandas的 ewm(com=com, adjust=True).mean()，返回结果和末尾的(加权和, 权重和)状态
+
+    分块用累加和向量化递推：块内 num_t = d^(t+1) * (num_0 + sum(x_i * d^-(i+1)))，
+    块长度保证 d^-m 不溢出。NaN不计入权重但仍参与衰减（ignore_na=False）。
+    """
+    values = np.asarray(values, dtype='f8')
+    n = len(values)
+    out = np.empty(n)
+    if n == 0:
+        return out, state
+
+    decay = com / (1.0 + com)
+    valid = ~np.isnan(values)
+    x = np.where(valid, values, 0.0)
+    w = valid.astype('f8')
+    num, den = state
+
+    chunk = max(1, int(150 / -np.log10(decay))) if decay > 0 else 1
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        powers = np.arange(1, stop - start + 1)
+        growth = decay ** -powers
+        shrink = decay ** powers
+        nums = shrink * (num + np.cumsum(x[start:stop] * growth))
+        dens = shrink * (den + np.cumsum(w[start:stop] * growth))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[start:stop] = np.where(dens > 0, nums / dens, np.nan)
+        num, den = float(nums[-1]), float(dens[-1])
+
+    return out, (num, den)
+
+
+def ema(values: np.ndarray, alpha: float) -> np.ndarray:
+    """递推式指数平均 y_t = alpha * x_t + (1 - alpha) * y_{t-1}，y_0 = x_0（通达信EMA/SMA的算法）
+
+    与ewm_mean相同地分块用累加和向量化：块内 y_t = d^t * (y_0 + alpha * sum(x_i * d^-i))。
+    开头的NaN跳过，从第一个有效值开始递推。
+    """
+    values = np.asarray(values, dtype='f8')
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return out
+    first = int(valid[0])
+    out[first] = y = values[first]
+    x = values[first + 1:]
+
+    decay = 1.0 - alpha
+    chunk = max(1, int(150 / -np.log10(decay))) if 0 < decay < 1 else 1
+    for start in range(0, len(x), chunk):
+        stop = min(start + chunk, len(x))
+        powers = np.arange(1, stop - start + 1)
+        ys = decay ** powers * (y + alpha * np.cumsum(x[start:stop] * decay ** -powers))
+        out[first + 1 + start:first + 1 + stop] = ys
+        y = float(ys[-1])
+    return out
+
+
+def rolling(values: np.ndarray, window: int, func) -> np.ndarray:
+    """滑动窗口聚合，前 window-1 个位置为NaN"""
+    values = np.asarray(values, dtype='f8')
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = func(sliding_window_view(values, window), axis=1)
+    return out
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """滑动平均，用累加和差分代替逐窗口求和"""
+    values = np.asarray(values, dtype='f8')
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        csum = np.concatenate(([0.0], np.cumsum(values)))
+        out[window - 1:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """滑动总体标准差（ddof=0）"""
+    return rolling(values, window, np.std)
+
+
+def compute_rsv(high: np.ndarray, low: np.ndarray, close: np.ndarray, window: int = KDJ_WINDOW) -> np.ndarray:
+    """计算RSV"""
+    low_n = rolling(low, window, np.min)
+    high_n = rolling(high, window, np.max)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsv = (np.asarray(close, dtype='f8') - low_n) / (high_n - low_n) * 100
+    rsv[~np.isfinite(rsv)] = np.nan
+    return rsv
+
+
+def compute_kdj(high: np.ndarray, low: np.ndarray, close: np.ndarray, state: Optional[dict] = None,
+                window: int = KDJ_WINDOW, k_com: float = KDJ_COM,
+                d_com: float = KDJ_COM) -> Tuple[Dict[str, np.ndarray], dict]:
+    """计算KDJ，state为上一段序列末尾的EWM状态"""
+    state = state or {}
+    rsv = compute_rsv(high, low, close, window)
+    k, k_state = ewm_mean(rsv, k_com, state.get('k', (0.0, 0.0)))
+    d, d_state = ewm_mean(k, d_com, state.get('d', (0.0, 0.0)))
+    columns = {'kdj_k': k, 'kdj_d': d, 'kdj_j': 3 * k - 2 * d}
+    return columns, {'k': k_state, 'd': d_state}
+
+
+def compute_volume_ma(volume: np.ndarray) -> Dict[str, np.ndarray]:
+    """计算成交量移动平均"""
+    return {f'mavol{period}': rolling_mean(volume, period) for period in MAVOL_PERIODS}
+
+
+def compute_indicators(frame: pd.DataFrame) -> Tuple[pd.DataFrame, dict]:
+    """在完整序列上计算全部指标，返回带指标列的新DataFrame和增量计算状态"""
+    kdj, state = compute_kdj(frame['high'].to_numpy(), frame['low'].to_numpy(), frame['close'].to_numpy())
+    columns = dict(kdj)
+    columns.update(compute_volume_ma(frame['volume'].to_numpy()))
+    return frame.assign(**columns), state
+
+
+def extend_indicators(frame: pd.DataFrame, new_bars: pd.DataFrame,
+                      state: dict) -> Tuple[pd.DataFrame, dict]:
+    """为追加的日线计算指标：滑动窗口只回看尾部，EWM从保存的状态继续递推"""
+    if new_bars.empty:
+        return frame, state
+
+    n_new = len(new_bars)
+    tail = frame.iloc[-LOOKBACK:] if LOOKBACK > 0 else frame.iloc[0:0]
+
+    def joined(column):
+        return np.concatenate([tail[column].to_numpy(dtype='f8'), new_bars[column].to_numpy(dtype='f8')])
+
+    rsv = compute_rsv(joined('high'), joined('low'), joined('close'))[-n_new:]
+
+    k, k_state = ewm_mean(rsv, KDJ_COM, state['k'])
+    d, d_state = ewm_mean(k, KDJ_COM, state['d'])
+    columns = {'kdj_k': k, 'kdj_d': d, 'kdj_j': 3 * k - 2 * d}
+
+    volume = joined('volume')
+    for period in MAVOL_PERIODS:
+        columns[f'mavol{period}'] = rolling_mean(volume, period)[-n_new:]
+
+    extended = pd.concat([frame, new_bars.assign(**columns)], ignore_index=True)
+    return extended, {'k': k_state, 'd': d_state}
+
+
+class SeriesArrays:
+    """逐根推进使用的只读日线和指标数组，同一股票的所有IndicatorStream共用一份"""
+    __slots__ = ('frame', 'dates', 'open', 'high', 'low', 'close', 'volume', 'kdj_k', 'kdj_d', '__weakref__')
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        self.dates = frame['date'].to_numpy().astype('datetime64[D]')
+        for name in ('open', 'high', 'low', 'close', 'volume'):
+            setattr(self, name, frame[name].to_numpy(dtype='f8'))
+        # 不足9根日线时没有KDJ列
+        for name in ('kdj_k', 'kdj_d'):
+            setattr(self, name, frame[name].to_numpy(dtype='f8') if name in frame.columns
+                    else np.full(len(frame), np.nan))
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+
+class IndicatorStream:
+    """从某根日线开始逐根推进的KDJ和成交量均线
+
+    只保存位置、K和D的EWM状态（加权和、权重和）以及各周期成交量的滑动和，
+    日线从共享的SeriesArrays读取，每推进一根只做常数次运算。
+    """
+    __slots__ = ('arrays', 'pos', 'k_num', 'k_den', 'd_num', 'd_den', 'volume_sums')
+
+    def __init__(self, arrays: SeriesArrays, pos: int = 0):
+        self.arrays = arrays
+        self.seek(pos)
+
+    def seek(self, pos: int) -> None:
+        """定位到第pos根日线之前：由共享数组中已算出的K、D值反推EWM状态，成交量滑动和直接求和"""
+        arrays = self.arrays
+        self.pos = pos
+        lo = max(0, pos - EWM_HORIZON)
+        # 第j根日线在位置pos之前的权重为 decay^(pos-1-j)
+        weights = (KDJ_COM / (1.0 + KDJ_COM)) ** np.arange(pos - lo - 1, -1, -1)
+        window_lo = max(0, lo - KDJ_WINDOW + 1)
+        rsv = compute_rsv(arrays.high[window_lo:pos], arrays.low[window_lo:pos],
+                          arrays.close[window_lo:pos])[lo - window_lo:]
+        self.k_den = float(np.dot(~np.isnan(rsv), weights))
+        self.d_den = float(np.dot(~np.isnan(arrays.kdj_k[lo:pos]), weights))
+        self.k_num = float(arrays.kdj_k[pos - 1]) * self.k_den if self.k_den > 0 else 0.0
+        self.d_num = float(arrays.kdj_d[pos - 1]) * self.d_den if self.d_den > 0 else 0.0
+        self.volume_sums = [float(arrays.volume[max(0, pos - period):pos].sum()) for period in MAVOL_PERIODS]
+
+    def advance(self) -> Tuple[float, float, float, List[float]]:
+        """计算当前日线的K、D、J和各周期成交量均线（没有值时为NaN），然后前进一根"""
+        arrays = self.arrays
+        t = self.pos
+        decay = KDJ_COM / (1.0 + KDJ_COM)
+
+        rsv = math.nan
+        if t >= KDJ_WINDOW - 1:
+            low_n = float(arrays.low[t - KDJ_WINDOW + 1:t + 1].min())
+            high_n = float(arrays.high[t - KDJ_WINDOW + 1:t + 1].max())
+            if high_n != low_n:
+                rsv = (float(arrays.close[t]) - low_n) / (high_n - low_n) * 100
+        rsv_valid = math.isfinite(rsv)
+        self.k_num = decay * self.k_num + (rsv if rsv_valid else 0.0)
+        self.k_den = decay * self.k_den + rsv_valid
+        k = self.k_num / self.k_den if self.k_den > 0 else math.nan
+
+        k_valid = not math.isnan(k)
+        self.d_num = decay * self.d_num + (k if k_valid else 0.0)
+        self.d_den = decay * self.d_den + k_valid
+        d = self.d_num / self.d_den if self.d_den > 0 else math.nan
+
+        volume = arrays.volume
+        mavols = []
+        for i, period in enumerate(MAVOL_PERIODS):
+            total = self.volume_sums[i] + float(volume[t])
+            if t >= period:
+                total -= float(volume[t - period])
+            self.volume_sums[i] = total
+            mavols.append(total / period if t >= period - 1 else math.nan)
+
+        self.pos = t + 1
+        return k, d, 3 * k - 2 * d, mavols
@@ -0,0 +1,241 @@
+"""全市场日线批量预加载
+
+刷新交易日历快照，下载全部A股的前复权日线写入本地存储，并预先计算KDJ和成交量均线，
+使交互请求直接读取本地数据，不再等待上游下载。下载和写入复用服务使用的
+data_source.sync_symbol_history：已是最新的股票跳过，已有数据的股票只下载增量。
+
+多个进程并行处理，上游调用共用一个全局限速；失败的股票按指数退避重试。
+进度写入检查点文件，中断后重新运行会跳过同一交易日已完成的股票：
+
+    cd backend
+    python ingest.py                          # 全部A股，默认从检查点继续
+    python ingest.py --symbols 600519,000001  # 只处理指定股票
+    python ingest.py --restart                # 忽略检查点重新开始
+    python ingest.py --daily-at 18:00         # 常驻运行，每个交易日收盘后执行一次
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import data_source
+import indicators
+import series_store
+import symbols
+import trading_calendar
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(series_store.SERIES_STORE_DIR, 'ingest_checkpoint.json')
+
+# 两次写入检查点之间至少完成的股票数
+CHECKPOINT_EVERY = 20
+
+
+class RateLimiter:
+    """跨进程共享的全局限速，按固定间隔为每次调用分配时间槽"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = multiprocessing.Value('d', 0.0)
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._next_slot.get_lock():
+            now = time.time()
+            slot = max(now, self._next_slot.value)
+            self._next_slot.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _init_worker(limiter: RateLimiter) -> None:
+    data_source.set_upstream_limiter(limiter)
+
+
+def ingest_symbol(symbol: str, retries: int, backoff: float) -> dict:
+    """在工作进程中同步一只股票并更新预先计算的指标，失败时按指数退避重试"""
+    start = time.perf_counter()
+    for attempt in range(retries + 1):
+        try:
+            data_source.sync_symbol_history(symbol)
+            rows = update_indicators(symbol)
+            return {'symbol': symbol, 'status': 'ok' if rows else 'empty', 'rows': rows,
+                    'attempts': attempt + 1, 'seconds': time.perf_counter() - start}
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempt < retries:
+                # 加入随机抖动，避免多个进程同时重试
+                time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+    return {'symbol': symbol, 'status': 'failed', 'error': error,
+            'attempts': retries + 1, 'seconds': time.perf_counter() - start}
+
+
+def update_indicators(symbol: str) -> int:
+    """为存储中的日线计算指标，已有的预先计算结果只增量补齐尾部，返回日线行数"""
+    bars = series_store.load_bars(symbol)
+    if bars is None or len(bars) == 0:
+        return 0
+    base = series_store.load_indicators(symbol, bars)
+    if base is not None and len(base[0]) == len(bars):
+        return len(bars)
+    if base is not None:
+        series, state = indicators.extend_indicators(
+            base[0], series_store.bars_to_frame(bars[len(base[0]):]), base[1]
+        )
+    else:
+        series, state = indicators.compute_indicators(series_store.bars_to_frame(bars))
+    series_store.write_indicators(symbol, series, indicators.INDICATOR_COLUMNS, state)
+    return len(bars)
+
+
+def load_universe(limiter: RateLimiter, refresh: bool = False) -> List[str]:
+    """全部A股代码：优先使用未过期的本地目录快照，否则从上游下载并更新快照"""
+    index = None if refresh else symbols.load_snapshot()
+    if data_source.DATA_PROVIDER == 'synthetic':
+        index = index or symbols.default_index()
+    elif index is None or time.time() - index.updated_at > symbols.SYMBOL_REFRESH_INTERVAL:
+        try:
+            limiter.acquire()
+            index = symbols.fetch_universe()
+            symbols.save_snapshot(index)
+        except Exception as e:
+            if index is None:
+                raise
+            print(f"下载股票目录失败，使用本地快照: {e}", file=sys.stderr)
+    return [entry['symbol'] for entry in index.entries]
+
+
+def refresh_calendar(limiter: RateLimiter) -> None:
+    """更新交易日历快照，服务进程检测到快照更新后重新加载；失败时继续使用旧快照"""
+    if data_source.DATA_PROVIDER == 'synthetic':
+        return
+    try:
+        limiter.acquire()
+        trading_calendar.refresh()
+    except Exception as e:
+        print(f"下载交易日历失败，使用本地快照: {e}", file=sys.stderr)
+
+
+def session_of(close: datetime) -> str:
+    """检查点对应的交易日，同一次收盘之后的运行共用一个检查点"""
+    return close.date().isoformat()
+
+
+def read_checkpoint(path: str, session: str) -> Dict[str, dict]:
+    """读取同一交易日已完成的股票，其他交易日的检查点视为不存在"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if checkpoint.get('session') != session:
+        return {}
+    return checkpoint.get('done', {})
+
+
+def write_checkpoint(path: str, session: str, done: Dict[str, dict], failed: Dict[str, str]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'session': session, 'updated_at': time.time(), 'done': done, 'failed': failed},
+                  f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def run_ingest(universe: Optional[List[str]], processes: int, rate: float, retries: int, backoff: float,
+               checkpoint_path: str, restart: bool = False, refresh_universe: bool = False) -> dict:
+    """执行一次批量预加载，返回汇总结果"""
+    limiter = RateLimiter(rate)
+    refresh_calendar(limiter)
+    session = session_of(series_store.last_market_close())
+    done = {} if restart else read_checkpoint(checkpoint_path, session)
+    if universe is None:
+        universe = load_universe(limiter, refresh_universe)
+    pending = [symbol for symbol in dict.fromkeys(universe) if symbol not in done]
+    print(f"交易日{session}: 共{len(universe)}只，检查点中已完成{len(universe) - len(pending)}只，"
+          f"待处理{len(pending)}只", file=sys.stderr)
+
+    start = time.perf_counter()
+    failed: Dict[str, str] = {}
+    counts = {'ok': 0, 'empty': 0, 'failed': 0}
+    finished = 0
+    try:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(limiter,)) as pool:
+            futures = [pool.submit(ingest_symbol, symbol, retries, backoff) for symbol in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                counts[result['status']] += 1
+                finished += 1
+                if result['status'] == 'failed':
+                    failed[result['symbol']] = result['error']
+                else:
+                    done[result['symbol']] = {'rows': result['rows'], 'attempts': result['attempts']}
+                if finished % CHECKPOINT_EVERY == 0:
+                    write_checkpoint(checkpoint_path, session, done, failed)
+                    elapsed = time.perf_counter() - start
+                    print(f"{finished}/{len(pending)} 完成，失败{counts['failed']}，"
+                          f"{finished / elapsed:.1f}只/秒", file=sys.stderr)
+    finally:
+        # 中断时也保存已完成的进度
+        write_checkpoint(checkpoint_path, session, done, failed)
+
+    return {
+        'session': session,
+        'universe': len(universe),
+        'skipped': len(universe) - len(pending),
+        **counts,
+        'failed_symbols': failed,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def seconds_until(at: str) -> float:
+    """距下一个工作日的指定时间（HH:MM，北京时间）的秒数"""
+    hour, minute = (int(part) for part in at.split(':'))
+    now = datetime.now(series_store.MARKET_TZ)
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    while target <= now or target.weekday() >= 5:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--symbols', help='逗号分隔的股票代码，默认处理全部A股')
+    parser.add_argument('--processes', type=int, default=min(4, os.cpu_count() or 1), help='并行进程数')
+    parser.add_argument('--rate', type=float, default=2.0, help='所有进程合计每秒最多的上游调用次数，0为不限速')
+    parser.add_argument('--retries', type=int, default=3, help='每只股票失败后的重试次数')
+    parser.add_argument('--backoff', type=float, default=2.0, help='第一次重试前的等待秒数，之后每次加倍')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT_PATH, help='检查点文件路径')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，重新处理全部股票')
+    parser.add_argument('--refresh-universe', action='store_true', help='忽略本地快照，重新下载股票目录')
+    parser.add_argument('--daily-at', metavar='HH:MM', help='常驻运行，每个工作日在该时间（北京时间）执行一次')
+    args = parser.parse_args(argv)
+
+    universe = [symbol.strip() for symbol in args.symbols.split(',') if symbol.strip()] if args.symbols else None
+
+    def run_once() -> dict:
+        summary = run_ingest(universe, args.processes, args.rate, args.retries, args.backoff,
+                             args.checkpoint, args.restart, args.refresh_universe)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return summary
+
+    if not args.daily_at:
+        return 1 if run_once()['failed'] else 0
+
+    while True:
+        time.sleep(seconds_until(args.daily_at))
+        try:
+            run_once()
+        except Exception as e:
+            print(f"批量预加载失败: {e}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
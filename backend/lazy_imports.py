@@ -0,0 +1,48 @@
+"""重型依赖的延迟导入
+
+pandas、AKShare、pypinyin导入耗时较长，模块顶层用 ``pd = lazy_imports.module('pandas')``
+得到占位模块，第一次访问其属性时才真正导入。使用占位模块的文件需要
+``from __future__ import annotations``，否则函数的类型注解在导入时求值会立即触发导入。
+
+真正导入的耗时记录在IMPORT_TIMES中，由 /api/ready 和 /metrics 输出。
+"""
+import importlib
+import sys
+import time
+import types
+from typing import Dict
+
+# 模块名 -> 导入耗时（秒），只记录由本模块触发的首次导入
+IMPORT_TIMES: Dict[str, float] = {}
+
+_placeholders: Dict[str, types.ModuleType] = {}
+
+
+class LazyModule(types.ModuleType):
+    """占位模块，第一次访问属性时导入目标模块"""
+
+    def __getattr__(self, attr):
+        target = load(self.__name__)
+        # 复制目标模块的属性，之后的访问直接命中，不再经过__getattr__
+        self.__dict__.update(target.__dict__)
+        return getattr(target, attr)
+
+
+def load(name: str) -> types.ModuleType:
+    """导入模块并记录耗时，已导入时直接返回（并发导入由importlib的模块锁保证只执行一次）"""
+    imported = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    if not imported:
+        IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def module(name: str) -> types.ModuleType:
+    """模块已导入时返回模块本身，否则返回占位模块"""
+    if name in sys.modules:
+        return sys.modules[name]
+    placeholder = _placeholders.get(name)
+    if placeholder is None:
+        placeholder = _placeholders[name] = LazyModule(name)
+    return placeholder
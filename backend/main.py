@@ -1,15 +1,45 @@
-from fastapi import FastAPI, HTTPException
+from __future__ import annotations
+
+import time
+
+# 应用模块的导入耗时（含FastAPI等依赖），由 /api/ready 输出
+_import_start = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Header, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-import pandas as pd
-import akshare as ak
-import requests
-import redis
-import json
-from typing import Optional, List
+from typing import Optional, List, Dict
+from functools import partial
 import asyncio
+import hmac
+import numpy as np
+import io
+import logging
+from collections import deque
+
+import cache
+import data_source
+import http_cache
+import indicator_registry
+import indicators
+import lazy_imports
+import metrics
+import practice
+import resample
+import serializer
+import series_store
+import shared_series
+import symbols
+import synthetic
+import trading_calendar
+from series_cache import SeriesCache
+
+# pandas在第一次使用时才导入，启动预热会提前在后台导入
+pd = lazy_imports.module('pandas')
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="股票趋势练习API", version="1.0.0")
 
@@ -22,11 +52,179 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Redis缓存配置
+# 请求耗时、状态码和正在处理的请求数（路由在第一次请求时从app.routes解析）
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    route_paths=lambda: {route.endpoint: route.path for route in app.routes if hasattr(route, 'endpoint')}
+)
+
+# Redis缓存配置（异步客户端，连接池和超时见cache.from_env）
 import os
-redis_host = os.getenv('REDIS_HOST', 'localhost')
-redis_port = int(os.getenv('REDIS_PORT', '6379'))
-redis_client = redis.Redis(host=redis_host, port=redis_port, db=0, decode_responses=True)
+redis_cache = cache.from_env()
+
+# 进程内L1缓存 + Redis L2缓存，CACHE_EXPIRE为软过期时间，CACHE_STALE_TTL为过期后仍可返回旧值的宽限期
+response_cache = cache.tiered_from_env(redis_cache)
+
+@app.on_event("shutdown")
+async def close_redis_cache():
+    """关闭Redis连接池"""
+    await redis_cache.close()
+
+@app.on_event("startup")
+async def start_metrics_flush():
+    """多worker时定期写入本worker的指标快照，供/metrics汇总"""
+    if metrics.METRICS_DIR:
+        asyncio.create_task(metrics.flush_forever())
+
+# 按股票代码缓存的完整序列（含技术指标），过期后重新同步本地存储；
+# 按请求选择的指标、周线月线等派生数据共用一个按字节数限制的LRU
+series_cache = SeriesCache(
+    max_symbols=int(os.getenv('SERIES_CACHE_SIZE', '256')),
+    ttl=data_source.SERIES_REFRESH_INTERVAL,
+    derived_max_bytes=int(os.getenv('SERIES_DERIVED_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+)
+
+# 最近一次加载序列失败、正在使用备选数据的股票
+fallback_symbols = set()
+
+# 股票目录，预热或第一次使用时加载快照（没有快照时使用内置目录），后台刷新后整体替换
+symbol_index: Optional[symbols.SymbolIndex] = None
+
+# 正在线程池中进行的目录加载，并发的请求共享同一次加载
+_symbol_index_loading: Optional[asyncio.Future] = None
+
+def get_symbol_index() -> symbols.SymbolIndex:
+    """当前股票目录，尚未加载时同步加载（内置目录需要导入拼音库），只在线程池中调用"""
+    global symbol_index
+    if symbol_index is None:
+        symbol_index = symbols.load_snapshot() or symbols.default_index()
+    return symbol_index
+
+async def current_symbol_index() -> symbols.SymbolIndex:
+    """当前股票目录，尚未加载（预热未完成或WARMUP=0）时在线程池中加载，不阻塞事件循环"""
+    global _symbol_index_loading
+    if symbol_index is not None:
+        return symbol_index
+    if _symbol_index_loading is None or _symbol_index_loading.done():
+        # 已完成但目录仍为空说明上次加载失败，重新加载
+        _symbol_index_loading = asyncio.get_running_loop().run_in_executor(None, get_symbol_index)
+    return await asyncio.shield(_symbol_index_loading)
+
+@app.on_event("startup")
+async def load_symbol_index():
+    """启动股票目录的后台刷新任务"""
+    asyncio.create_task(refresh_symbol_index())
+
+async def refresh_symbol_index():
+    """快照过期时在后台从AKShare刷新股票目录，失败后稍后重试"""
+    global symbol_index
+    if data_source.DATA_PROVIDER == 'synthetic':
+        # 离线模式只使用内置目录
+        return
+    await current_symbol_index()
+    while True:
+        wait = symbol_index.updated_at + symbols.SYMBOL_REFRESH_INTERVAL - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+            continue
+        try:
+            index = await data_source.run_upstream(symbols.fetch_universe)
+            await data_source.run_upstream(symbols.save_snapshot, index)
+            symbol_index = index
+        except Exception:
+            await asyncio.sleep(600)
+
+# 事件循环延迟：周期性sleep实际多等待的时间，保留最近约一分钟的样本
+LOOP_LAG_INTERVAL = 0.1
+loop_lag_samples = deque(maxlen=600)
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    """启动事件循环延迟采样任务"""
+    asyncio.create_task(monitor_loop_lag())
+
+async def monitor_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag_samples.append(loop.time() - start - LOOP_LAG_INTERVAL)
+
+def loop_lag_stats() -> dict:
+    """事件循环延迟（毫秒）：最近一次、最近约1秒内最大、保留窗口内最大"""
+    if not loop_lag_samples:
+        return {'last_ms': 0.0, 'recent_max_ms': 0.0, 'max_ms': 0.0}
+    recent = list(loop_lag_samples)[-10:]
+    return {
+        'last_ms': loop_lag_samples[-1] * 1000,
+        'recent_max_ms': max(recent) * 1000,
+        'max_ms': max(loop_lag_samples) * 1000,
+    }
+
+# 启动预热：开始接受请求后，在后台导入重型依赖、加载股票目录和常用股票的序列，
+# 完成或超时后 /api/ready 返回200；WARMUP=0 时不预热，依赖和目录在第一次使用时加载
+WARMUP_ENABLED = os.getenv('WARMUP', '1') != '0'
+WARMUP_SYMBOLS = [symbol.strip() for symbol in os.getenv('WARMUP_SYMBOLS', '').split(',') if symbol.strip()]
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', '60'))
+
+# 启动阶段和各步骤耗时（秒），import_seconds在模块末尾记录
+startup_state = {
+    'status': 'warming_up' if WARMUP_ENABLED else 'ready',
+    'import_seconds': None,
+    'warmup_seconds': None,
+    'steps': {},
+    'failed_symbols': [],
+}
+
+def warmup_modules() -> List[str]:
+    """预热时导入的重型依赖，离线模式不需要AKShare"""
+    if data_source.DATA_PROVIDER == 'synthetic':
+        return ['pandas']
+    return ['pandas', 'akshare']
+
+@app.on_event("startup")
+async def start_warmup():
+    """启动后台预热任务，不阻塞开始接受请求"""
+    if WARMUP_ENABLED:
+        asyncio.create_task(warmup())
+
+async def warmup():
+    """执行预热，超时或失败时未完成的部分改为第一次使用时加载，服务照常就绪"""
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(run_warmup_steps(), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("启动预热超过%s秒未完成", WARMUP_TIMEOUT)
+    except Exception as e:
+        logger.warning("启动预热失败: %s", e)
+    startup_state['warmup_seconds'] = time.perf_counter() - start
+    startup_state['status'] = 'ready'
+
+async def run_warmup_steps():
+    loop = asyncio.get_running_loop()
+    steps = startup_state['steps']
+    
+    # 导入在线程中执行，期间事件循环仍可处理请求
+    start = time.perf_counter()
+    for name in warmup_modules():
+        await loop.run_in_executor(None, lazy_imports.load, name)
+    steps['dependencies'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    await current_symbol_index()
+    steps['symbol_index'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    await loop.run_in_executor(None, trading_calendar.default_calendar)
+    steps['trading_calendar'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for symbol in WARMUP_SYMBOLS:
+        try:
+            await get_symbol_series(symbol)
+        except Exception:
+            startup_state['failed_symbols'].append(symbol)
+    steps['series'] = time.perf_counter() - start
 
 class StockData(BaseModel):
     date: str
@@ -43,90 +241,148 @@ class StockResponse(BaseModel):
     future_data: List[StockData]
     dividing_date: str
 
-async def get_cached_data(key: str) -> Optional[dict]:
-    """从Redis获取缓存数据"""
-    try:
-        cached = redis_client.get(key)
-        if cached:
-            return json.loads(cached)
-    except Exception:
-        pass
-    return None
+class BatchItem(BaseModel):
+    symbol: str
+    dividing_date: str
+    historical_days: int = 180
+    future_days: int = 90
+    unit: str = 'days'
+    indicators: Optional[str] = None
+    period: str = 'daily'
+    max_points: Optional[int] = None
 
-async def set_cached_data(key: str, data: dict, expire: int = 3600):
-    """设置Redis缓存数据"""
-    try:
-        redis_client.setex(key, expire, json.dumps(data, ensure_ascii=False))
-    except Exception:
-        pass
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    format: str = 'rows'
+
+# 管理员令牌，设置后才能通过X-Admin-Token请求头使用profile=1
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# profile=1 时输出的函数数量
+PROFILE_TOP_FUNCTIONS = 40
+
+# 窗口长度的单位：days（自然日）或 bars（交易日）
+WINDOW_UNITS = ('days', 'bars')
+
+# 回放接口每批最多日线数和批次间隔上限（毫秒）
+REPLAY_MAX_BATCH = 500
+REPLAY_MAX_INTERVAL_MS = 10000
+
+# 批量接口单次最多项数和同时加载的股票数
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '50'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+
+async def get_cached_data(key: str, loader) -> bytes:
+    """两级缓存读取：L1进程内 -> L2 Redis -> loader生成，过期条目先返回旧值再后台刷新"""
+    return await response_cache.get(key, loader)
 
 def calculate_kdj(data: pd.DataFrame) -> pd.DataFrame:
     """计算KDJ指标"""
     if len(data) < 9:
         return data
     
-    # 计算RSV
-    low_list = data['low'].rolling(window=9, min_periods=9).min()
-    high_list = data['high'].rolling(window=9, min_periods=9).max()
-    rsv = (data['close'] - low_list) / (high_list - low_list) * 100
-    
-    # 计算K, D, J
-    data['kdj_k'] = rsv.ewm(com=2).mean()
-    data['kdj_d'] = data['kdj_k'].ewm(com=2).mean()
-    data['kdj_j'] = 3 * data['kdj_k'] - 2 * data['kdj_d']
-    
-    return data
+    columns, _ = indicators.compute_kdj(data['high'].to_numpy(), data['low'].to_numpy(), data['close'].to_numpy())
+    return data.assign(**columns)
 
 def calculate_volume_ma(data: pd.DataFrame) -> pd.DataFrame:
     """计算成交量移动平均"""
-    for period in [5, 10, 100]:
-        data[f'mavol{period}'] = data['volume'].rolling(window=period).mean()
-    return data
+    return data.assign(**indicators.compute_volume_ma(data['volume'].to_numpy()))
+
+async def get_symbol_series(symbol: str) -> Optional[pd.DataFrame]:
+    """获取带技术指标的完整日线序列，按股票代码缓存，存储中没有数据时返回None
+
+    进程内缓存未命中时映射同一主机上其他worker已发布的共享序列，没有可用的序列时
+    由获得该股票锁的worker加载并发布（见shared_series）。
+    """
+    series = series_cache.get(symbol)
+    if series is not None:
+        return series
+    
+    segment = await shared_series.load(symbol, partial(current_segment, symbol), partial(build_segment, symbol))
+    if segment is None:
+        return None
+    cached = series_cache.peek(symbol)
+    if cached is None or cached[0] is not segment.frame:
+        # 同一进程并发的未命中共享同一次加载，只写入一次缓存
+        series_cache.set(symbol, segment.frame, segment.state, segment.dates)
+    return segment.frame
+
+def current_segment(symbol: str) -> Optional[shared_series.Segment]:
+    """已发布且与本地存储一致的共享序列，本地存储需要向上游同步时返回None"""
+    bars = series_store.load_bars(symbol)
+    if data_source.needs_sync(symbol, bars):
+        return None
+    segment = shared_series.attach(symbol)
+    return segment if segment is not None and segment.matches(bars) else None
+
+async def build_segment(symbol: str) -> Optional[shared_series.Segment]:
+    """同步本地存储并计算技术指标，发布为共享序列
+
+    计算指标、写入和映射共享文件都在线程池中执行，冷启动加载不阻塞事件循环。
+    """
+    start = time.perf_counter()
+    await data_source.ensure_symbol_history(symbol)
+    bars = series_store.load_bars(symbol)
+    metrics.record_timing('upstream', time.perf_counter() - start)
+    if bars is None or len(bars) == 0:
+        return None
+    
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    result = await loop.run_in_executor(None, segment_indicators, symbol, bars)
+    if isinstance(result, shared_series.Segment):
+        # 同步后没有新的日线，已发布的序列仍然可用
+        return result
+    metrics.observe_stage('indicators', time.perf_counter() - start)
+    series, state = result
+    return await loop.run_in_executor(None, shared_series.publish, symbol, series, state, bars)
+
+def segment_indicators(symbol: str, bars):
+    """已发布的序列仍然可用时返回该序列，否则返回(带技术指标的完整序列, 增量计算状态)"""
+    base = shared_series.attach(symbol)
+    if base is not None and base.matches(bars):
+        return base
+    if base is not None and _is_prefix_of(base.frame, bars):
+        base = base.frame, base.state
+    else:
+        # 没有可用的已发布序列时，使用批量预加载时预先计算的指标
+        base = series_store.load_indicators(symbol, bars)
+    if base is not None:
+        # 只为新增日线增量计算指标
+        return indicators.extend_indicators(
+            base[0], series_store.bars_to_frame(bars[len(base[0]):]), base[1]
+        )
+    # 在完整序列上计算一次技术指标，各窗口直接切片
+    return indicators.compute_indicators(series_store.bars_to_frame(bars))
+
+def _is_prefix_of(series: pd.DataFrame, bars) -> bool:
+    """缓存的序列是否仍是存储序列的前缀（前复权价格未重算）"""
+    n = len(series)
+    if n == 0 or n > len(bars):
+        return False
+    return (bars['date'][n - 1] == series['date'].iloc[-1].to_datetime64().astype('datetime64[D]')
+            and bars['close'][n - 1] == series['close'].iloc[-1])
 
 async def fetch_stock_data_from_akshare(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
-    """使用AKShare获取真实股票数据"""
+    """使用AKShare获取真实股票数据（从按股票缓存的完整序列中切片）"""
     try:
         # 转换日期格式
         start_date_obj = datetime.strptime(start_date, "%Y%m%d")
         end_date_obj = datetime.strptime(end_date, "%Y%m%d")
         
-        # 计算需要获取的数据天数
-        days_needed = (end_date_obj - start_date_obj).days + 30  # 多获取一些数据
+        stock_data = await get_symbol_series(symbol)
         
-        # 使用AKShare获取股票历史数据
-        # 对于A股，AKShare支持直接使用股票代码
-        if symbol.startswith('6'):
-            # 上证A股
-            stock_data = ak.stock_zh_a_hist(symbol=symbol, period="daily", adjust="qfq")
-        elif symbol.startswith('0') or symbol.startswith('3'):
-            # 深证A股
-            stock_data = ak.stock_zh_a_hist(symbol=symbol, period="daily", adjust="qfq")
-        else:
-            # 其他股票，尝试通用接口
-            stock_data = ak.stock_zh_a_hist(symbol=symbol, period="daily", adjust="qfq")
-        
-        if stock_data.empty:
+        if stock_data is None:
             # 如果AKShare没有数据，尝试备选方案
+            fallback_symbols.add(symbol)
             return await generate_fallback_data(symbol, start_date, end_date)
+        fallback_symbols.discard(symbol)
         
-        # 重命名列以匹配我们的数据格式
-        stock_data = stock_data.rename(columns={
-            '日期': 'date',
-            '开盘': 'open',
-            '最高': 'high', 
-            '最低': 'low',
-            '收盘': 'close',
-            '成交量': 'volume'
-        })
-        
-        # 转换日期格式
-        stock_data['date'] = pd.to_datetime(stock_data['date'])
-        
-        # 过滤日期范围
-        filtered_data = stock_data[
-            (stock_data['date'] >= start_date_obj) & 
-            (stock_data['date'] <= end_date_obj)
-        ]
+        # 在按日期升序的索引上二分查找窗口边界，耗时与序列长度无关
+        dates = series_cache.date_index(symbol, stock_data)
+        lo = dates.searchsorted(np.datetime64(start_date_obj.date(), 'D'), side='left')
+        hi = dates.searchsorted(np.datetime64(end_date_obj.date(), 'D'), side='right')
+        filtered_data = stock_data.iloc[lo:hi]
         
         if filtered_data.empty:
             # 如果过滤后没有数据，返回最近的数据
@@ -136,134 +392,350 @@ async def fetch_stock_data_from_akshare(symbol: str, start_date: str, end_date:
             # 如果还是没有数据，使用备选方案
             return await generate_fallback_data(symbol, start_date, end_date)
         
-        # 只保留需要的列
-        filtered_data = filtered_data[['date', 'open', 'high', 'low', 'close', 'volume']]
-        
         return filtered_data
         
     except Exception as e:
         # 如果AKShare失败，使用备选方案
+        fallback_symbols.add(symbol)
         return await generate_fallback_data(symbol, start_date, end_date)
 
 async def generate_fallback_data(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
-    """生成基于真实股票特性的模拟数据作为备选方案"""
+    """生成模拟股票数据作为备选方案（按股票代码固定种子，不同窗口的同一天数据一致）"""
     try:
-        start_date_obj = datetime.strptime(start_date, "%Y%m%d")
-        end_date_obj = datetime.strptime(end_date, "%Y%m%d")
-        
-        # 生成日期范围
-        dates = pd.date_range(start=start_date_obj, end=end_date_obj, freq='D')
-        
-        # 根据股票代码生成不同的价格特性
-        # 银行股：价格较低，波动较小
-        # 科技股：价格较高，波动较大
-        # 消费股：中等价格，稳定增长
-        
-        if symbol in ['000001', '600036', '601398']:  # 银行股
-            base_price = 8.0 + (int(symbol[-2:]) % 5)  # 8-13元
-            volatility = 0.015  # 1.5%波动率
-            base_volume = 5000000  # 较大成交量
-        elif symbol in ['000063', '002415', '300750']:  # 科技股
-            base_price = 30.0 + (int(symbol[-2:]) % 20)  # 30-50元
-            volatility = 0.035  # 3.5%波动率
-            base_volume = 2000000  # 中等成交量
-        elif symbol in ['600519', '000858', '600887']:  # 消费股
-            base_price = 50.0 + (int(symbol[-2:]) % 30)  # 50-80元
-            volatility = 0.025  # 2.5%波动率
-            base_volume = 1000000  # 中等成交量
-        else:  # 其他股票
-            base_price = 15.0 + (int(symbol[-2:]) % 10)  # 15-25元
-            volatility = 0.020  # 2%波动率
-            base_volume = 1500000  # 中等成交量
-        
-        data = []
-        
-        for i, date in enumerate(dates):
-            # 生成更真实的股票价格序列
-            if i == 0:
-                open_price = base_price
-            else:
-                # 基于前一日收盘价，加上随机波动
-                prev_close = data[i-1]['close']
-                daily_change = (volatility * (i % 7 - 3) / 100)  # 更真实的日间变化
-                open_price = prev_close * (1 + daily_change)
-            
-            # 日内波动
-            intraday_volatility = volatility / 2
-            close_price = open_price * (1 + (intraday_volatility * (i % 5 - 2) / 100))
-            high_price = max(open_price, close_price) * (1 + intraday_volatility / 3)
-            low_price = min(open_price, close_price) * (1 - intraday_volatility / 3)
-            
-            # 成交量模拟（基于价格变化）
-            price_change_pct = abs((close_price - open_price) / open_price) * 100
-            volume = base_volume * (1 + price_change_pct / 10 + (i % 10 - 5) / 20)
-            
-            data.append({
-                'date': date,
-                'open': round(open_price, 2),
-                'high': round(high_price, 2),
-                'low': round(low_price, 2),
-                'close': round(close_price, 2),
-                'volume': int(volume)
-            })
-        
-        df = pd.DataFrame(data)
-        return df
-        
+        return synthetic.generate_bars(symbol, start_date, end_date)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成备选数据失败: {str(e)}")
 
-async def generate_fallback_data(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
-    """生成模拟股票数据作为备选方案"""
+def window_dates(dividing_date_obj: datetime, historical_days: int, future_days: int, unit: str = 'days'):
+    """根据分界日期计算请求的起止日期（YYYYMMDD）
+
+    unit=days 时按自然日计算；unit=bars 时按交易日历计算，历史窗口为分界日期之前的historical_days个交易日，
+    未来窗口为分界日期（含）起的future_days个交易日。
+    """
+    if unit == 'bars':
+        calendar = trading_calendar.default_calendar()
+        day = dividing_date_obj.date()
+        start = calendar.offset(day, -historical_days) if historical_days > 0 else day
+        end = calendar.offset(day, future_days - 1) if future_days > 0 else day - timedelta(days=1)
+        return start.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+    start_date = (dividing_date_obj - timedelta(days=historical_days)).strftime("%Y%m%d")
+    end_date = (dividing_date_obj + timedelta(days=future_days)).strftime("%Y%m%d")
+    return start_date, end_date
+
+def check_symbol(symbol: str) -> None:
+    if not series_store.is_valid_symbol(symbol):
+        raise HTTPException(status_code=400, detail="股票代码格式错误，应为6位数字")
+
+def check_window_unit(unit: str) -> None:
+    if unit not in WINDOW_UNITS:
+        raise HTTPException(status_code=400, detail="unit参数错误，可选值为days或bars")
+
+def check_period(period: str, max_points: Optional[int] = None) -> None:
+    if period not in resample.PERIODS:
+        raise HTTPException(status_code=400, detail="period参数错误，可选值为daily、weekly或monthly")
+    if max_points is not None and not resample.MIN_POINTS <= max_points <= resample.MAX_POINTS:
+        raise HTTPException(status_code=400,
+                            detail=f"max_points参数错误，范围为{resample.MIN_POINTS}到{resample.MAX_POINTS}")
+
+def request_window(dividing_date_obj: datetime, historical_days: int, future_days: int,
+                   unit: str, period: str):
+    """请求的起止日期（YYYYMMDD）和按根数切片的长度
+
+    周线、月线按根数（unit=bars）时在聚合后的序列上按位置切片，返回(historical_days, future_days)；
+    起止日期按每个周期的自然日数估算，只用于加载日线和没有完整序列时的备选数据。
+    """
+    if period == 'daily' or unit == 'days':
+        start_date, end_date = window_dates(dividing_date_obj, historical_days, future_days, unit)
+        return start_date, end_date, None
+    span = resample.PERIOD_DAYS[period]
+    start_date, end_date = window_dates(dividing_date_obj, historical_days * span, future_days * span)
+    return start_date, end_date, (historical_days, future_days)
+
+def parse_indicators(value: Optional[str]) -> List[indicator_registry.Spec]:
+    """解析indicators参数，错误时返回400"""
     try:
-        start_date_obj = datetime.strptime(start_date, "%Y%m%d")
-        end_date_obj = datetime.strptime(end_date, "%Y%m%d")
-        
-        # 生成日期范围
-        dates = pd.date_range(start=start_date_obj, end=end_date_obj, freq='D')
-        data = []
-        
-        # 基础价格设置（基于股票代码生成不同的基础价格）
-        base_price = 10.0 + (int(symbol[-3:]) % 100) / 10  # 基于股票代码生成不同价格
-        
-        for i, date in enumerate(dates):
-            # 模拟价格波动
-            volatility = 0.02 + (int(symbol[-2:]) % 10) / 1000  # 2-3%波动率
-            
-            # 生成随机但相对稳定的价格序列
-            if i == 0:
-                open_price = base_price
-            else:
-                open_price = data[i-1]['close'] * (1 + (volatility * (i % 5 - 2) / 100))
-            
-            close_price = open_price * (1 + (volatility * (i % 7 - 3) / 100))
-            high_price = max(open_price, close_price) * (1 + volatility / 4)
-            low_price = min(open_price, close_price) * (1 - volatility / 4)
-            volume = 1000000 + abs(i % 20 - 10) * 100000  # 模拟成交量波动
-            
-            data.append({
-                'date': date,
-                'open': round(open_price, 2),
-                'high': round(high_price, 2),
-                'low': round(low_price, 2),
-                'close': round(close_price, 2),
-                'volume': volume
-            })
-        
-        df = pd.DataFrame(data)
-        return df
+        return indicator_registry.parse(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"indicators参数错误: {e}")
+
+def stock_cache_key(symbol: str, dividing_date: str, historical_days: int, future_days: int,
+                    response_format: str, media_type: str, unit: str = 'days',
+                    specs: Optional[List[indicator_registry.Spec]] = None,
+                    period: str = 'daily', max_points: Optional[int] = None) -> str:
+    """生成股票窗口的缓存键"""
+    cache_key = f"stock:{symbol}:{dividing_date}:{historical_days}:{future_days}"
+    if unit != 'days':
+        cache_key = f"{cache_key}:{unit}"
+    if period != 'daily':
+        cache_key = f"{cache_key}:{period}"
+    if max_points is not None:
+        cache_key = f"{cache_key}:max{max_points}"
+    if specs is not None and not indicator_registry.is_default(specs):
+        cache_key = f"{cache_key}:{indicator_registry.canonical(specs)}"
+    if response_format != 'rows' or media_type != serializer.JSON_MEDIA_TYPE:
+        cache_key = f"{cache_key}:{response_format}:{media_type}"
+    return cache_key
+
+async def load_stock_window(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """获取日期范围内带技术指标的日线"""
+    
+    # 获取股票数据
+    stock_data = await fetch_stock_data_from_akshare(symbol, start_date, end_date)
+    
+    if stock_data.empty:
+        raise HTTPException(status_code=404, detail="未找到指定日期范围内的股票数据")
+    
+    # 备选数据没有经过序列缓存，需要单独计算技术指标
+    if 'mavol5' not in stock_data.columns:
+        metrics.FALLBACK_TOTAL.only.inc()
+        start = time.perf_counter()
+        stock_data = calculate_kdj(stock_data)
+        stock_data = calculate_volume_ma(stock_data)
+        metrics.observe_stage('indicators', time.perf_counter() - start)
+    return stock_data
+
+def window_origin(symbol: str, window: pd.DataFrame) -> Optional[tuple]:
+    """窗口来自缓存的完整序列时返回(序列, 窗口起始位置, 序列的指标缓存)，否则（备选数据）返回None"""
+    series = series_cache.get(symbol)
+    if series is None or window.empty:
+        return None
+    start = int(window.index[0])
+    if 0 <= start < len(series) and series['date'].iloc[start] == window['date'].iloc[0]:
+        return series, start, series_cache.derived(symbol, series)
+    return None
+
+async def load_view(symbol: str, dividing_date: str, start_date: str, end_date: str,
+                    period: str = 'daily', bars: Optional[tuple] = None):
+    """加载请求周期的窗口，返回(窗口, 来源)，来源的格式同window_origin
+
+    周线、月线在完整日线序列聚合后的周期序列上切片，指标在周期序列上计算；
+    周期的日期为最后一个交易日，包含分界日期的周期属于未来数据。
+    """
+    window = await load_stock_window(symbol, start_date, end_date)
+    origin = window_origin(symbol, window)
+    if period == 'daily':
+        return window, origin
+    
+    start = time.perf_counter()
+    if origin is None:
+        # 备选数据只有窗口内的日线，在窗口内聚合并计算指标
+        frame = calculate_volume_ma(calculate_kdj(resample.resample_bars(window, period)))
+        dates = frame['date'].to_numpy().astype('datetime64[D]')
+        store = {}
+    else:
+        frame, dates, store = resample.period_series(origin[0], period, origin[2])
+    metrics.observe_stage('indicators', time.perf_counter() - start)
+    
+    if bars is not None:
+        split = int(dates.searchsorted(np.datetime64(dividing_date, 'D')))
+        lo, hi = max(0, split - bars[0]), split + bars[1]
+    else:
+        lo = int(dates.searchsorted(np.datetime64(datetime.strptime(start_date, "%Y%m%d").date(), 'D')))
+        hi = int(dates.searchsorted(np.datetime64(datetime.strptime(end_date, "%Y%m%d").date(), 'D'),
+                                    side='right'))
+    view = frame.iloc[lo:hi]
+    if view.empty:
+        raise HTTPException(status_code=404, detail="未找到指定日期范围内的股票数据")
+    return view, (frame, lo, store)
+
+def add_indicators(window: pd.DataFrame, origin: Optional[tuple],
+                   specs: List[indicator_registry.Spec]) -> pd.DataFrame:
+    """为窗口添加选择的指标：在完整序列上计算并缓存在序列条目中，再按窗口切片"""
+    if indicator_registry.is_default(specs):
+        # 默认的KDJ和成交量均线已随序列计算
+        return window
+    start = time.perf_counter()
+    if origin is not None:
+        series, offset, store = origin
+        columns = indicator_registry.compute(series, specs, store)
+        columns = {name: values[offset:offset + len(window)] for name, values in columns.items()}
+    else:
+        columns = indicator_registry.compute(window, specs)
+    metrics.observe_stage('indicators', time.perf_counter() - start)
+    return window.assign(**columns)
+
+async def build_stock_payload(
+    symbol: str,
+    dividing_date: str,
+    start_date: str,
+    end_date: str,
+    response_format: str,
+    media_type: str,
+    specs: Optional[List[indicator_registry.Spec]] = None,
+    period: str = 'daily',
+    bars: Optional[tuple] = None,
+    max_points: Optional[int] = None
+) -> bytes:
+    """生成股票数据响应体（已编码）"""
+    specs = specs or indicator_registry.DEFAULT_SPECS
+    stock_data = add_indicators(*await load_view(symbol, dividing_date, start_date, end_date, period, bars), specs)
+    
+    # 获取股票名称（从股票目录中查找）；首次请求加载目录的耗时不计入serialize阶段
+    stock_name = (await current_symbol_index()).name_of(symbol) or symbol
+    
+    start = time.perf_counter()
+    # 按分界日期分割数据（窗口按日期升序）
+    split = stock_data['date'].searchsorted(pd.Timestamp(dividing_date))
+    if max_points is not None:
+        # 合并相邻日线，响应的日线数不超过max_points
+        stock_data, split = resample.downsample(stock_data, split, max_points)
+    historical_data = stock_data.iloc[:split]
+    future_data = stock_data.iloc[split:]
+    
+    format_data = serializer.formatter_for(response_format, indicator_registry.layout(specs))
+    
+    response_data = {
+        'symbol': symbol,
+        'name': stock_name,
+        'dividing_date': dividing_date,
+        'historical_data': format_data(historical_data),
+        'future_data': format_data(future_data)
+    }
+    
+    # 只编码一次，缓存和响应共用同一份字节
+    payload = serializer.encode(response_data, media_type)
+    metrics.observe_stage('serialize', time.perf_counter() - start)
+    return payload
+
+@app.get("/api/stock/search")
+async def search_stock(query: str = '', limit: int = 20):
+    """搜索股票（按代码、名称、拼音首字母匹配）"""
+    try:
+        if query.strip():
+            matches = (await current_symbol_index()).search(query, limit=min(max(limit, 1), 50))
+            result = [{'symbol': stock['symbol'], 'name': stock['name']} for stock in matches]
+        else:
+            result = symbols.popular_stocks(limit=20)
         
+        return JSONResponse(content={'stocks': result})
+    
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"生成备选数据失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"搜索股票失败: {str(e)}")
+
+@app.post("/api/stock/batch")
+async def get_stock_data_batch(request: BatchRequest):
+    """批量获取多个股票/分界日期的数据，同一股票只加载一次序列，单项失败不影响其他项"""
+    request_start = time.perf_counter()
+    timing = metrics.RequestTiming()
+    metrics.current_timing.set(timing)
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多请求{BATCH_MAX_ITEMS}项")
+    if request.format not in serializer.RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail="format参数错误，可选值为rows或columnar")
+    media_type = serializer.JSON_MEDIA_TYPE
+    
+    results: List[Optional[bytes]] = [None] * len(request.items)
+    loaders = {}
+    keys = []
+    for i, item in enumerate(request.items):
+        if not series_store.is_valid_symbol(item.symbol):
+            results[i] = batch_error(400, "股票代码格式错误，应为6位数字")
+            keys.append(None)
+            continue
+        try:
+            dividing_date_obj = datetime.strptime(item.dividing_date, "%Y-%m-%d")
+        except ValueError:
+            results[i] = batch_error(400, "日期格式错误，请使用YYYY-MM-DD格式")
+            keys.append(None)
+            continue
+        if item.unit not in WINDOW_UNITS:
+            results[i] = batch_error(400, "unit参数错误，可选值为days或bars")
+            keys.append(None)
+            continue
+        try:
+            specs = parse_indicators(item.indicators)
+            check_period(item.period, item.max_points)
+        except HTTPException as e:
+            results[i] = batch_error(e.status_code, e.detail)
+            keys.append(None)
+            continue
+        start_date, end_date, bars = request_window(dividing_date_obj, item.historical_days, item.future_days,
+                                                    item.unit, item.period)
+        key = stock_cache_key(item.symbol, item.dividing_date, item.historical_days, item.future_days,
+                              request.format, media_type, item.unit, specs, item.period, item.max_points)
+        loaders[key] = partial(build_stock_payload, item.symbol, item.dividing_date, start_date, end_date,
+                               request.format, media_type, specs, item.period, bars, item.max_points)
+        keys.append(key)
+    
+    # 一次批量查找缓存（L2使用MGET）
+    cached = await response_cache.get_many(loaders)
+    
+    # 未命中的项按股票分组，每只股票的序列只加载一次，不同股票并发加载
+    missing: Dict[str, List[str]] = {}
+    for item, key in zip(request.items, keys):
+        if key is not None and cached.get(key) is None and key not in missing.get(item.symbol, []):
+            missing.setdefault(item.symbol, []).append(key)
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    built: Dict[str, bytes] = {}
+    errors: Dict[str, bytes] = {}
+    
+    async def load_symbol(symbol: str, symbol_keys: List[str]):
+        async with semaphore:
+            try:
+                await get_symbol_series(symbol)
+            except Exception:
+                # 序列加载失败时各项走备选数据路径
+                pass
+            for key in symbol_keys:
+                try:
+                    built[key] = await loaders[key]()
+                except HTTPException as e:
+                    errors[key] = batch_error(e.status_code, e.detail)
+                except Exception as e:
+                    errors[key] = batch_error(500, f"获取股票数据失败: {str(e)}")
+    
+    await asyncio.gather(*(load_symbol(symbol, symbol_keys) for symbol, symbol_keys in missing.items()))
+    
+    # 新生成的结果批量写入缓存（L2使用流水线）
+    await response_cache.set_many(built)
+    
+    for i, key in enumerate(keys):
+        if key is None:
+            continue
+        payload = cached.get(key) or built.get(key)
+        results[i] = b'{"status":200,"data":' + payload + b'}' if payload is not None else errors[key]
+    
+    # 各项响应体已编码，直接拼接，避免重复解析和编码
+    return Response(content=b'{"results":[' + b','.join(results) + b']}', media_type=media_type, headers={
+        'Server-Timing': timing.server_timing(time.perf_counter() - request_start),
+        'Timing-Allow-Origin': '*',
+    })
+
+def batch_error(status_code: int, detail: str) -> bytes:
+    """批量请求中单项的错误结果"""
+    return serializer.encode({'status': status_code, 'error': detail})
 
 @app.get("/api/stock/{symbol}")
 async def get_stock_data(
+    request: Request,
     symbol: str,
     dividing_date: str,
     historical_days: int = 180,
-    future_days: int = 90
+    future_days: int = 90,
+    unit: str = 'days',
+    indicator_selection: Optional[str] = Query(None, alias='indicators'),
+    period: str = 'daily',
+    max_points: Optional[int] = None,
+    response_format: str = Query('rows', alias='format'),
+    profile: bool = False
 ):
-    """获取股票数据，按分界日期分割为历史数据和未来数据"""
+    """获取股票数据，按分界日期分割为历史数据和未来数据
+
+    unit=bars 时historical_days和future_days按交易日计算，窗口的日线数固定（停牌日除外）。
+    indicators选择输出的指标，如 kdj,macd(12,26,9)，默认为KDJ和成交量均线（见indicator_registry模块）。
+    period=weekly/monthly 返回周线、月线（指标在周期序列上计算）；max_points限制返回的日线数，
+    超过时合并相邻日线（见resample模块）。
+    响应带ETag和Cache-Control，If-None-Match匹配时返回304；较大的响应按Accept-Encoding压缩（见http_cache模块）。
+    format=columnar 时每个字段返回一个数组；Accept为application/msgpack时使用MessagePack编码。
+    响应头Server-Timing包含缓存查找结果和各阶段耗时；管理员可用profile=1获取本次请求的性能分析。
+    """
+    request_start = time.perf_counter()
+    timing = metrics.RequestTiming()
+    metrics.current_timing.set(timing)
+    # 请求头直接读取而不声明为Header参数：FastAPI每个请求逐个校验声明的参数，热点接口上开销可观
+    headers = request.headers
+    check_symbol(symbol)
     
     # 验证日期格式
     try:
@@ -271,273 +743,310 @@ async def get_stock_data(
     except ValueError:
         raise HTTPException(status_code=400, detail="日期格式错误，请使用YYYY-MM-DD格式")
     
+    if response_format not in serializer.RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail="format参数错误，可选值为rows或columnar")
+    check_window_unit(unit)
+    check_period(period, max_points)
+    specs = parse_indicators(indicator_selection)
+    media_type = serializer.negotiate(headers.get('accept'))
+    
     # 计算日期范围
-    start_date = (dividing_date_obj - timedelta(days=historical_days)).strftime("%Y%m%d")
-    end_date = (dividing_date_obj + timedelta(days=future_days)).strftime("%Y%m%d")
+    start_date, end_date, bars = request_window(dividing_date_obj, historical_days, future_days, unit, period)
     
     # 生成缓存键
-    cache_key = f"stock:{symbol}:{dividing_date}:{historical_days}:{future_days}"
+    cache_key = stock_cache_key(symbol, dividing_date, historical_days, future_days, response_format, media_type,
+                                unit, specs, period, max_points)
     
-    # 尝试从缓存获取数据
-    cached_data = await get_cached_data(cache_key)
-    if cached_data:
-        return JSONResponse(content=cached_data)
+    build = partial(build_stock_payload, symbol, dividing_date, start_date, end_date, response_format, media_type,
+                    specs, period, bars, max_points)
     
-    # 获取股票数据
-    stock_data = await fetch_stock_data_from_akshare(symbol, start_date, end_date)
+    if profile:
+        require_admin(headers.get('x-admin-token'))
+        return await profile_request(build, timing, request_start)
     
-    if stock_data.empty:
-        raise HTTPException(status_code=404, detail="未找到指定日期范围内的股票数据")
+    # 依次查找L1、L2缓存，未命中时生成响应；过期的缓存先返回再后台刷新
+    payload = await get_cached_data(cache_key, build)
     
-    # 按分界日期分割数据
-    dividing_date_pd = pd.to_datetime(dividing_date)
-    historical_data = stock_data[stock_data['date'] < dividing_date_pd]
-    future_data = stock_data[stock_data['date'] >= dividing_date_pd]
-    
-    # 计算技术指标
-    if not historical_data.empty:
-        historical_data = calculate_kdj(historical_data)
-        historical_data = calculate_volume_ma(historical_data)
-    
-    if not future_data.empty:
-        future_data = calculate_kdj(future_data)
-        future_data = calculate_volume_ma(future_data)
-    
-    # 转换为响应格式
-    def format_data(df: pd.DataFrame) -> List[dict]:
-        result = []
-        for _, row in df.iterrows():
-            item = {
-                'date': row['date'].strftime('%Y-%m-%d'),
-                'open': float(row['open']),
-                'high': float(row['high']),
-                'low': float(row['low']),
-                'close': float(row['close']),
-                'volume': float(row['volume'])
-            }
-            
-            # 添加KDJ指标
-            if 'kdj_k' in row and not pd.isna(row['kdj_k']):
-                item['kdj'] = {
-                    'k': float(row['kdj_k']),
-                    'd': float(row['kdj_d']),
-                    'j': float(row['kdj_j'])
-                }
-            
-            # 添加成交量移动平均
-            for period in [5, 10, 100]:
-                col_name = f'mavol{period}'
-                if col_name in row and not pd.isna(row[col_name]):
-                    item[col_name] = float(row[col_name])
-            
-            result.append(item)
-        
-        return result
+    # 带ETag和Cache-Control，条件请求匹配时返回304，较大的响应按Accept-Encoding压缩；
+    # 备选的模拟数据不是真实行情，不允许浏览器和CDN保存
+    response = http_cache.respond(cache_key, payload, media_type, window_is_live(end_date),
+                                  headers.get('if-none-match'), headers.get('accept-encoding'),
+                                  {'Timing-Allow-Origin': '*'}, cacheable=symbol not in fallback_symbols)
+    response.headers['Server-Timing'] = timing.server_timing(time.perf_counter() - request_start)
+    return response
+
+def window_is_live(end_date: str) -> bool:
+    """窗口是否包含最近一次收盘之后的交易日，这样的窗口在收盘后会出现新数据"""
+    # YYYYMMDD字符串的大小顺序与日期一致
+    return end_date >= series_store.last_market_close().strftime("%Y%m%d")
+
+@app.get("/api/stock/{symbol}/replay")
+async def replay_stock_data(
+    symbol: str,
+    dividing_date: str,
+    historical_days: int = 180,
+    future_days: int = 90,
+    unit: str = 'days',
+    indicator_selection: Optional[str] = Query(None, alias='indicators'),
+    period: str = 'daily',
+    response_format: str = Query('rows', alias='format'),
+    batch: int = 1,
+    interval_ms: int = 0,
+    accept: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None)
+):
+    """逐K线回放：先发送全部历史数据，再每批batch根发送未来数据，批次之间间隔interval_ms毫秒
+
+    Accept为text/event-stream时输出Server-Sent Events，否则输出NDJSON。每根日线附带截至当天的
+    指标（indicators参数选择，默认KDJ和成交量均线）；SSE事件的id为已发送的未来日线数，断线重连时从该位置继续，不再重复历史数据。
+    """
+    request_start = time.perf_counter()
+    timing = metrics.RequestTiming()
+    metrics.current_timing.set(timing)
     
-    # 获取股票名称（从预定义列表中查找）
-    stock_name = symbol
-    stock_list = [
-        {'代码': '000001', '名称': '平安银行'},
-        {'代码': '000002', '名称': '万科A'},
-        {'代码': '000063', '名称': '中兴通讯'},
-        {'代码': '000100', '名称': 'TCL科技'},
-        {'代码': '000333', '名称': '美的集团'},
-        {'代码': '000651', '名称': '格力电器'},
-        {'代码': '000725', '名称': '京东方A'},
-        {'代码': '000858', '名称': '五粮液'},
-        {'代码': '000876', '名称': '新希望'},
-        {'代码': '000895', '名称': '双汇发展'},
-        {'代码': '000938', '名称': '紫光股份'},
-        {'代码': '002024', '名称': '苏宁易购'},
-        {'代码': '002027', '名称': '分众传媒'},
-        {'代码': '002142', '名称': '宁波银行'},
-        {'代码': '002230', '名称': '科大讯飞'},
-        {'代码': '002241', '名称': '歌尔股份'},
-        {'代码': '002415', '名称': '海康威视'},
-        {'代码': '002475', '名称': '立讯精密'},
-        {'代码': '002594', '名称': '比亚迪'},
-        {'代码': '002714', '名称': '牧原股份'},
-        {'代码': '300014', '名称': '亿纬锂能'},
-        {'代码': '300059', '名称': '东方财富'},
-        {'代码': '300122', '名称': '智飞生物'},
-        {'代码': '300142', '名称': '沃森生物'},
-        {'代码': '300750', '名称': '宁德时代'},
-        {'代码': '600000', '名称': '浦发银行'},
-        {'代码': '600009', '名称': '上海机场'},
-        {'代码': '600010', '名称': '包钢股份'},
-        {'代码': '600016', '名称': '民生银行'},
-        {'代码': '600030', '名称': '中信证券'},
-        {'代码': '600036', '名称': '招商银行'},
-        {'代码': '600050', '名称': '中国联通'},
-        {'代码': '600104', '名称': '上汽集团'},
-        {'代码': '600111', '名称': '北方稀土'},
-        {'代码': '600196', '名称': '复星医药'},
-        {'代码': '600276', '名称': '恒瑞医药'},
-        {'代码': '600309', '名称': '万华化学'},
-        {'代码': '600519', '名称': '贵州茅台'},
-        {'代码': '600570', '名称': '恒生电子'},
-        {'代码': '600585', '名称': '海螺水泥'},
-        {'代码': '600588', '名称': '用友网络'},
-        {'代码': '600690', '名称': '海尔智家'},
-        {'代码': '600703', '名称': '三安光电'},
-        {'代码': '600745', '名称': '闻泰科技'},
-        {'代码': '600809', '名称': '山西汾酒'},
-        {'代码': '600837', '名称': '海通证券'},
-        {'代码': '600887', '名称': '伊利股份'},
-        {'代码': '601012', '名称': '隆基绿能'},
-        {'代码': '601066', '名称': '中信建投'},
-        {'代码': '601088', '名称': '中国神华'},
-        {'代码': '601138', '名称': '工业富联'},
-        {'代码': '601166', '名称': '兴业银行'},
-        {'代码': '601169', '名称': '北京银行'},
-        {'代码': '601186', '名称': '中国铁建'},
-        {'代码': '601211', '名称': '国泰君安'},
-        {'代码': '601288', '名称': '农业银行'},
-        {'代码': '601318', '名称': '中国平安'},
-        {'代码': '601328', '名称': '交通银行'},
-        {'代码': '601398', '名称': '工商银行'},
-        {'代码': '601601', '名称': '中国太保'},
-        {'代码': '601628', '名称': '中国人寿'},
-        {'代码': '601668', '名称': '中国建筑'},
-        {'代码': '601688', '名称': '华泰证券'},
-        {'代码': '601766', '名称': '中国中车'},
-        {'代码': '601800', '名称': '中国交建'},
-        {'代码': '601818', '名称': '光大银行'},
-        {'代码': '601857', '名称': '中国石油'},
-        {'代码': '601888', '名称': '中国中免'},
-        {'代码': '601919', '名称': '中远海控'},
-        {'代码': '601988', '名称': '中国银行'},
-        {'代码': '601989', '名称': '中国重工'},
-        {'代码': '603259', '名称': '药明康德'},
-        {'代码': '603993', '名称': '洛阳钼业'}
-    ]
-    
-    for stock in stock_list:
-        if stock['代码'] == symbol:
-            stock_name = stock['名称']
-            break
+    check_symbol(symbol)
+    try:
+        dividing_date_obj = datetime.strptime(dividing_date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式错误，请使用YYYY-MM-DD格式")
+    if response_format not in serializer.RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail="format参数错误，可选值为rows或columnar")
+    check_window_unit(unit)
+    check_period(period)
+    specs = parse_indicators(indicator_selection)
+    if not 1 <= batch <= REPLAY_MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"batch参数错误，范围为1到{REPLAY_MAX_BATCH}")
+    if not 0 <= interval_ms <= REPLAY_MAX_INTERVAL_MS:
+        raise HTTPException(status_code=400, detail=f"interval_ms参数错误，范围为0到{REPLAY_MAX_INTERVAL_MS}")
+    media_type = serializer.negotiate_stream(accept)
     
-    response_data = {
-        'symbol': symbol,
-        'name': stock_name,
-        'dividing_date': dividing_date,
-        'historical_data': format_data(historical_data) if not historical_data.empty else [],
-        'future_data': format_data(future_data) if not future_data.empty else []
-    }
+    # 响应头发出前加载完窗口，数据不存在等错误仍能返回对应的状态码
+    start_date, end_date, bars = request_window(dividing_date_obj, historical_days, future_days, unit, period)
+    stock_data = add_indicators(*await load_view(symbol, dividing_date, start_date, end_date, period, bars), specs)
+    split = int(stock_data['date'].searchsorted(pd.Timestamp(dividing_date_obj)))
     
-    # 缓存数据
-    await set_cached_data(cache_key, response_data)
+    resume_from = 0
+    if media_type == serializer.EVENT_STREAM_MEDIA_TYPE and last_event_id and last_event_id.isdigit():
+        resume_from = min(int(last_event_id), len(stock_data) - split)
     
-    return JSONResponse(content=response_data)
+    events = replay_events(symbol, dividing_date, stock_data, split, resume_from, batch,
+                           interval_ms / 1000, serializer.formatter_for(response_format, indicator_registry.layout(specs)),
+                           media_type)
+    return StreamingResponse(events, media_type=media_type, headers={
+        'Cache-Control': 'no-cache',
+        # 禁止反向代理缓冲，每批日线到达后立即转发
+        'X-Accel-Buffering': 'no',
+        'Server-Timing': timing.server_timing(time.perf_counter() - request_start),
+        'Timing-Allow-Origin': '*',
+    })
 
-@app.get("/api/stock/search")
-async def search_stock(query: str):
-    """搜索股票"""
+async def replay_events(symbol: str, dividing_date: str, stock_data: pd.DataFrame, split: int,
+                        resume_from: int, batch: int, interval: float, format_data, media_type: str):
+    """生成回放事件：history（历史数据）、bars（一批未来日线，offset为其在未来数据中的位置）、end"""
+    future_data = stock_data.iloc[split:]
+    total = len(future_data)
+    if resume_from == 0:
+        yield serializer.encode_event('history', {
+            'symbol': symbol,
+            'name': (await current_symbol_index()).name_of(symbol) or symbol,
+            'dividing_date': dividing_date,
+            'future_total': total,
+            'historical_data': format_data(stock_data.iloc[:split]),
+        }, media_type, event_id=0)
+    
+    for offset in range(resume_from, total, batch):
+        # 没有间隔时也让出事件循环，长回放不阻塞其他请求
+        await asyncio.sleep(interval)
+        chunk = future_data.iloc[offset:offset + batch]
+        yield serializer.encode_event('bars', {'offset': offset, 'bars': format_data(chunk)},
+                                      media_type, event_id=offset + len(chunk))
+    yield serializer.encode_event('end', {'future_total': total}, media_type)
+
+@app.websocket("/ws/practice/{symbol}")
+async def practice_session(
+    websocket: WebSocket,
+    symbol: str,
+    dividing_date: str,
+    historical_days: int = 180,
+    future_days: int = 90,
+    unit: str = 'days'
+):
+    """练习会话：连接后发送历史数据，之后按advance/rewind/jump消息返回新显示的日线（见practice模块）"""
+    if practice.active_sessions >= practice.PRACTICE_MAX_SESSIONS:
+        await websocket.close(code=1013)
+        return
+    if not series_store.is_valid_symbol(symbol):
+        await websocket.close(code=1008, reason="股票代码格式错误，应为6位数字")
+        return
     try:
-        # 预定义一些热门A股股票，包含更多股票
-        stock_list = [
-            {'代码': '000001', '名称': '平安银行', '交易所': 'SZ'},
-            {'代码': '000002', '名称': '万科A', '交易所': 'SZ'},
-            {'代码': '000063', '名称': '中兴通讯', '交易所': 'SZ'},
-            {'代码': '000100', '名称': 'TCL科技', '交易所': 'SZ'},
-            {'代码': '000333', '名称': '美的集团', '交易所': 'SZ'},
-            {'代码': '000651', '名称': '格力电器', '交易所': 'SZ'},
-            {'代码': '000725', '名称': '京东方A', '交易所': 'SZ'},
-            {'代码': '000858', '名称': '五粮液', '交易所': 'SZ'},
-            {'代码': '000876', '名称': '新希望', '交易所': 'SZ'},
-            {'代码': '000895', '名称': '双汇发展', '交易所': 'SZ'},
-            {'代码': '000938', '名称': '紫光股份', '交易所': 'SZ'},
-            {'代码': '002024', '名称': '苏宁易购', '交易所': 'SZ'},
-            {'代码': '002027', '名称': '分众传媒', '交易所': 'SZ'},
-            {'代码': '002142', '名称': '宁波银行', '交易所': 'SZ'},
-            {'代码': '002230', '名称': '科大讯飞', '交易所': 'SZ'},
-            {'代码': '002241', '名称': '歌尔股份', '交易所': 'SZ'},
-            {'代码': '002415', '名称': '海康威视', '交易所': 'SZ'},
-            {'代码': '002475', '名称': '立讯精密', '交易所': 'SZ'},
-            {'代码': '002594', '名称': '比亚迪', '交易所': 'SZ'},
-            {'代码': '002714', '名称': '牧原股份', '交易所': 'SZ'},
-            {'代码': '300014', '名称': '亿纬锂能', '交易所': 'SZ'},
-            {'代码': '300059', '名称': '东方财富', '交易所': 'SZ'},
-            {'代码': '300122', '名称': '智飞生物', '交易所': 'SZ'},
-            {'代码': '300142', '名称': '沃森生物', '交易所': 'SZ'},
-            {'代码': '300750', '名称': '宁德时代', '交易所': 'SZ'},
-            {'代码': '600000', '名称': '浦发银行', '交易所': 'SS'},
-            {'代码': '600009', '名称': '上海机场', '交易所': 'SS'},
-            {'代码': '600010', '名称': '包钢股份', '交易所': 'SS'},
-            {'代码': '600016', '名称': '民生银行', '交易所': 'SS'},
-            {'代码': '600030', '名称': '中信证券', '交易所': 'SS'},
-            {'代码': '600036', '名称': '招商银行', '交易所': 'SS'},
-            {'代码': '600050', '名称': '中国联通', '交易所': 'SS'},
-            {'代码': '600104', '名称': '上汽集团', '交易所': 'SS'},
-            {'代码': '600111', '名称': '北方稀土', '交易所': 'SS'},
-            {'代码': '600196', '名称': '复星医药', '交易所': 'SS'},
-            {'代码': '600276', '名称': '恒瑞医药', '交易所': 'SS'},
-            {'代码': '600309', '名称': '万华化学', '交易所': 'SS'},
-            {'代码': '600519', '名称': '贵州茅台', '交易所': 'SS'},
-            {'代码': '600570', '名称': '恒生电子', '交易所': 'SS'},
-            {'代码': '600585', '名称': '海螺水泥', '交易所': 'SS'},
-            {'代码': '600588', '名称': '用友网络', '交易所': 'SS'},
-            {'代码': '600690', '名称': '海尔智家', '交易所': 'SS'},
-            {'代码': '600703', '名称': '三安光电', '交易所': 'SS'},
-            {'代码': '600745', '名称': '闻泰科技', '交易所': 'SS'},
-            {'代码': '600809', '名称': '山西汾酒', '交易所': 'SS'},
-            {'代码': '600837', '名称': '海通证券', '交易所': 'SS'},
-            {'代码': '600887', '名称': '伊利股份', '交易所': 'SS'},
-            {'代码': '601012', '名称': '隆基绿能', '交易所': 'SS'},
-            {'代码': '601066', '名称': '中信建投', '交易所': 'SS'},
-            {'代码': '601088', '名称': '中国神华', '交易所': 'SS'},
-            {'代码': '601138', '名称': '工业富联', '交易所': 'SS'},
-            {'代码': '601166', '名称': '兴业银行', '交易所': 'SS'},
-            {'代码': '601169', '名称': '北京银行', '交易所': 'SS'},
-            {'代码': '601186', '名称': '中国铁建', '交易所': 'SS'},
-            {'代码': '601211', '名称': '国泰君安', '交易所': 'SS'},
-            {'代码': '601288', '名称': '农业银行', '交易所': 'SS'},
-            {'代码': '601318', '名称': '中国平安', '交易所': 'SS'},
-            {'代码': '601328', '名称': '交通银行', '交易所': 'SS'},
-            {'代码': '601398', '名称': '工商银行', '交易所': 'SS'},
-            {'代码': '601601', '名称': '中国太保', '交易所': 'SS'},
-            {'代码': '601628', '名称': '中国人寿', '交易所': 'SS'},
-            {'代码': '601668', '名称': '中国建筑', '交易所': 'SS'},
-            {'代码': '601688', '名称': '华泰证券', '交易所': 'SS'},
-            {'代码': '601766', '名称': '中国中车', '交易所': 'SS'},
-            {'代码': '601800', '名称': '中国交建', '交易所': 'SS'},
-            {'代码': '601818', '名称': '光大银行', '交易所': 'SS'},
-            {'代码': '601857', '名称': '中国石油', '交易所': 'SS'},
-            {'代码': '601888', '名称': '中国中免', '交易所': 'SS'},
-            {'代码': '601919', '名称': '中远海控', '交易所': 'SS'},
-            {'代码': '601988', '名称': '中国银行', '交易所': 'SS'},
-            {'代码': '601989', '名称': '中国重工', '交易所': 'SS'},
-            {'代码': '603259', '名称': '药明康德', '交易所': 'SS'},
-            {'代码': '603993', '名称': '洛阳钼业', '交易所': 'SS'}
-        ]
-        
-        # 根据查询条件筛选
-        if query:
-            filtered_stocks = []
-            for stock in stock_list:
-                if (query.lower() in stock['名称'].lower() or 
-                    query in stock['代码'] or
-                    query.lower() in stock['名称'].lower().replace('A', '')):
-                    filtered_stocks.append(stock)
-            stock_list = filtered_stocks
+        dividing_date_obj = datetime.strptime(dividing_date, "%Y-%m-%d")
+    except ValueError:
+        await websocket.close(code=1008, reason="日期格式错误，请使用YYYY-MM-DD格式")
+        return
+    if unit not in WINDOW_UNITS:
+        await websocket.close(code=1008, reason="unit参数错误，可选值为days或bars")
+        return
+    
+    await websocket.accept()
+    practice.active_sessions += 1
+    try:
+        start_date, end_date = window_dates(dividing_date_obj, historical_days, future_days, unit)
+        try:
+            session = await open_practice_session(symbol, dividing_date_obj, start_date, end_date)
+        except HTTPException as e:
+            await websocket.send_text(serializer.encode(practice.error_message(e.detail, e.status_code)).decode())
+            await websocket.close()
+            return
         
-        # 转换为响应格式
-        result = []
-        for stock in stock_list[:20]:  # 限制返回数量
-            result.append({
-                'symbol': stock['代码'],
-                'name': stock['名称']
-            })
+        arrays = session.stream.arrays
+        await websocket.send_text(serializer.encode({
+            'type': 'init',
+            'symbol': symbol,
+            'name': (await current_symbol_index()).name_of(symbol) or symbol,
+            'dividing_date': dividing_date,
+            'cursor': 0,
+            'future_total': session.future_total,
+            'historical_data': serializer.format_data(arrays.frame.iloc[session.start:session.split]),
+        }).decode())
         
-        return JSONResponse(content={'stocks': result})
+        while True:
+            text = await asyncio.wait_for(websocket.receive_text(), practice.PRACTICE_IDLE_TIMEOUT)
+            await websocket.send_text(serializer.encode(session.handle(text)).decode())
+    except asyncio.TimeoutError:
+        await websocket.close(code=1001)
+    except (WebSocketDisconnect, KeyError):
+        # KeyError: 客户端发送了二进制消息
+        pass
+    finally:
+        practice.active_sessions -= 1
+
+async def open_practice_session(symbol: str, dividing_date_obj: datetime,
+                                start_date: str, end_date: str) -> practice.PracticeSession:
+    """加载练习窗口；窗口来自缓存的完整序列时，会话共享该序列的数组，否则（备选数据）使用窗口自身"""
+    window = await load_stock_window(symbol, start_date, end_date)
+    origin = window_origin(symbol, window)
+    if origin is not None:
+        series, start, _ = origin
+        arrays = practice.shared_arrays(symbol, series)
+    else:
+        arrays = indicators.SeriesArrays(window.reset_index(drop=True))
+        start = 0
+    end = start + len(window)
+    split = start + int(window['date'].searchsorted(pd.Timestamp(dividing_date_obj)))
+    return practice.PracticeSession(arrays, start, split, end)
+
+def require_admin(token: Optional[str]):
+    """校验管理员令牌，未配置ADMIN_TOKEN时一律拒绝"""
+    if not ADMIN_TOKEN or not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+
+async def profile_request(build, timing: metrics.RequestTiming, request_start: float) -> Response:
+    """绕过缓存重新生成响应并用cProfile分析，返回按累计耗时排序的文本摘要
+
+    分析期间事件循环上其他请求的调用也会被计入；上游下载在线程池中执行，只体现为等待时间。
+    """
+    import cProfile
+    import pstats
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"搜索股票失败: {str(e)}")
+    timing.cache = 'bypass'
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        payload = await build()
+    finally:
+        profiler.disable()
+    
+    out = io.StringIO()
+    out.write(f"payload: {len(payload)} bytes\n\n")
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    return Response(content=out.getvalue(), media_type='text/plain', headers={
+        'Server-Timing': timing.server_timing(time.perf_counter() - request_start),
+        'Cache-Control': 'no-store',
+    })
+
+def cache_metrics() -> metrics.Snapshot:
+    """抓取时读取各级缓存的统计"""
+    stats = response_cache.stats()
+    redis_stats = stats['redis']
+    result = {}
+    result.update(metrics.sample_family(
+        'stockstudy_cache_lookups_total', 'counter', '响应缓存查找结果（stale为过期后先返回旧值）', {
+            'tier="l1",result="hit"': stats['l1_hits'],
+            'tier="l2",result="hit"': stats['l2_hits'],
+            'tier="all",result="miss"': stats['misses'],
+            'tier="all",result="stale"': stats['stale_hits'],
+        }))
+    result.update(metrics.sample_family(
+        'stockstudy_cache_refreshes_total', 'counter', '响应缓存后台刷新次数', {
+            'result="ok"': stats['refreshes'] - stats['refresh_errors'],
+            'result="error"': stats['refresh_errors'],
+        }))
+    result.update(metrics.sample_family(
+        'stockstudy_redis_operations_total', 'counter', 'Redis按键统计的读写结果', {
+            'result="hit"': redis_stats['hits'],
+            'result="miss"': redis_stats['misses'],
+            'result="error"': redis_stats['errors'],
+            'result="skipped"': redis_stats['skipped'],
+        }))
+    result.update(metrics.sample_family(
+        'stockstudy_cache_l1_bytes', 'gauge', 'L1响应缓存占用的字节数', {'': stats['l1_bytes']}))
+    result.update(metrics.sample_family(
+        'stockstudy_series_cache_symbols', 'gauge', '进程内缓存的完整序列数量', {'': len(series_cache)}))
+    result.update(metrics.sample_family(
+        'stockstudy_series_derived_bytes', 'gauge', '按请求计算的指标和周期序列等派生数据占用的字节数',
+        {'': series_cache.derived_cache.size_bytes}))
+    result.update(metrics.sample_family(
+        'stockstudy_fallback_symbols', 'gauge', '上游数据不可用、当前使用备选数据的股票数', {'': len(fallback_symbols)}))
+    return result
+
+metrics.register_collector(cache_metrics)
+
+def startup_metrics() -> metrics.Snapshot:
+    """启动耗时和依赖导入耗时，按worker进程区分（多worker汇总时不相加）"""
+    worker = f'worker="{os.getpid()}"'
+    phases = {'import': startup_state['import_seconds'], 'warmup': startup_state['warmup_seconds']}
+    phases.update(startup_state['steps'])
+    result = {}
+    result.update(metrics.sample_family(
+        'stockstudy_startup_seconds', 'gauge', '应用模块导入和启动预热各步骤的耗时', {
+            f'{worker},phase="{phase}"': seconds for phase, seconds in phases.items() if seconds is not None
+        }))
+    result.update(metrics.sample_family(
+        'stockstudy_module_import_seconds', 'gauge', '延迟导入的重型依赖的导入耗时', {
+            f'{worker},module="{name}"': seconds for name, seconds in lazy_imports.IMPORT_TIMES.items()
+        }))
+    result.update(metrics.sample_family(
+        'stockstudy_ready', 'gauge', '启动预热是否已完成', {worker: int(startup_state['status'] == 'ready')}))
+    return result
+
+metrics.register_collector(startup_metrics)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus格式的指标"""
+    return Response(content=metrics.exposition(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/api/health")
 async def health_check():
-    """健康检查"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    """存活检查：进程能处理请求即返回200，不等待预热"""
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "cache": response_cache.stats(),
+        "loop_lag": loop_lag_stats(),
+    }
+
+@app.get("/api/ready")
+async def readiness_check():
+    """就绪检查：启动预热完成前返回503，附带导入和预热耗时"""
+    ready = startup_state['status'] == 'ready'
+    return JSONResponse(status_code=200 if ready else 503, content={
+        **startup_state,
+        "imports": lazy_imports.IMPORT_TIMES,
+        "uptime_seconds": time.perf_counter() - _import_start,
+    })
+
+startup_state['import_seconds'] = time.perf_counter() - _import_start
 
 if __name__ == "__main__":
     import uvicorn
@@ -4,8 +4,6 @@ from fastapi.responses import JSONResponse
 from datetime import datetime, timedelta
 import akshare as ak
 import pandas as pd
-import redis
-import json
 
 app = FastAPI(title="股票趋势练习API", version="1.0.0")
 
@@ -18,12 +16,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Redis缓存配置
-import os
-redis_host = os.getenv('REDIS_HOST', 'localhost')
-redis_port = int(os.getenv('REDIS_PORT', '6379'))
-redis_client = redis.Redis(host=redis_host, port=redis_port, db=0, decode_responses=True)
-
 @app.get("/api/stock/{symbol}")
 async def get_stock_data(symbol: str, dividing_date: str, historical_days: int = 180, future_days: int = 90):
     """简化版股票数据接口，使用真实股票数据"""
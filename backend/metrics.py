@@ -0,0 +1,319 @@
+"""进程内指标，以Prometheus文本格式输出
+
+直方图、计数器和仪表按标签值预先创建，请求路径上只做下标查找和加法；
+缓存命中次数等已有的统计在抓取时由收集函数读取，不在请求路径上重复计数。
+
+多个uvicorn worker时设置METRICS_DIR，各worker定期把自己的指标快照写入该目录，
+/metrics 汇总目录中所有worker的快照，结果与抓取到哪个worker无关。
+
+单个请求的各阶段耗时和缓存命中层级记录在上下文变量中的RequestTiming里，
+用于生成Server-Timing响应头。
+"""
+import asyncio
+import contextvars
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# 延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 请求内部各阶段
+STAGES = ('upstream', 'indicators', 'serialize', 'cache_get', 'cache_set')
+
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# 快照格式：{指标名: {'type': 类型, 'help': 说明, 'samples': {样本名和标签: 值}}}
+Snapshot = Dict[str, dict]
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1) -> None:
+        self.value += amount
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def dec(self, amount=1) -> None:
+        self.value -= amount
+
+    def set(self, value) -> None:
+        self.value = value
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # 最后一个位置对应+Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Family:
+    """同名指标按一个标签区分的一组子指标"""
+
+    def __init__(self, name: str, kind: str, help_text: str, factory,
+                 label: Optional[str] = None, values: Iterable[str] = ()):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.label = label
+        self.factory = factory
+        self.children = {value: factory() for value in values} if label else {'': factory()}
+
+    def __getitem__(self, value: str):
+        child = self.children.get(value)
+        if child is None:
+            # 只有未预先创建的标签值在第一次出现时创建
+            child = self.children[value] = self.factory()
+        return child
+
+    @property
+    def only(self):
+        return self.children['']
+
+    def samples(self) -> Dict[str, float]:
+        samples = {}
+        for value, child in self.children.items():
+            labels = f'{self.label}="{value}"' if self.label else ''
+            if isinstance(child, Histogram):
+                cumulative = 0
+                for bound, count in zip(child.buckets + (float('inf'),), child.counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                    samples[f'{self.name}_bucket{{{_join(labels, le)}}}'] = cumulative
+                samples[f'{self.name}_sum{_braces(labels)}'] = child.sum
+                samples[f'{self.name}_count{_braces(labels)}'] = cumulative
+            else:
+                samples[f'{self.name}{_braces(labels)}'] = child.value
+        return samples
+
+
+def _join(*parts: str) -> str:
+    return ','.join(part for part in parts if part)
+
+
+def _braces(labels: str) -> str:
+    return f'{{{labels}}}' if labels else ''
+
+
+_families: List[Family] = []
+_collectors: List[Callable[[], Snapshot]] = []
+
+
+def _family(*args, **kwargs) -> Family:
+    family = Family(*args, **kwargs)
+    _families.append(family)
+    return family
+
+
+def register_collector(collector: Callable[[], Snapshot]) -> None:
+    """注册在抓取时调用的收集函数，返回与快照相同格式的指标"""
+    _collectors.append(collector)
+
+
+def sample_family(name: str, kind: str, help_text: str, samples: Dict[str, float]) -> Snapshot:
+    """收集函数使用的辅助函数，samples的键为标签字符串（如 tier="l1"），无标签时为空字符串"""
+    return {name: {'type': kind, 'help': help_text,
+                   'samples': {f'{name}{_braces(labels)}': value for labels, value in samples.items()}}}
+
+
+REQUEST_LATENCY = _family(
+    'stockstudy_http_request_duration_seconds', 'histogram', '按路由统计的请求耗时', Histogram, 'route'
+)
+RESPONSES = _family(
+    'stockstudy_http_responses_total', 'counter', '按状态码类别统计的响应数', Counter, 'status', STATUS_CLASSES
+)
+IN_FLIGHT = _family('stockstudy_http_requests_in_flight', 'gauge', '正在处理的请求数', Gauge)
+STAGE_LATENCY = _family(
+    'stockstudy_stage_duration_seconds', 'histogram', '请求内部各阶段的耗时', Histogram, 'stage', STAGES
+)
+UPSTREAM_CALLS = _family('stockstudy_upstream_calls_total', 'counter', '上游行情下载次数', Counter)
+UPSTREAM_FAILURES = _family('stockstudy_upstream_failures_total', 'counter', '上游行情下载失败次数', Counter)
+FALLBACK_TOTAL = _family('stockstudy_fallback_responses_total', 'counter', '使用备选模拟数据生成的响应数', Counter)
+
+
+class RequestTiming:
+    """单个请求的各阶段耗时（秒）和缓存查找结果"""
+    __slots__ = ('stages', 'cache')
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.cache: Optional[str] = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing响应头，dur单位为毫秒"""
+        parts = [f'cache;desc="{self.cache}"'] if self.cache else []
+        parts.extend(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in self.stages.items())
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+current_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar(
+    'current_timing', default=None
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """记录阶段耗时到直方图，并计入当前请求的耗时"""
+    STAGE_LATENCY[stage].observe(seconds)
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+def record_timing(stage: str, seconds: float) -> None:
+    """只计入当前请求的耗时（不属于指标中的阶段）"""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+def note_cache(result: str) -> None:
+    """记录当前请求的缓存查找结果：l1、l2、stale或miss"""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.cache = result
+
+
+def snapshot() -> Snapshot:
+    """当前进程的全部指标"""
+    result = {family.name: {'type': family.kind, 'help': family.help, 'samples': family.samples()}
+              for family in _families}
+    for collector in _collectors:
+        result.update(collector())
+    return result
+
+
+def merge(snapshots: Iterable[Snapshot]) -> Snapshot:
+    """按样本相加多个进程的快照"""
+    merged: Snapshot = {}
+    for item in snapshots:
+        for name, family in item.items():
+            target = merged.setdefault(name, {'type': family['type'], 'help': family['help'], 'samples': {}})
+            samples = target['samples']
+            for key, value in family['samples'].items():
+                samples[key] = samples.get(key, 0) + value
+    return merged
+
+
+def render(data: Snapshot) -> str:
+    lines = []
+    for name, family in data.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for key, value in family['samples'].items():
+            lines.append(f"{key} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f'worker-{pid}.json')
+
+
+def write_snapshot() -> None:
+    """写入当前worker的快照（原子替换）"""
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _other_snapshots() -> List[Snapshot]:
+    """其他worker最近写入的快照，长时间未更新的（已退出的worker）忽略"""
+    own = os.path.basename(_snapshot_path(os.getpid()))
+    max_age = max(30.0, METRICS_FLUSH_INTERVAL * 6)
+    now = time.time()
+    snapshots = []
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return snapshots
+    for name in names:
+        if name == own or not name.endswith('.json'):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def exposition() -> str:
+    """/metrics 的响应内容：本进程的实时指标加上其他worker的快照"""
+    if not METRICS_DIR:
+        return render(snapshot())
+    return render(merge([snapshot()] + _other_snapshots()))
+
+
+async def flush_forever() -> None:
+    """后台定期写入快照"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    while True:
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+
+
+class MetricsMiddleware:
+    """记录每个请求的路由耗时、状态码类别和正在处理的请求数"""
+
+    def __init__(self, app, route_paths: Callable[[], Dict[object, str]]):
+        self.app = app
+        self._route_paths = route_paths
+        self._routes: Optional[Dict[object, str]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        in_flight = IN_FLIGHT.only
+        in_flight.inc()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            if self._routes is None:
+                self._routes = self._route_paths()
+            route = self._routes.get(scope.get('endpoint'), 'other')
+            REQUEST_LATENCY[route].observe(time.perf_counter() - start)
+            RESPONSES[STATUS_CLASSES[min(max(status // 100, 1), 5) - 1]].inc()
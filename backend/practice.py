@@ -0,0 +1,155 @@
+"""WebSocket练习会话
+
+会话建立时加载一次练习窗口，光标停在分界日期，之后按客户端消息前进、后退或跳转，
+每次只返回新显示的日线。KDJ和成交量均线由会话的IndicatorStream逐根推进，
+不对整个窗口重新计算；日线数组按股票共享，会话只保存窗口边界、光标和指标状态。
+
+客户端消息（JSON）：
+- {"action": "advance", "n": 1}          前进n根，返回新显示的日线
+- {"action": "rewind", "n": 5}           后退n根，不指定n时回到分界日期
+- {"action": "jump", "to": 30}           跳到第to根未来日线之后，也可用 {"date": "2024-07-01"}
+"""
+from __future__ import annotations
+
+import math
+import os
+import weakref
+from typing import List, Optional
+
+import numpy as np
+import orjson
+
+import indicators
+import metrics
+
+# 单个进程同时进行的会话数上限，超过时新连接以1013（稍后重试）关闭
+PRACTICE_MAX_SESSIONS = int(os.getenv('PRACTICE_MAX_SESSIONS', '5000'))
+
+# 会话空闲超过该秒数后关闭
+PRACTICE_IDLE_TIMEOUT = float(os.getenv('PRACTICE_IDLE_TIMEOUT', '600'))
+
+# 单条advance消息最多前进的日线数
+PRACTICE_MAX_STEP = 500
+
+# 股票代码 -> 共享的日线数组，没有会话引用时自动释放；序列刷新后新会话使用新的数组
+_shared_arrays: "weakref.WeakValueDictionary[str, indicators.SeriesArrays]" = weakref.WeakValueDictionary()
+
+active_sessions = 0
+
+
+def shared_arrays(symbol: str, series) -> indicators.SeriesArrays:
+    """同一份完整序列对应的共享数组"""
+    arrays = _shared_arrays.get(symbol)
+    if arrays is None or arrays.frame is not series:
+        arrays = indicators.SeriesArrays(series)
+        _shared_arrays[symbol] = arrays
+    return arrays
+
+
+class PracticeSession:
+    """一个练习会话：窗口为arrays中[start, end)，split为分界日期所在位置，光标为已显示的未来日线数"""
+    __slots__ = ('start', 'split', 'end', 'stream')
+
+    def __init__(self, arrays: indicators.SeriesArrays, start: int, split: int, end: int):
+        self.start = start
+        self.split = split
+        self.end = end
+        self.stream = indicators.IndicatorStream(arrays, split)
+
+    @property
+    def cursor(self) -> int:
+        return self.stream.pos - self.split
+
+    @property
+    def future_total(self) -> int:
+        return self.end - self.split
+
+    def handle(self, text: str) -> dict:
+        """处理一条客户端消息，返回回复"""
+        try:
+            message = orjson.loads(text)
+            action = message.get('action')
+        except (orjson.JSONDecodeError, AttributeError):
+            return error_message("消息必须是JSON对象")
+        try:
+            if action == 'advance':
+                return self.advance(_int(message.get('n', 1)))
+            if action == 'rewind':
+                n = message.get('n')
+                return self.seek(0 if n is None else self.cursor - _int(n))
+            if action == 'jump':
+                if 'date' in message:
+                    return self.seek(self.cursor_of(message['date']))
+                return self.seek(_int(message.get('to')))
+        except (TypeError, ValueError) as e:
+            return error_message(f"参数错误: {e}")
+        return error_message("action必须是advance、rewind或jump")
+
+    def advance(self, n: int) -> dict:
+        """前进n根，只计算新显示日线的指标"""
+        if not 1 <= n <= PRACTICE_MAX_STEP:
+            return error_message(f"n的范围为1到{PRACTICE_MAX_STEP}")
+        lo = self.stream.pos
+        hi = min(lo + n, self.end)
+        rows = bar_rows(self.stream.arrays, lo, hi)
+        for row in rows:
+            k, d, j, mavols = self.stream.advance()
+            if not math.isnan(k):
+                row['kdj'] = {'k': k, 'd': d, 'j': j}
+            for period, value in zip(indicators.MAVOL_PERIODS, mavols):
+                if not math.isnan(value):
+                    row[f'mavol{period}'] = value
+        return {'type': 'bars', 'cursor': self.cursor, 'remaining': self.end - self.stream.pos, 'bars': rows}
+
+    def seek(self, cursor: int) -> dict:
+        """移动到第cursor根未来日线之后，向前时返回经过的日线，向后时客户端丢弃光标之后的日线"""
+        cursor = min(max(cursor, 0), self.future_total)
+        if cursor > self.cursor:
+            return self.advance_to(cursor)
+        self.stream.seek(self.split + cursor)
+        return {'type': 'cursor', 'cursor': self.cursor, 'remaining': self.end - self.stream.pos}
+
+    def advance_to(self, cursor: int) -> dict:
+        reply = self.advance(min(cursor - self.cursor, PRACTICE_MAX_STEP))
+        while self.cursor < cursor:
+            more = self.advance(min(cursor - self.cursor, PRACTICE_MAX_STEP))
+            reply['bars'].extend(more['bars'])
+            reply.update(cursor=more['cursor'], remaining=more['remaining'])
+        return reply
+
+    def cursor_of(self, value: str) -> int:
+        """日期对应的光标：显示到该日期（含）为止"""
+        day = np.datetime64(value, 'D')
+        dates = self.stream.arrays.dates
+        return int(np.searchsorted(dates[self.split:self.end], day, side='right'))
+
+
+def bar_rows(arrays: indicators.SeriesArrays, lo: int, hi: int) -> List[dict]:
+    """[lo, hi) 的日线，字段与股票数据接口的逐K线格式一致（不含指标）"""
+    dates = np.datetime_as_string(arrays.dates[lo:hi], unit='D').tolist()
+    columns = [getattr(arrays, field)[lo:hi].tolist() for field in ('open', 'high', 'low', 'close', 'volume')]
+    return [
+        {'date': d, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for d, o, h, l, c, v in zip(dates, *columns)
+    ]
+
+
+def error_message(detail: str, status: Optional[int] = None) -> dict:
+    message = {'type': 'error', 'detail': detail}
+    if status is not None:
+        message['status'] = status
+    return message
+
+
+def _int(value) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError("需要整数")
+    return value
+
+
+def session_metrics() -> metrics.Snapshot:
+    return metrics.sample_family(
+        'stockstudy_practice_sessions', 'gauge', '正在进行的WebSocket练习会话数', {'': active_sessions})
+
+
+metrics.register_collector(session_metrics)
@@ -0,0 +1,120 @@
+"""周线、月线聚合和长窗口的降采样
+
+周期聚合：由完整日线序列按自然周（周一至周日）或自然月分组，开盘取第一根、收盘取最后一根、
+最高最低取极值、成交量求和，日期为该周期最后一个交易日。指标在聚合后的序列上重新计算，
+聚合结果缓存在日线序列的缓存条目中。
+
+降采样：窗口超过max_points根时，把相邻日线合并为一根（开高低收同周期聚合，保留区间内的
+最高价和最低价），历史和未来部分分别合并，合并不跨越分界日期；根数按两部分的长度分配，
+每部分至少分到MIN_PART_SHARE。指标取每组最后一根日线的值，成交量取组内平均，
+与成交量均线量纲一致。
+"""
+from __future__ import annotations
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+import indicators
+import lazy_imports
+
+pd = lazy_imports.module('pandas')
+
+PERIODS = ('daily', 'weekly', 'monthly')
+
+# 每个周期约含的自然日数，用于没有完整序列时按日期估算窗口
+PERIOD_DAYS = {'daily': 1, 'weekly': 7, 'monthly': 31}
+
+# max_points的取值范围
+MIN_POINTS = 20
+MAX_POINTS = 5000
+
+# 降采样时历史和未来部分各至少分到的根数比例（该部分日线数更少时保留全部日线），
+# 避免长历史窗口把未来部分合并成一两根，练习时无法逐根推进
+MIN_PART_SHARE = 0.2
+
+
+def period_keys(dates: np.ndarray, period: str) -> np.ndarray:
+    """每根日线所属周期的编号，序列升序时相同编号连续"""
+    days = dates.astype('datetime64[D]')
+    if period == 'weekly':
+        # 1970-01-01是周四，+3后按7整除得到以周一开始的周编号
+        return (days.astype('int64') + 3) // 7
+    return days.astype('datetime64[M]').astype('int64')
+
+
+def group_starts(keys: np.ndarray) -> np.ndarray:
+    """每组第一根的位置"""
+    if len(keys) == 0:
+        return np.empty(0, dtype='int64')
+    return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+
+def aggregate(frame: pd.DataFrame, starts: np.ndarray, volume: str = 'sum') -> pd.DataFrame:
+    """按组首位置合并相邻日线，日期取每组最后一根；volume为sum（求和）或mean（平均）"""
+    if len(frame) == 0:
+        return frame[['date', 'open', 'high', 'low', 'close', 'volume']]
+    ends = np.concatenate((starts[1:], [len(frame)])) - 1
+    volumes = np.add.reduceat(frame['volume'].to_numpy(dtype='f8'), starts)
+    if volume == 'mean':
+        volumes = volumes / (ends - starts + 1)
+    return pd.DataFrame({
+        'date': frame['date'].to_numpy()[ends],
+        'open': frame['open'].to_numpy(dtype='f8')[starts],
+        'high': np.maximum.reduceat(frame['high'].to_numpy(dtype='f8'), starts),
+        'low': np.minimum.reduceat(frame['low'].to_numpy(dtype='f8'), starts),
+        'close': frame['close'].to_numpy(dtype='f8')[ends],
+        'volume': volumes,
+    })
+
+
+def resample_bars(frame: pd.DataFrame, period: str) -> pd.DataFrame:
+    """日线聚合为周线或月线（不含指标）"""
+    keys = period_keys(frame['date'].to_numpy(), period)
+    return aggregate(frame, group_starts(keys))
+
+
+def period_series(series: pd.DataFrame, period: str, store) -> Tuple[pd.DataFrame, np.ndarray, dict]:
+    """完整日线序列对应的周期序列（含默认指标）、日期索引和该序列的指标缓存，缓存在store
+    （日线序列的派生数据，见series_cache.DerivedStore）中"""
+    key = ('period', period)
+    cached = store.get(key)
+    if cached is None:
+        frame, _ = indicators.compute_indicators(resample_bars(series, period))
+        child = store.child(key) if hasattr(store, 'child') else {}
+        cached = store[key] = (frame, frame['date'].to_numpy().astype('datetime64[D]'), child)
+    return cached
+
+
+def downsample(frame: pd.DataFrame, split: int, max_points: int) -> Tuple[pd.DataFrame, int]:
+    """把窗口合并为max_points根，历史（split之前）和未来部分按长度分配根数（各有最低比例），
+    返回新窗口和新分界位置"""
+    n = len(frame)
+    if n <= max_points:
+        return frame, split
+    # 按长度分配，两部分各至少分到MIN_PART_SHARE（不超过该部分的日线数）
+    floor = math.ceil(max_points * MIN_PART_SHARE)
+    min_hist = min(split, floor)
+    min_future = min(n - split, floor)
+    hist_points = round(max_points * split / n)
+    hist_points = min(max(hist_points, min_hist), max_points - min_future)
+    future_points = max_points - hist_points
+    hist_starts = _bucket_starts(split, hist_points)
+    future_starts = split + _bucket_starts(n - split, future_points)
+    starts = np.concatenate((hist_starts, future_starts))
+    merged = aggregate(frame, starts, volume='mean')
+
+    ends = np.concatenate((starts[1:], [n])) - 1
+    indicator_columns = [name for name in frame.columns if name not in merged.columns]
+    for name in indicator_columns:
+        merged[name] = frame[name].to_numpy()[ends]
+    return merged, len(hist_starts)
+
+
+def _bucket_starts(n: int, points: int) -> np.ndarray:
+    """把n根均匀地分为min(n, points)组（各组根数相差不超过1），返回每组第一根的位置"""
+    points = min(n, points)
+    if points <= 0:
+        return np.empty(0, dtype='int64')
+    return np.arange(points, dtype='int64') * n // points
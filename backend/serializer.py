@@ -0,0 +1,149 @@
+"""股票数据响应序列化
+
+按列从NumPy数组生成响应结构，缺失的指标用掩码判断；响应只用orjson编码一次，
+编码后的字节同时用于写入缓存和返回给客户端。
+
+支持两种数据结构：
+- rows: 逐K线对象数组（默认，兼容现有前端）
+- columnar: 每个字段一个数组，缺失的指标为null
+
+输出哪些指标由indicator_registry的输出字段（layout）决定，默认为KDJ和成交量均线。
+
+以及两种编码：JSON，和通过Accept头选择的MessagePack。
+回放接口按事件流式输出，每个事件是一个JSON对象，以NDJSON或Server-Sent Events分帧。
+"""
+from __future__ import annotations
+
+from functools import partial
+from typing import Dict, List, Optional
+
+import msgpack
+import numpy as np
+import orjson
+
+import indicator_registry
+import lazy_imports
+
+pd = lazy_imports.module('pandas')
+
+JSON_MEDIA_TYPE = 'application/json'
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, 'application/x-msgpack')
+
+RESPONSE_FORMATS = ('rows', 'columnar')
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+EVENT_STREAM_MEDIA_TYPE = 'text/event-stream'
+
+PRICE_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def _column(df: pd.DataFrame, name: str) -> np.ndarray:
+    return df[name].to_numpy(dtype='f8')
+
+
+def format_dates(df: pd.DataFrame) -> List[str]:
+    """日期列格式化为YYYY-MM-DD字符串"""
+    return np.datetime_as_string(df['date'].to_numpy().astype('datetime64[D]'), unit='D').tolist()
+
+
+def format_data(df: pd.DataFrame, layout: Optional[indicator_registry.Layout] = None) -> List[dict]:
+    """将日线DataFrame转换为逐K线的响应结构（date/open/high/low/close/volume和选择的指标）"""
+    if df.empty:
+        return []
+
+    dates = format_dates(df)
+    prices = [_column(df, field).tolist() for field in PRICE_FIELDS]
+    rows = [
+        {'date': d, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for d, o, h, l, c, v in zip(dates, *prices)
+    ]
+
+    groups, flat = layout or indicator_registry.DEFAULT_LAYOUT
+
+    # 添加分组指标（如kdj，第一个字段为NaN的K线不输出该分组）
+    for key, fields in groups:
+        if fields[0][1] not in df.columns:
+            continue
+        valid = np.flatnonzero(~np.isnan(_column(df, fields[0][1])))
+        if not len(valid):
+            continue
+        names = [field for field, _ in fields]
+        values = [_column(df, column)[valid].tolist() for _, column in fields]
+        if len(names) == 3:
+            # 内置的分组指标都是三个字段，用字面量构造字典比dict(zip())快
+            a, b, c = names
+            objects = [{a: x, b: y, c: z} for x, y, z in zip(*values)]
+        else:
+            objects = [dict(zip(names, group)) for group in zip(*values)]
+        for i, group in zip(valid.tolist(), objects):
+            rows[i][key] = group
+
+    # 添加逐字段的指标（如成交量移动平均）
+    for name in flat:
+        if name not in df.columns:
+            continue
+        values = _column(df, name)
+        valid = np.flatnonzero(~np.isnan(values))
+        for i, value in zip(valid.tolist(), values[valid].tolist()):
+            rows[i][name] = value
+
+    return rows
+
+
+def format_columnar(df: pd.DataFrame, layout: Optional[indicator_registry.Layout] = None) -> Dict[str, object]:
+    """将日线DataFrame转换为按列的响应结构，数值列保持为NumPy数组直到编码"""
+    columns = {'date': format_dates(df) if not df.empty else []}
+    for name in PRICE_FIELDS:
+        columns[name] = _column(df, name)
+    groups, flat = layout or indicator_registry.DEFAULT_LAYOUT
+    for name in [column for _, fields in groups for _, column in fields] + flat:
+        columns[name] = _column(df, name) if name in df.columns else np.full(len(df), np.nan)
+    return columns
+
+
+def formatter_for(response_format: str, layout: Optional[indicator_registry.Layout] = None):
+    """根据format参数和选择的指标返回对应的格式化函数"""
+    formatter = format_columnar if response_format == 'columnar' else format_data
+    return formatter if layout is None else partial(formatter, layout=layout)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """根据Accept头选择编码，默认JSON"""
+    if accept:
+        for part in accept.split(','):
+            media_type = part.split(';')[0].strip().lower()
+            if media_type in MSGPACK_MEDIA_TYPES:
+                return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def negotiate_stream(accept: Optional[str]) -> str:
+    """回放接口的分帧方式：Accept包含text/event-stream时为SSE，默认NDJSON"""
+    if accept:
+        for part in accept.split(','):
+            if part.split(';')[0].strip().lower() == EVENT_STREAM_MEDIA_TYPE:
+                return EVENT_STREAM_MEDIA_TYPE
+    return NDJSON_MEDIA_TYPE
+
+
+def encode_event(event: str, data: dict, media_type: str, event_id: Optional[int] = None) -> bytes:
+    """编码一个流式事件，JSON对象的type字段为事件类型；SSE的id用于断线重连时继续"""
+    body = orjson.dumps({'type': event, **data}, option=orjson.OPT_SERIALIZE_NUMPY)
+    if media_type != EVENT_STREAM_MEDIA_TYPE:
+        return body + b'\n'
+    header = f"event: {event}\n" if event_id is None else f"event: {event}\nid: {event_id}\n"
+    return header.encode() + b'data: ' + body + b'\n\n'
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+
+def encode(data, media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    """编码为响应字节：JSON为UTF-8（NaN输出为null），MessagePack中缺失值保留为NaN"""
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,152 @@
+"""按股票代码缓存完整日线序列（含技术指标）
+
+不同分界日期、不同窗口长度的请求共享同一份序列，响应窗口从缓存的序列中切片得到。
+序列通常是映射的共享序列（见shared_series），缓存只保存引用，不占用进程私有内存。
+每个序列同时缓存按日期升序的 datetime64[D] 索引，切片位置用二分查找得到；
+按请求选择的指标及其中间数组（派生数据）保存在进程内按字节数限制大小的LRU中，
+键带序列的代次，序列刷新后旧的派生数据不再被访问，随LRU淘汰。
+"""
+from __future__ import annotations
+
+import itertools
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+import numpy as np
+
+import lazy_imports
+
+pd = lazy_imports.module('pandas')
+
+
+class DerivedCache:
+    """所有序列共用的派生数据LRU，按字节数限制大小；超过上限的单个值不保存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: Hashable):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        self._entries.move_to_end(key)
+        return item[0]
+
+    def set(self, key: Hashable, value) -> None:
+        self.pop(key)
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self.pop(next(iter(self._entries)))
+
+    def pop(self, key: Hashable) -> None:
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+class DerivedStore:
+    """一个序列的派生数据，按字典的get和下标赋值使用，实际保存在共用的DerivedCache中"""
+    __slots__ = ('cache', 'scope')
+
+    def __init__(self, cache: DerivedCache, scope: Hashable):
+        self.cache = cache
+        self.scope = scope
+
+    def get(self, key: Hashable):
+        return self.cache.get((self.scope, key))
+
+    def __setitem__(self, key: Hashable, value) -> None:
+        self.cache.set((self.scope, key), value)
+
+    def child(self, key: Hashable) -> "DerivedStore":
+        """由该序列得到的另一个序列（如周线）的派生数据"""
+        return DerivedStore(self.cache, (self.scope, key))
+
+
+def _size(value) -> int:
+    """派生数据占用的字节数（数组、数组的字典或元组、DataFrame）"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_size(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(_size(item) for item in value)
+    if isinstance(value, DerivedStore):
+        return 0
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(index=False).sum())
+    return 0
+
+
+class SeriesCache:
+    """LRU淘汰、带过期时间的进程内序列缓存"""
+
+    def __init__(self, max_symbols: int = 256, ttl: float = 1800, derived_max_bytes: int = 64 * 1024 * 1024):
+        self.max_symbols = max_symbols
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.derived_cache = DerivedCache(derived_max_bytes)
+        self._generations = itertools.count()
+
+    def get(self, symbol: str) -> Optional[pd.DataFrame]:
+        entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        frame, _, loaded_at, _, _ = entry
+        if time.time() - loaded_at >= self.ttl:
+            # 过期后需要重新同步本地存储以获取新的日线，旧条目保留给peek做增量计算
+            return None
+        self._entries.move_to_end(symbol)
+        return frame
+
+    def peek(self, symbol: str) -> Optional[Tuple[pd.DataFrame, Optional[dict]]]:
+        """返回序列及其指标状态，不检查过期时间"""
+        entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
+    def date_index(self, symbol: str, frame: pd.DataFrame) -> np.ndarray:
+        """序列的日期索引，frame不是当前缓存的序列时重新生成"""
+        entry = self._entries.get(symbol)
+        if entry is not None and entry[0] is frame:
+            return entry[3]
+        return _date_index(frame)
+
+    def derived(self, symbol: str, frame: pd.DataFrame):
+        """序列上计算的指标和中间数组（DerivedStore），frame不是当前缓存的序列时返回不保存的空字典"""
+        entry = self._entries.get(symbol)
+        if entry is not None and entry[0] is frame:
+            return entry[4]
+        return {}
+
+    def set(self, symbol: str, frame: pd.DataFrame, state: Optional[dict] = None,
+            dates: Optional[np.ndarray] = None) -> None:
+        """dates为frame的日期索引，已有时（如共享序列中保存的）直接使用"""
+        dates = _date_index(frame) if dates is None else dates
+        derived = DerivedStore(self.derived_cache, (symbol, next(self._generations)))
+        self._entries[symbol] = (frame, state, time.time(), dates, derived)
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.max_symbols:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _date_index(frame: pd.DataFrame) -> np.ndarray:
+    return frame['date'].to_numpy().astype('datetime64[D]')
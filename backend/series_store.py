@@ -0,0 +1,213 @@
+"""本地按股票代码存储的日线列式数据
+
+每只股票对应一个 NumPy 结构化数组文件（``{symbol}.npy``），按日期升序保存
+完整的日线序列，读取时使用内存映射，按需只转换其中的部分行（如增量计算指标的新增日线）。
+同目录下的 ``{symbol}.json`` 记录最后存储日期和最近一次同步上游的时间。
+批量预加载（ingest.py）预先计算的技术指标保存在 ``{symbol}.ind.npy``，
+对应的行数和增量计算状态记录在元数据中。
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import lazy_imports
+import trading_calendar
+
+pd = lazy_imports.module('pandas')
+
+SERIES_STORE_DIR = os.getenv(
+    'SERIES_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'series')
+)
+
+# 日线字段（不含日期）
+BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+BAR_DTYPE = np.dtype([('date', 'datetime64[D]')] + [(field, 'f8') for field in BAR_FIELDS])
+
+# A股收盘时间（北京时间），收盘后同步过的数据在下一次收盘前不会再有新的日线
+MARKET_TZ = timezone(timedelta(hours=8))
+MARKET_CLOSE = dt_time(15, 0)
+
+
+def is_valid_symbol(symbol: str) -> bool:
+    """股票代码是否为6位数字"""
+    return len(symbol) == 6 and symbol.isascii() and symbol.isdigit()
+
+
+def check_symbol(symbol: str) -> None:
+    """股票代码拼接为存储文件名，不是6位数字时拒绝，避免写到存储目录之外"""
+    if not is_valid_symbol(symbol):
+        raise ValueError(f"股票代码格式错误: {symbol!r}")
+
+
+def _series_path(symbol: str) -> str:
+    check_symbol(symbol)
+    return os.path.join(SERIES_STORE_DIR, f"{symbol}.npy")
+
+
+def _indicator_path(symbol: str) -> str:
+    check_symbol(symbol)
+    return os.path.join(SERIES_STORE_DIR, f"{symbol}.ind.npy")
+
+
+def _meta_path(symbol: str) -> str:
+    check_symbol(symbol)
+    return os.path.join(SERIES_STORE_DIR, f"{symbol}.json")
+
+
+def _atomic_write(path: str, write) -> None:
+    """先写临时文件再替换，避免并发读取到写了一半的文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def frame_to_bars(df: pd.DataFrame) -> np.ndarray:
+    """DataFrame（date/open/high/low/close/volume）转换为结构化数组"""
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    bars['date'] = pd.to_datetime(df['date']).to_numpy().astype('datetime64[D]')
+    for field in BAR_FIELDS:
+        bars[field] = df[field].to_numpy(dtype='f8')
+    bars.sort(order='date')
+    return bars
+
+
+def bars_to_frame(bars: np.ndarray) -> pd.DataFrame:
+    """结构化数组转换为与接口一致的DataFrame"""
+    data = {'date': pd.to_datetime(bars['date'].astype('datetime64[ns]'))}
+    for field in BAR_FIELDS:
+        data[field] = np.array(bars[field])
+    return pd.DataFrame(data)
+
+
+def load_bars(symbol: str) -> Optional[np.ndarray]:
+    """以内存映射方式打开某只股票的全部日线，未存储时返回None"""
+    path = _series_path(symbol)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r')
+
+
+def write_series(symbol: str, df: pd.DataFrame) -> np.ndarray:
+    """覆盖写入完整日线序列，原有的预先计算的指标随之失效"""
+    bars = frame_to_bars(df)
+    _atomic_write(_series_path(symbol), lambda path: _save_npy(path, bars))
+    try:
+        os.remove(_indicator_path(symbol))
+    except FileNotFoundError:
+        pass
+    return bars
+
+
+def append_series(symbol: str, df: pd.DataFrame) -> np.ndarray:
+    """追加最后存储日期之后的新日线，返回追加后的完整序列"""
+    existing = load_bars(symbol)
+    new_bars = frame_to_bars(df)
+    if existing is None or len(existing) == 0:
+        bars = new_bars
+    else:
+        new_bars = new_bars[new_bars['date'] > existing['date'][-1]]
+        if len(new_bars) == 0:
+            return existing
+        bars = np.concatenate([np.asarray(existing), new_bars])
+    _atomic_write(_series_path(symbol), lambda path: _save_npy(path, bars))
+    return bars
+
+
+def _save_npy(path: str, bars: np.ndarray) -> None:
+    # 直接写文件对象，避免np.save自动追加.npy后缀
+    with open(path, 'wb') as f:
+        np.save(f, bars)
+
+
+def write_indicators(symbol: str, frame: pd.DataFrame, columns, state: Dict[str, Tuple[float, float]]) -> None:
+    """保存在完整序列上预先计算的指标列，state为序列末尾的增量计算状态"""
+    dtype = np.dtype([('date', 'datetime64[D]')] + [(name, 'f8') for name in columns])
+    values = np.empty(len(frame), dtype=dtype)
+    values['date'] = frame['date'].to_numpy().astype('datetime64[D]')
+    for name in columns:
+        values[name] = frame[name].to_numpy(dtype='f8')
+    _atomic_write(_indicator_path(symbol), lambda path: _save_npy(path, values))
+    write_meta(symbol, indicators={'rows': len(values), 'state': {key: list(value) for key, value in state.items()}})
+
+
+def load_indicators(symbol: str, bars: np.ndarray) -> Optional[Tuple[pd.DataFrame, dict]]:
+    """读取预先计算的指标，覆盖的日线仍是当前序列的前缀时返回(带指标的前缀序列, 增量计算状态)"""
+    path = _indicator_path(symbol)
+    if not os.path.exists(path):
+        return None
+    try:
+        values = np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    info = read_meta(symbol).get('indicators') or {}
+    n = len(values)
+    if n == 0 or n > len(bars) or info.get('rows') != n or values['date'][-1] != bars['date'][n - 1]:
+        # 指标文件和元数据不是同一次写入的，或日线已重写
+        return None
+    frame = bars_to_frame(bars[:n]).assign(
+        **{name: np.array(values[name]) for name in values.dtype.names if name != 'date'}
+    )
+    return frame, {key: tuple(value) for key, value in info['state'].items()}
+
+
+def read_meta(symbol: str) -> dict:
+    """读取存储元数据，不存在时返回空字典"""
+    try:
+        with open(_meta_path(symbol), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_meta(symbol: str, **fields) -> dict:
+    """更新存储元数据"""
+    meta = read_meta(symbol)
+    meta.update(fields)
+
+    def write(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    _atomic_write(_meta_path(symbol), write)
+    return meta
+
+
+def last_stored_date(bars: Optional[np.ndarray]) -> Optional[date]:
+    """返回已存储的最后一个交易日"""
+    if bars is None or len(bars) == 0:
+        return None
+    return bars['date'][-1].astype(date)
+
+
+def last_market_close(now: Optional[datetime] = None) -> datetime:
+    """最近一次已经发生的收盘时间（按交易日历，节假日不算）"""
+    now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+    day = now.date() if now.time() >= MARKET_CLOSE else now.date() - timedelta(days=1)
+    return datetime.combine(trading_calendar.default_calendar().previous_or_same(day), MARKET_CLOSE,
+                            tzinfo=MARKET_TZ)
+
+
+def is_fresh(symbol: str, bars: Optional[np.ndarray], refresh_interval: float) -> bool:
+    """判断本地数据是否无需再向上游同步：最近一次收盘后同步过，或距上次同步未超过刷新间隔"""
+    last_date = last_stored_date(bars)
+    if last_date is None:
+        return False
+    if last_date >= date.today():
+        return True
+    checked_at = read_meta(symbol).get('checked_at', 0)
+    if checked_at >= last_market_close().timestamp():
+        return True
+    return time.time() - checked_at < refresh_interval
@@ -0,0 +1,323 @@
+"""同一主机上多个worker共享的完整序列
+
+带默认技术指标的完整日线序列以列式文件（``{symbol}.seg``）发布在SHARED_SERIES_DIR中，
+各worker以只读方式内存映射同一个文件，DataFrame的各列直接指向映射的内存，不复制，
+同一只股票在主机上只占一份内存（页缓存），与worker数量无关；
+一个worker加载并发布后，其他worker下一次未命中时直接映射，不再同步上游或重新计算。
+
+加载的归属：缺少可用序列的worker尝试获取该股票锁文件（``{symbol}.lock``）的排他flock，
+获得锁的worker负责同步本地存储、计算指标并发布；未获得锁的worker不占用线程，定期用stat
+检查文件是否被重新发布，发布后在线程池中映射。持有锁的进程退出时锁自动释放；
+等待超过SHARED_SERIES_LOCK_TIMEOUT时不再等待，自行加载（发布是原子替换，重复加载只多做一次计算）。
+同一进程内并发的未命中共享同一次加载。
+
+发布时先写临时文件再替换，已映射旧文件的worker继续使用旧数据直到其进程内缓存过期，
+旧文件在最后一个映射释放后由系统回收。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+import lazy_imports
+import metrics
+import series_store
+
+try:
+    import fcntl
+except ImportError:
+    # 没有flock的平台（Windows）只在进程内合并并发加载
+    fcntl = None
+
+pd = lazy_imports.module('pandas')
+
+logger = logging.getLogger(__name__)
+
+# 共享序列目录，设置为/dev/shm下的目录时完全在内存中
+SHARED_SERIES_DIR = os.getenv(
+    'SHARED_SERIES_DIR',
+    os.path.join(series_store.SERIES_STORE_DIR, 'shared')
+)
+
+# 共享序列文件的总大小上限，发布时按发布时间淘汰最早的文件
+SHARED_SERIES_MAX_BYTES = int(os.getenv('SHARED_SERIES_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+# 等待其他worker加载同一股票的最长时间（秒）和检查间隔
+SHARED_SERIES_LOCK_TIMEOUT = float(os.getenv('SHARED_SERIES_LOCK_TIMEOUT', '60'))
+LOCK_POLL_INTERVAL = 0.02
+
+# 文件格式：魔数、头部JSON长度、头部JSON，之后从按ALIGNMENT对齐的位置起依次存放各列
+MAGIC = b'STKSEG1\n'
+ALIGNMENT = 64
+
+# 不属于DataFrame的列：按日期升序的datetime64[D]索引
+DATE_INDEX = '__date_index__'
+
+# 加载结果计数：attached为直接映射已发布的序列，waited为等待其他worker发布后映射，
+# published为本worker加载并发布，private为发布失败、只在本进程使用
+load_counts = {'attached': 0, 'waited': 0, 'published': 0, 'private': 0}
+
+# 正在进行中的加载，同一进程内同一股票的并发未命中共享同一个任务
+_inflight_loads: Dict[str, asyncio.Future] = {}
+
+
+class Segment:
+    """一个已发布的完整序列：只读的DataFrame、日期索引、指标增量计算状态和来源日线的标识"""
+    __slots__ = ('frame', 'dates', 'state', 'source', 'published_at')
+
+    def __init__(self, frame: pd.DataFrame, dates: np.ndarray, state: dict, source: list,
+                 published_at: float = 0):
+        self.frame = frame
+        self.dates = dates
+        self.state = state
+        self.source = source
+        self.published_at = published_at
+
+    def matches(self, bars: Optional[np.ndarray]) -> bool:
+        """是否由当前存储的日线计算得到（行数、最后日期和收盘价相同）"""
+        return bars is not None and self.source == source_of(bars)
+
+
+def source_of(bars: np.ndarray) -> list:
+    if len(bars) == 0:
+        return [0, None, None]
+    return [len(bars), str(bars['date'][-1]), float(bars['close'][-1])]
+
+
+def _segment_path(symbol: str) -> str:
+    series_store.check_symbol(symbol)
+    return os.path.join(SHARED_SERIES_DIR, f"{symbol}.seg")
+
+
+def _lock_path(symbol: str) -> str:
+    series_store.check_symbol(symbol)
+    return os.path.join(SHARED_SERIES_DIR, f"{symbol}.lock")
+
+
+def attach(symbol: str) -> Optional[Segment]:
+    """映射已发布的序列，不存在或格式不对时返回None"""
+    try:
+        with open(_segment_path(symbol), 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if buffer[:len(MAGIC)] != MAGIC:
+            return None
+        (header_size,) = struct.unpack_from('<Q', buffer, len(MAGIC))
+        offset = len(MAGIC) + 8
+        header = json.loads(bytes(buffer[offset:offset + header_size]))
+        offset = _aligned(offset + header_size)
+        rows = header['rows']
+        arrays = {}
+        for name, dtype in header['columns']:
+            # 映射只读，数组也是只读的，误写会直接报错而不是改动其他worker看到的数据
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=rows, offset=offset)
+            offset += rows * np.dtype(dtype).itemsize
+    except (ValueError, KeyError, TypeError, struct.error):
+        return None
+    dates = arrays.pop(DATE_INDEX)
+    # copy=False且各列分别传入，pandas不合并为二维块，各列仍指向映射的内存
+    frame = pd.DataFrame(arrays, copy=False)
+    state = {key: tuple(value) for key, value in header['state'].items()}
+    return Segment(frame, dates, state, header['source'], header['published_at'])
+
+
+def publish(symbol: str, frame: pd.DataFrame, state: dict, bars: np.ndarray) -> Segment:
+    """发布带指标的完整序列并返回映射后的结果；写入失败时返回只在本进程使用的结果"""
+    columns = {name: frame[name].to_numpy() for name in frame.columns}
+    columns[DATE_INDEX] = columns['date'].astype('datetime64[D]')
+    header = json.dumps({
+        'rows': len(frame),
+        'columns': [[name, values.dtype.str] for name, values in columns.items()],
+        'state': {key: list(value) for key, value in state.items()},
+        'source': source_of(bars),
+        'published_at': time.time(),
+    }).encode('utf-8')
+    path = _segment_path(symbol)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SHARED_SERIES_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+            for values in columns.values():
+                f.write(np.ascontiguousarray(values).tobytes())
+        os.replace(tmp_path, path)
+        _evict(keep=path)
+    except OSError as e:
+        logger.warning("发布共享序列失败 %s: %s", symbol, e)
+        segment = None
+    else:
+        segment = attach(symbol)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if segment is None:
+        load_counts['private'] += 1
+        return Segment(frame, columns[DATE_INDEX], state, source_of(bars))
+    load_counts['published'] += 1
+    return segment
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _evict(keep: str) -> None:
+    """总大小超过上限时按发布时间从早到晚删除（已映射的worker不受影响），并清理没有对应序列的锁文件"""
+    files = []
+    locks = []
+    with os.scandir(SHARED_SERIES_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith('.lock'):
+                locks.append(entry.path)
+            elif entry.name.endswith('.seg') and entry.path != keep:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = os.path.getsize(keep) + sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= SHARED_SERIES_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+    for path in locks:
+        if not os.path.exists(path[:-len('.lock')] + '.seg'):
+            _remove_idle_lock(path)
+
+
+def _remove_idle_lock(path: str) -> None:
+    """删除没有进程持有的锁文件（持有锁的worker正在加载，序列尚未发布）"""
+    if fcntl is None:
+        return
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except OSError:
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # 持有锁时删除：刚打开旧文件的进程最多与新文件的持有者各加载一次，发布是原子替换
+        os.remove(path)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SymbolLock:
+    """某只股票的跨进程排他锁（flock），只做非阻塞尝试"""
+
+    def __init__(self, symbol: str):
+        self.path = _lock_path(symbol)
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._fd is None:
+            try:
+                os.makedirs(SHARED_SERIES_DIR, exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                # 共享目录不可写时不做跨进程协调（发布也会失败，结果只在本进程使用）
+                return True
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def release(self) -> None:
+        # 关闭文件即释放锁；锁文件保留，删除会让同时打开它的进程锁住不同的文件
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+async def load(symbol: str, current: Callable[[], Optional[Segment]],
+               build: Callable[[], Awaitable[Optional[Segment]]]) -> Optional[Segment]:
+    """返回symbol的可用序列：current()为已发布且可用的序列（没有时返回None），
+    build()同步本地存储、计算并发布，由获得该股票锁的worker执行
+    """
+    future = _inflight_loads.get(symbol)
+    if future is None:
+        future = asyncio.ensure_future(_load(symbol, current, build))
+        _inflight_loads[symbol] = future
+        future.add_done_callback(lambda f: _finish_load(symbol, f))
+    # shield避免单个请求取消时中断其他请求共享的加载
+    return await asyncio.shield(future)
+
+
+async def _load(symbol: str, current: Callable[[], Optional[Segment]],
+                build: Callable[[], Awaitable[Optional[Segment]]]) -> Optional[Segment]:
+    # current()读取文件和建立映射，在线程池中执行，不阻塞事件循环
+    loop = asyncio.get_running_loop()
+    seen = _segment_mtime(symbol)
+    segment = await loop.run_in_executor(None, current)
+    if segment is not None:
+        load_counts['attached'] += 1
+        return segment
+    lock = SymbolLock(symbol)
+    try:
+        deadline = time.monotonic() + SHARED_SERIES_LOCK_TIMEOUT
+        while not lock.try_acquire():
+            # 其他worker正在加载：只用stat检查文件是否被重新发布，发布后再映射
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            mtime = _segment_mtime(symbol)
+            if mtime is not None and mtime != seen:
+                seen = mtime
+                segment = await loop.run_in_executor(None, current)
+                if segment is not None:
+                    load_counts['waited'] += 1
+                    return segment
+            if time.monotonic() >= deadline:
+                logger.warning("等待其他worker加载%s超时，改为自行加载", symbol)
+                break
+        # 获得锁之前其他worker可能刚好发布完成，或同步后没有新日线而未重新发布
+        segment = await loop.run_in_executor(None, current)
+        if segment is not None:
+            load_counts['waited'] += 1
+            return segment
+        return await build()
+    finally:
+        lock.release()
+
+
+def _segment_mtime(symbol: str) -> Optional[int]:
+    try:
+        return os.stat(_segment_path(symbol)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _finish_load(symbol: str, future: asyncio.Future) -> None:
+    if _inflight_loads.get(symbol) is future:
+        del _inflight_loads[symbol]
+    if not future.cancelled():
+        # 取出异常，避免所有等待者都已取消时出现未获取异常的警告
+        future.exception()
+
+
+def shared_metrics() -> metrics.Snapshot:
+    return metrics.sample_family(
+        'stockstudy_shared_series_loads_total', 'counter', '进程内缓存未命中时完整序列的来源',
+        {f'result="{result}"': count for result, count in load_counts.items()})
+
+
+metrics.register_collector(shared_metrics)
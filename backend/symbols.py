@@ -0,0 +1,187 @@
+"""A股代码目录：代码、名称、拼音首字母的前缀索引
+
+启动预热或第一次使用时从本地快照加载全部A股列表（没有快照时使用内置的热门股票列表），
+后台线程定期从AKShare刷新快照并整体替换索引，请求路径只做内存查找。
+"""
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+import lazy_imports
+
+# 拼音库导入较慢，只在需要计算拼音首字母时导入
+pypinyin = lazy_imports.module('pypinyin')
+
+SYMBOL_SNAPSHOT_PATH = os.getenv(
+    'SYMBOL_SNAPSHOT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'symbols.json')
+)
+
+# 快照超过该秒数后在后台刷新
+SYMBOL_REFRESH_INTERVAL = int(os.getenv('SYMBOL_REFRESH_INTERVAL', str(24 * 3600)))
+
+# 热门A股股票，没有快照时作为目录，搜索关键字为空时作为默认列表
+POPULAR_STOCKS = [
+    ('000001', '平安银行'), ('000002', '万科A'), ('000063', '中兴通讯'), ('000100', 'TCL科技'),
+    ('000333', '美的集团'), ('000651', '格力电器'), ('000725', '京东方A'), ('000858', '五粮液'),
+    ('000876', '新希望'), ('000895', '双汇发展'), ('000938', '紫光股份'), ('002024', '苏宁易购'),
+    ('002027', '分众传媒'), ('002142', '宁波银行'), ('002230', '科大讯飞'), ('002241', '歌尔股份'),
+    ('002415', '海康威视'), ('002475', '立讯精密'), ('002594', '比亚迪'), ('002714', '牧原股份'),
+    ('300014', '亿纬锂能'), ('300059', '东方财富'), ('300122', '智飞生物'), ('300142', '沃森生物'),
+    ('300750', '宁德时代'), ('600000', '浦发银行'), ('600009', '上海机场'), ('600010', '包钢股份'),
+    ('600016', '民生银行'), ('600030', '中信证券'), ('600036', '招商银行'), ('600050', '中国联通'),
+    ('600104', '上汽集团'), ('600111', '北方稀土'), ('600196', '复星医药'), ('600276', '恒瑞医药'),
+    ('600309', '万华化学'), ('600519', '贵州茅台'), ('600570', '恒生电子'), ('600585', '海螺水泥'),
+    ('600588', '用友网络'), ('600690', '海尔智家'), ('600703', '三安光电'), ('600745', '闻泰科技'),
+    ('600809', '山西汾酒'), ('600837', '海通证券'), ('600887', '伊利股份'), ('601012', '隆基绿能'),
+    ('601066', '中信建投'), ('601088', '中国神华'), ('601138', '工业富联'), ('601166', '兴业银行'),
+    ('601169', '北京银行'), ('601186', '中国铁建'), ('601211', '国泰君安'), ('601288', '农业银行'),
+    ('601318', '中国平安'), ('601328', '交通银行'), ('601398', '工商银行'), ('601601', '中国太保'),
+    ('601628', '中国人寿'), ('601668', '中国建筑'), ('601688', '华泰证券'), ('601766', '中国中车'),
+    ('601800', '中国交建'), ('601818', '光大银行'), ('601857', '中国石油'), ('601888', '中国中免'),
+    ('601919', '中远海控'), ('601988', '中国银行'), ('601989', '中国重工'), ('603259', '药明康德'),
+    ('603993', '洛阳钼业'),
+]
+
+# 匹配方式的排序优先级，数值越小越靠前
+RANK_CODE = 0
+RANK_NAME_PREFIX = 1
+RANK_PINYIN = 2
+RANK_CONTAINS = 3
+
+
+def exchange_of(symbol: str) -> str:
+    """根据代码前缀推断交易所"""
+    if symbol.startswith(('6', '9')):
+        return 'SH'
+    if symbol.startswith(('4', '8')):
+        return 'BJ'
+    return 'SZ'
+
+
+def pinyin_initials(name: str) -> str:
+    """名称的拼音首字母，如 平安银行 -> payh"""
+    return ''.join(
+        part[0] for part in pypinyin.lazy_pinyin(name, style=pypinyin.Style.FIRST_LETTER, errors='default')
+        if part
+    ).lower()
+
+
+def build_entries(pairs) -> List[dict]:
+    """由(代码, 名称)列表生成目录条目"""
+    return [
+        {'symbol': symbol, 'name': name, 'exchange': exchange_of(symbol), 'pinyin': pinyin_initials(name)}
+        for symbol, name in pairs
+    ]
+
+
+class _PrefixIndex:
+    """有序键列表上的前缀查找"""
+
+    def __init__(self, items):
+        items = sorted(items)
+        self.keys = [key for key, _ in items]
+        self.positions = [pos for _, pos in items]
+
+    def scan(self, prefix: str):
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + '\uffff')
+        for i in range(lo, hi):
+            yield self.positions[i]
+
+
+class SymbolIndex:
+    """不可变的股票目录，刷新时整体替换"""
+
+    def __init__(self, entries: List[dict], updated_at: float = 0):
+        self.entries = entries
+        self.updated_at = updated_at
+        self.by_symbol: Dict[str, dict] = {entry['symbol']: entry for entry in entries}
+
+        self._codes = _PrefixIndex((entry['symbol'], pos) for pos, entry in enumerate(entries))
+        self._names = _PrefixIndex((entry['name'].lower(), pos) for pos, entry in enumerate(entries))
+        self._pinyin = _PrefixIndex(
+            (entry['pinyin'], pos) for pos, entry in enumerate(entries) if entry.get('pinyin')
+        )
+        # 代码和名称的全部后缀，前缀查找后缀即可实现包含匹配
+        self._contains = _PrefixIndex(
+            (key[start:], pos)
+            for pos, entry in enumerate(entries)
+            for key in (entry['symbol'], entry['name'].lower())
+            for start in range(1, len(key))
+        )
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def name_of(self, symbol: str) -> Optional[str]:
+        entry = self.by_symbol.get(symbol)
+        return entry['name'] if entry else None
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        """按 代码前缀 > 名称前缀 > 拼音首字母 > 代码或名称包含 排序返回前limit个结果"""
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        candidates = [
+            (RANK_CODE, self._codes.scan(query)),
+            (RANK_NAME_PREFIX, self._names.scan(query)),
+            (RANK_PINYIN, self._pinyin.scan(query)),
+            (RANK_CONTAINS, self._contains.scan(query)),
+        ]
+        seen = set()
+        results = []
+        for _, positions in candidates:
+            for pos in positions:
+                if pos in seen:
+                    continue
+                seen.add(pos)
+                results.append(self.entries[pos])
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+def load_snapshot(path: str = SYMBOL_SNAPSHOT_PATH) -> Optional[SymbolIndex]:
+    """读取本地快照，不存在或损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        return SymbolIndex(snapshot['stocks'], snapshot.get('updated_at', 0))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_snapshot(index: SymbolIndex, path: str = SYMBOL_SNAPSHOT_PATH) -> None:
+    """写入本地快照"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'updated_at': index.updated_at, 'stocks': index.entries}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def fetch_universe() -> SymbolIndex:
+    """从AKShare下载全部A股代码和名称（同步阻塞，需在线程池中调用）"""
+    ak = lazy_imports.load('akshare')
+
+    fetch = ak.stock_info_a_code_name
+    if hasattr(fetch, 'cache_clear'):
+        # AKShare对该接口做了进程内缓存，刷新时需要清除
+        fetch.cache_clear()
+    df = fetch()
+    pairs = zip(df['code'].astype(str).str.zfill(6), df['name'].astype(str).str.replace(' ', ''))
+    return SymbolIndex(build_entries(pairs), time.time())
+
+
+def default_index() -> SymbolIndex:
+    """内置热门股票目录"""
+    return SymbolIndex(build_entries(POPULAR_STOCKS))
+
+
+def popular_stocks(limit: int = 20) -> List[dict]:
+    """搜索关键字为空时返回的热门股票"""
+    return [{'symbol': symbol, 'name': name} for symbol, name in POPULAR_STOCKS[:limit]]
@@ -0,0 +1,132 @@
+"""模拟行情生成
+
+按股票代码设定随机种子，用几何随机游走向量化生成交易日K线：
+同一股票在任意日期区间得到的同一天数据完全一致，OHLC始终满足 low <= open/close <= high。
+波动率、价格区间和成交量按股票所属板块设定。
+
+既作为上游失败时的备选数据，也可通过 DATA_PROVIDER=synthetic 作为完整数据源，
+用于离线运行服务和基准测试。
+"""
+from __future__ import annotations
+
+import zlib
+from datetime import date, datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+import lazy_imports
+
+pd = lazy_imports.module('pandas')
+
+# 模拟序列的起始交易日，所有区间都从这里开始生成再切片，保证数据一致
+SYNTHETIC_START = np.datetime64('2000-01-03', 'D')
+
+# 均值回归窗口（交易日），对数价格相对该窗口均值游走
+MEAN_REVERSION_WINDOW = 500
+
+# 板块参数：(最低基准价, 最高基准价, 日波动率, 基准成交量)
+SECTOR_PROFILES: Dict[str, tuple] = {
+    'bank': (4.0, 15.0, 0.012, 5000000),
+    'tech': (20.0, 80.0, 0.030, 2000000),
+    'consumer': (30.0, 200.0, 0.020, 1000000),
+    'default': (8.0, 30.0, 0.022, 1500000),
+}
+
+SECTOR_SYMBOLS = {
+    'bank': {'000001', '002142', '600000', '600016', '600036', '601166', '601169',
+             '601288', '601328', '601398', '601818', '601988'},
+    'tech': {'000063', '000725', '000938', '002230', '002241', '002415', '002475',
+             '300750', '600570', '600588', '600703', '600745', '601138'},
+    'consumer': {'000333', '000651', '000858', '000895', '600519', '600809', '600887',
+                 '601888'},
+}
+
+
+def sector_of(symbol: str) -> str:
+    """股票所属板块，未列出的创业板/科创板按科技股处理"""
+    for sector, members in SECTOR_SYMBOLS.items():
+        if symbol in members:
+            return sector
+    if symbol.startswith(('300', '301', '688')):
+        return 'tech'
+    return 'default'
+
+
+def symbol_seed(symbol: str) -> int:
+    """由股票代码得到稳定的随机种子"""
+    return zlib.crc32(symbol.encode('utf-8'))
+
+
+def trading_days(start: np.datetime64, end: np.datetime64) -> np.ndarray:
+    """区间内的工作日（不含周末）"""
+    days = np.arange(start, end + np.timedelta64(1, 'D'), dtype='datetime64[D]')
+    return days[np.is_busday(days)]
+
+
+def generate_arrays(symbol: str, n: int, seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """生成n根K线的OHLCV数组；随机数按行抽取，n增大时已有的前缀保持不变"""
+    if n == 0:
+        return {name: np.empty(0) for name in ('open', 'high', 'low', 'close', 'volume')}
+    low_price, high_price, volatility, base_volume = SECTOR_PROFILES[sector_of(symbol)]
+    rng = np.random.default_rng(symbol_seed(symbol) if seed is None else seed)
+
+    base_price = low_price + (high_price - low_price) * rng.random()
+    noise = rng.standard_normal((n, 5))
+
+    # 收盘价：对数随机游走减去其滞后均值，价格围绕基准价长期波动而不会无限发散
+    log_returns = noise[:, 0] * volatility
+    walk = np.cumsum(log_returns)
+    csum = np.concatenate(([0.0], np.cumsum(walk)))
+    ends = np.arange(1, n + 1)
+    starts = np.maximum(ends - MEAN_REVERSION_WINDOW, 0)
+    close = base_price * np.exp(walk - (csum[ends] - csum[starts]) / (ends - starts))
+
+    # 开盘价：前收盘价加跳空
+    prev_close = np.empty(n)
+    prev_close[0] = base_price
+    prev_close[1:] = close[:-1]
+    open_ = prev_close * np.exp(noise[:, 1] * volatility * 0.3)
+
+    # 最高/最低价在开盘收盘的基础上扩展日内波动
+    high = np.maximum(open_, close) * np.exp(np.abs(noise[:, 2]) * volatility * 0.5)
+    low = np.minimum(open_, close) * np.exp(-np.abs(noise[:, 3]) * volatility * 0.5)
+
+    open_, high, low, close = (np.round(a, 2) for a in (open_, high, low, close))
+    # 四舍五入后重新保证OHLC关系
+    high = np.maximum(high, np.maximum(open_, close))
+    low = np.minimum(low, np.minimum(open_, close))
+
+    # 成交量：对数正态噪声，并随当日涨跌幅放大
+    move = np.abs(log_returns) / volatility
+    volume = np.floor(base_volume * np.exp(noise[:, 4] * 0.3) * (1 + 0.5 * move))
+
+    return {'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}
+
+
+def generate_bars(symbol: str, start_date, end_date) -> pd.DataFrame:
+    """生成日期区间内的模拟日线（date/open/high/low/close/volume），区间内没有交易日时为空"""
+    start = np.datetime64(_to_date(start_date), 'D')
+    end = np.datetime64(_to_date(end_date), 'D')
+    days = trading_days(SYNTHETIC_START, end)
+    arrays = generate_arrays(symbol, len(days))
+
+    lo = np.searchsorted(days, start, side='left')
+    data = {'date': pd.to_datetime(days[lo:].astype('datetime64[ns]'))}
+    for name, values in arrays.items():
+        data[name] = values[lo:]
+    return pd.DataFrame(data)
+
+
+def generate_history(symbol: str, start_date: Optional[str] = None) -> pd.DataFrame:
+    """生成到今天为止的模拟日线，start_date为YYYYMMDD，为空时从SYNTHETIC_START开始"""
+    start = datetime.strptime(start_date, "%Y%m%d").date() if start_date else SYNTHETIC_START.astype(date)
+    return generate_bars(symbol, start, date.today())
+
+
+def _to_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
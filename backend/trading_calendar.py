@@ -0,0 +1,143 @@
+"""沪深交易所交易日历
+
+交易日保存为升序的 datetime64[D] 数组，按交易日数量平移日期、判断是否交易日都是二分查找。
+日历来自AKShare的新浪交易日历快照（批量预加载时刷新），没有快照或超出快照范围的日期
+按周一至周五计算（不含节假日）。
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+
+import lazy_imports
+
+TRADING_CALENDAR_PATH = os.getenv(
+    'TRADING_CALENDAR_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'trading_calendar.json')
+)
+
+# 上交所开市日，也是按工作日推算的起点
+CALENDAR_START = date(1990, 12, 19)
+
+# 按工作日向后延伸到今天之后的天数，保证未来窗口也能平移
+FUTURE_EXTENSION_DAYS = 2 * 366
+
+# 检查快照文件是否被其他进程（批量预加载）更新的间隔（秒）
+SNAPSHOT_CHECK_INTERVAL = 300
+
+
+class TradingCalendar:
+    """不可变的交易日历，刷新时整体替换"""
+
+    def __init__(self, days: np.ndarray, updated_at: float = 0):
+        self.days = np.unique(np.asarray(days, dtype='datetime64[D]'))
+        self.updated_at = updated_at
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def _position(self, day) -> int:
+        """第一个不早于day的交易日在日历中的位置"""
+        return int(np.searchsorted(self.days, np.datetime64(day, 'D'), side='left'))
+
+    def is_trading_day(self, day) -> bool:
+        pos = self._position(day)
+        return pos < len(self.days) and self.days[pos] == np.datetime64(day, 'D')
+
+    def offset(self, day, n: int) -> date:
+        """按交易日平移：n>=0 为不早于day的第n+1个交易日，n<0 为早于day的第-n个交易日，超出日历时取端点"""
+        pos = self._position(day) + n
+        return self.days[min(max(pos, 0), len(self.days) - 1)].astype(date)
+
+    def previous_or_same(self, day) -> date:
+        """不晚于day的最后一个交易日"""
+        pos = int(np.searchsorted(self.days, np.datetime64(day, 'D'), side='right')) - 1
+        return self.days[max(pos, 0)].astype(date)
+
+    def count(self, start, end) -> int:
+        """[start, end] 内的交易日数"""
+        end_pos = int(np.searchsorted(self.days, np.datetime64(end, 'D'), side='right'))
+        return max(0, end_pos - self._position(start))
+
+
+def weekdays(start: date, end: date) -> np.ndarray:
+    """[start, end] 内的周一至周五"""
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1, dtype='datetime64[D]')
+    return days[np.is_busday(days)]
+
+
+def build_calendar(trade_days: Optional[np.ndarray] = None, updated_at: float = 0) -> TradingCalendar:
+    """快照中的交易日，之前和之后的日期按工作日补齐"""
+    horizon = date.today() + timedelta(days=FUTURE_EXTENSION_DAYS)
+    if trade_days is None or len(trade_days) == 0:
+        return TradingCalendar(weekdays(CALENDAR_START, horizon), updated_at)
+    trade_days = np.asarray(trade_days, dtype='datetime64[D]')
+    last = trade_days.max().astype(date)
+    parts = [trade_days]
+    if last < horizon:
+        parts.append(weekdays(last + timedelta(days=1), horizon))
+    return TradingCalendar(np.concatenate(parts), updated_at)
+
+
+def load_snapshot(path: str = TRADING_CALENDAR_PATH) -> Optional[TradingCalendar]:
+    """读取本地快照，不存在或损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        return build_calendar(np.array(snapshot['days'], dtype='datetime64[D]'), snapshot.get('updated_at', 0))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_snapshot(trade_days: np.ndarray, updated_at: float, path: str = TRADING_CALENDAR_PATH) -> None:
+    """写入本地快照（只保存交易所公布的交易日，不含按工作日补齐的部分）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'updated_at': updated_at,
+                   'days': np.datetime_as_string(trade_days, unit='D').tolist()}, f)
+    os.replace(tmp_path, path)
+
+
+def fetch_trade_days() -> np.ndarray:
+    """从AKShare下载交易所公布的全部交易日（同步阻塞）"""
+    ak = lazy_imports.load('akshare')
+    df = ak.tool_trade_date_hist_sina()
+    return np.sort(df['trade_date'].astype('datetime64[ns]').to_numpy().astype('datetime64[D]'))
+
+
+def refresh(path: str = TRADING_CALENDAR_PATH) -> TradingCalendar:
+    """下载交易日历并更新快照和当前日历"""
+    global _calendar
+    trade_days = fetch_trade_days()
+    updated_at = time.time()
+    save_snapshot(trade_days, updated_at, path)
+    _calendar = build_calendar(trade_days, updated_at)
+    return _calendar
+
+
+_calendar: Optional[TradingCalendar] = None
+_snapshot_mtime = 0.0
+_checked_at = 0.0
+
+
+def default_calendar() -> TradingCalendar:
+    """当前交易日历，第一次使用时加载快照，之后快照文件更新时重新加载"""
+    global _calendar, _snapshot_mtime, _checked_at
+    now = time.monotonic()
+    if _calendar is not None and now - _checked_at < SNAPSHOT_CHECK_INTERVAL:
+        return _calendar
+    _checked_at = now
+    try:
+        mtime = os.path.getmtime(TRADING_CALENDAR_PATH)
+    except OSError:
+        mtime = 0.0
+    if _calendar is None or mtime != _snapshot_mtime:
+        _snapshot_mtime = mtime
+        _calendar = load_snapshot() or build_calendar()
+    return _calendar
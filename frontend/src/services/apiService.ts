@@ -1,5 +1,5 @@
 import axios from 'axios';
-import type { StockData, StockSearchResult } from '../types/stock';
+import type { StockData, StockDataPoint, StockSearchResult } from '../types/stock';
 
 // API基础URL - 生产环境地址
 const API_BASE_URL = 'https://stockstudy-backend-207775-4-1251378228.sh.run.tcloudbase.com';
@@ -48,6 +48,81 @@ export async function searchStocks(query: string): Promise<StockSearchResult[]>
   }
 }
 
+// 逐K线返回的股票数据（默认格式），指标不足预热长度时缺失
+interface BarRow {
+  date: string;
+  open: number;
+  high: number;
+  low: number;
+  close: number;
+  volume: number;
+  kdj?: { k: number; d: number; j: number };
+  mavol5?: number;
+  mavol10?: number;
+  mavol100?: number;
+}
+
+// 按列返回的股票数据（format=columnar），缺失的指标为null
+interface ColumnarBars {
+  date: string[];
+  open: number[];
+  high: number[];
+  low: number[];
+  close: number[];
+  volume: number[];
+  kdj_k: (number | null)[];
+  kdj_d: (number | null)[];
+  kdj_j: (number | null)[];
+  mavol5: (number | null)[];
+  mavol10: (number | null)[];
+  mavol100: (number | null)[];
+}
+
+// 将逐K线数据转换为前端需要的格式
+function transformRows(rows: BarRow[]): StockDataPoint[] {
+  return rows.map((point) => ({
+    date: new Date(point.date),
+    open: point.open,
+    high: point.high,
+    low: point.low,
+    close: point.close,
+    volume: point.volume,
+    indicators: {
+      k: point.kdj?.k,
+      d: point.kdj?.d,
+      j: point.kdj?.j,
+      vol5: point.mavol5,
+      vol10: point.mavol10,
+      vol100: point.mavol100,
+    }
+  }));
+}
+
+// 将按列数据转换为前端需要的逐K线格式，null转换为undefined
+function transformColumns(columns: ColumnarBars): StockDataPoint[] {
+  return columns.date.map((date, i) => ({
+    date: new Date(date),
+    open: columns.open[i],
+    high: columns.high[i],
+    low: columns.low[i],
+    close: columns.close[i],
+    volume: columns.volume[i],
+    indicators: {
+      k: columns.kdj_k[i] ?? undefined,
+      d: columns.kdj_d[i] ?? undefined,
+      j: columns.kdj_j[i] ?? undefined,
+      vol5: columns.mavol5[i] ?? undefined,
+      vol10: columns.mavol10[i] ?? undefined,
+      vol100: columns.mavol100[i] ?? undefined,
+    }
+  }));
+}
+
+// 按响应的实际格式转换：不支持format参数的后端总是返回逐K线数组
+function transformBars(bars: BarRow[] | ColumnarBars): StockDataPoint[] {
+  return Array.isArray(bars) ? transformRows(bars) : transformColumns(bars);
+}
+
 // 获取股票数据
 export async function getStockData(
   stockCode: string,
@@ -58,32 +133,15 @@ export async function getStockData(
   try {
     const formattedDate = divideDate.toISOString().split('T')[0];
     
+    // 生产环境的后端尚不支持format=columnar，先请求默认的逐K线格式
     const response = await apiClient.get(
       `/api/stock/${stockCode}?dividing_date=${formattedDate}&historical_days=${historicalDays}&future_days=${futureDays}`
     );
 
     const apiData = response.data;
 
-    // 转换API数据格式为前端需要的格式
-    const transformDataPoint = (point: any) => ({
-      date: new Date(point.date),
-      open: point.open,
-      high: point.high,
-      low: point.low,
-      close: point.close,
-      volume: point.volume,
-      indicators: {
-        k: point.kdj?.k || null,
-        d: point.kdj?.d || null,
-        j: point.kdj?.j || null,
-        vol5: point.mavol5 || null,
-        vol10: point.mavol10 || null,
-        vol100: point.mavol100 || null,
-      }
-    });
-
-    const historicalData = apiData.historical_data.map(transformDataPoint);
-    const futureData = apiData.future_data.map(transformDataPoint);
+    const historicalData = transformBars(apiData.historical_data);
+    const futureData = transformBars(apiData.future_data);
     const allData = [...historicalData, ...futureData];
 
     return {
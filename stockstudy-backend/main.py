@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import pandas as pd
@@ -11,6 +12,8 @@ from typing import Optional, List, Dict
 import asyncio
 import time
 
+from memory_cache import MemoryCache
+
 app = FastAPI(title="股票趋势练习API", version="1.0.0")
 
 # CORS配置
@@ -23,8 +26,17 @@ app.add_middleware(
 )
 
 # 内存缓存配置
-cache_store: Dict[str, tuple] = {}
-CACHE_EXPIRE = 3600  # 缓存过期时间（秒）
+import os
+CACHE_EXPIRE = int(os.getenv('CACHE_EXPIRE', '3600'))  # 缓存过期时间（秒）
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))  # 缓存内存预算（字节）
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+CACHE_SWEEP_INTERVAL = int(os.getenv('CACHE_SWEEP_INTERVAL', '60'))  # 后台清理过期条目的间隔（秒）
+cache_store = MemoryCache(max_bytes=CACHE_MAX_BYTES, ttl=CACHE_EXPIRE, max_entries=CACHE_MAX_ENTRIES)
+
+@app.on_event("startup")
+async def start_cache_sweeper():
+    """启动缓存后台清理任务"""
+    asyncio.create_task(cache_store.sweep_forever(CACHE_SWEEP_INTERVAL))
 
 class StockData(BaseModel):
     date: str
@@ -41,20 +53,13 @@ class StockResponse(BaseModel):
     future_data: List[StockData]
     dividing_date: str
 
-async def get_cached_data(key: str) -> Optional[dict]:
-    """从内存缓存获取数据"""
-    if key in cache_store:
-        data, timestamp = cache_store[key]
-        if time.time() - timestamp < CACHE_EXPIRE:
-            return data
-        else:
-            # 缓存过期，删除
-            del cache_store[key]
-    return None
+async def get_cached_data(key: str) -> Optional[bytes]:
+    """从内存缓存获取数据（已编码的响应体）"""
+    return cache_store.get(key)
 
-async def set_cached_data(key: str, data: dict, expire: int = CACHE_EXPIRE):
-    """设置内存缓存数据"""
-    cache_store[key] = (data, time.time())
+async def set_cached_data(key: str, payload: bytes, expire: int = CACHE_EXPIRE):
+    """设置内存缓存数据（已编码的响应体）"""
+    cache_store.set(key, payload, expire)
 
 def calculate_kdj(data: pd.DataFrame) -> pd.DataFrame:
     """计算KDJ指标"""
@@ -135,6 +140,11 @@ async def health_check():
     """健康检查"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """内存缓存统计"""
+    return cache_store.stats()
+
 @app.get("/api/stock/{symbol}")
 async def get_stock_data(
     symbol: str,
@@ -162,7 +172,7 @@ async def get_stock_data(
         cache_key = f"stock_{symbol}_{dividing_date}_{historical_days}_{future_days}"
         cached_data = await get_cached_data(cache_key)
         if cached_data:
-            return cached_data
+            return Response(content=cached_data, media_type="application/json")
         
         # 获取股票数据
         stock_df = await fetch_stock_data_from_akshare(symbol, start_date, end_date)
@@ -192,10 +202,13 @@ async def get_stock_data(
             "future_data": future_data.to_dict('records')
         }
         
+        # 编码一次，按响应体大小计入缓存预算
+        payload = JSONResponse(content=jsonable_encoder(response_data)).body
+        
         # 设置缓存
-        await set_cached_data(cache_key, response_data)
+        await set_cached_data(cache_key, payload)
         
-        return response_data
+        return Response(content=payload, media_type="application/json")
         
     except HTTPException:
         raise
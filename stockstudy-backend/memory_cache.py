@@ -0,0 +1,81 @@
+"""进程内LRU缓存：TTL过期、按字节数限制内存占用、后台清理过期条目"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class MemoryCache:
+    """按最近使用顺序淘汰的字节缓存，值为已编码的响应体"""
+
+    def __init__(self, max_bytes: int, ttl: float, max_entries: int = 10000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        payload, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def set(self, key: str, payload: bytes, ttl: Optional[float] = None) -> None:
+        size = len(payload)
+        if size > self.max_bytes:
+            # 单个值超过总预算时不缓存
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (payload, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._bytes += size
+        while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def sweep(self) -> int:
+        """删除所有已过期的条目，返回删除数量"""
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    async def sweep_forever(self, interval: float) -> None:
+        """后台定期清理过期条目"""
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }